@@ -1,13 +1,19 @@
 from __future__ import annotations
 
+from datetime import datetime
 from typing import Optional
 
 from .db import Base, TimeID
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import String
+from sqlalchemy import DateTime, String
 
 class Repo(TimeID):
     __tablename__ = "repos"
     name: Mapped[str] = mapped_column(String, nullable=False)
     url: Mapped[str] = mapped_column(String, nullable=False)
     default_branch: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    # GitHub metadata cache, refreshed by webhooks and conditional (ETag) requests.
+    full_name: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    installation_id: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    metadata_etag: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    metadata_synced_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
@@ -15,7 +15,7 @@ router = APIRouter()
 @router.post("", response_model=ScanQueuedResponse, status_code=status.HTTP_202_ACCEPTED)
 def create_scan(request: ScanRequest, db: Session = Depends(get_db)) -> ScanQueuedResponse:
     try:
-        job_ids = start_scan(db, request.repo_id, request.kinds)
+        job_ids = start_scan(db, request.repo_id, request.kinds, lane=request.lane)
     except RepoNotFoundError:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Repository not found")
     return ScanQueuedResponse(repo_id=request.repo_id, queued_jobs=job_ids)
@@ -15,6 +15,7 @@ class RepoOut(BaseModel):
     name: str
     url: str
     default_branch: Optional[str] = None
+    full_name: Optional[str] = None
     created_at: datetime
 
     model_config = {"from_attributes": True}
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import Any, Optional
+from typing import Any, Literal, Optional
 
 from pydantic import BaseModel, Field
 
@@ -9,6 +9,8 @@ from pydantic import BaseModel, Field
 class ScanRequest(BaseModel):
     repo_id: str
     kinds: list[str] = Field(default_factory=lambda: ["sast", "sca"], min_length=1)
+    # The webhook lane is reserved for GitHub events; bulk is for scheduled or org-wide rescans.
+    lane: Literal["interactive", "bulk"] = "interactive"
 
 
 class ScanQueuedResponse(BaseModel):
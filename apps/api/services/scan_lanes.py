@@ -0,0 +1,163 @@
+"""Priority lanes for scan jobs with round-robin fairness across tenants.
+
+Every scan is submitted to one lane, and each lane has its own RQ queue:
+
+* ``interactive`` — ``POST /scans`` requests a user is waiting on.
+* ``webhook`` — scans triggered by GitHub push and pull request events.
+* ``bulk`` — scheduled or org-wide rescans.
+
+A submitted job is parked in a per-repo backlog instead of going straight
+onto its lane queue. ``dispatch`` tops the lane queue up to
+``REMEDY_LANE_DISPATCH_DEPTH`` ready jobs, taking the next job round-robin
+across tenants (GitHub App installations) and, within a tenant, across repos.
+One org-wide push therefore adds one job per turn rather than burying every
+other repo behind its backlog. Workers subscribe to lanes with weights (see
+``apps/worker/lanes.py``).
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from typing import TYPE_CHECKING, Any, Optional
+
+if TYPE_CHECKING:
+    from redis import Redis
+    from rq import Queue
+    from rq.job import Job
+
+logger = logging.getLogger(__name__)
+
+LANE_INTERACTIVE = "interactive"
+LANE_WEBHOOK = "webhook"
+LANE_BULK = "bulk"
+LANES = (LANE_INTERACTIVE, LANE_WEBHOOK, LANE_BULK)
+
+# KEYS: tenant ring. ARGV: key prefix, tenant, repo, job id.
+# A repo joins its tenant's ring, and a tenant joins the lane ring, only when it
+# goes from empty to non-empty, so each appears in a ring at most once.
+_PARK_LUA = """
+local repos = ARGV[1] .. 'tenant:' .. ARGV[2]
+local backlog = ARGV[1] .. 'repo:' .. ARGV[3]
+if redis.call('RPUSH', backlog, ARGV[4]) == 1 then
+  if redis.call('RPUSH', repos, ARGV[3]) == 1 then
+    redis.call('RPUSH', KEYS[1], ARGV[2])
+  end
+end
+return 1
+"""
+
+# KEYS: tenant ring. ARGV: key prefix.
+# Pops the next tenant, then its next repo, then that repo's oldest job. The
+# repo and tenant go back to the end of their rings while they still have work.
+_NEXT_LUA = """
+local tenant = redis.call('LPOP', KEYS[1])
+while tenant do
+  local repos = ARGV[1] .. 'tenant:' .. tenant
+  local repo = redis.call('LPOP', repos)
+  while repo do
+    local backlog = ARGV[1] .. 'repo:' .. repo
+    local job = redis.call('LPOP', backlog)
+    if job then
+      if redis.call('LLEN', backlog) > 0 then
+        redis.call('RPUSH', repos, repo)
+      end
+      if redis.call('LLEN', repos) > 0 then
+        redis.call('RPUSH', KEYS[1], tenant)
+      end
+      return job
+    end
+    repo = redis.call('LPOP', repos)
+  end
+  tenant = redis.call('LPOP', KEYS[1])
+end
+return false
+"""
+
+
+def lane_queue_name(lane: str) -> str:
+    return f"{os.getenv('RQ_QUEUE', 'remedy')}-{lane}"
+
+
+def dispatch_depth() -> int:
+    try:
+        return max(int(os.getenv("REMEDY_LANE_DISPATCH_DEPTH", "2")), 1)
+    except ValueError:
+        return 2
+
+
+class LaneScheduler:
+    """Parks jobs in per-repo backlogs and feeds each lane's RQ queue fairly."""
+
+    def __init__(self, connection: "Redis") -> None:
+        self.connection = connection
+        self._queues: dict[str, "Queue"] = {}
+        self._park_script = None
+        self._next_script = None
+
+    def queue(self, lane: str) -> "Queue":
+        if lane not in LANES:
+            raise ValueError(f"Unknown scan lane: {lane}")
+        if lane not in self._queues:
+            from rq import Queue
+
+            self._queues[lane] = Queue(lane_queue_name(lane), connection=self.connection)
+        return self._queues[lane]
+
+    @staticmethod
+    def _keys(lane: str) -> tuple[str, str]:
+        prefix = f"remedy:lanes:{lane}:"
+        return f"{prefix}tenants", prefix
+
+    def _park(self, lane: str, tenant: str, repo: str, job_id: str) -> None:
+        if self._park_script is None:
+            self._park_script = self.connection.register_script(_PARK_LUA)
+        ring, prefix = self._keys(lane)
+        self._park_script(keys=[ring], args=[prefix, tenant, repo, job_id])
+
+    def _next(self, lane: str) -> Optional[str]:
+        if self._next_script is None:
+            self._next_script = self.connection.register_script(_NEXT_LUA)
+        ring, prefix = self._keys(lane)
+        job_id = self._next_script(keys=[ring], args=[prefix])
+        if not job_id:
+            return None
+        return job_id.decode() if isinstance(job_id, bytes) else str(job_id)
+
+    def submit(
+        self,
+        lane: str,
+        func: str,
+        args: tuple = (),
+        kwargs: Optional[dict[str, Any]] = None,
+        *,
+        tenant: str,
+        repo: str,
+    ) -> "Job":
+        """Create a job for ``func`` and queue it behind ``repo``'s earlier jobs in ``lane``."""
+        job = self.queue(lane).create_job(func, args=args, kwargs=kwargs)
+        job.save()
+        self._park(lane, tenant, repo, job.id)
+        self.dispatch(lane)
+        return job
+
+    def dispatch(self, lane: str) -> int:
+        """Move the next fair jobs onto ``lane``'s queue up to the dispatch depth; return how many moved."""
+        from rq.exceptions import NoSuchJobError
+        from rq.job import Job
+
+        queue = self.queue(lane)
+        depth = dispatch_depth()
+        moved = 0
+        while queue.count < depth:
+            job_id = self._next(lane)
+            if job_id is None:
+                break
+            try:
+                job = Job.fetch(job_id, connection=self.connection)
+            except NoSuchJobError:
+                logger.warning("Dropping parked job %s from lane %s: job no longer exists", job_id, lane)
+                continue
+            queue.enqueue_job(job)
+            moved += 1
+        return moved
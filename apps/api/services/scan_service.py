@@ -1,34 +1,70 @@
+"""Scan submission and lookup.
+
+API startup stays lean: jobs are enqueued by dotted path and the Redis-backed
+lane scheduler is created on first use, so no worker code is imported.
+``tests/test_api.py`` fails if that regresses or the import exceeds
+``REMEDY_API_IMPORT_BUDGET_SECONDS``; profile with
+``python -X importtime -c "import apps.api.main"``.
+"""
+
 from __future__ import annotations
 
 import os
 from collections.abc import Sequence
-from typing import Optional
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional
 
-from rq import Queue
-from redis import Redis
 from sqlalchemy.orm import Session
 
-from ...worker.tasks import run_scan
 from ..models.repo import Repo
 from ..models.scan import Scan
+from .scan_lanes import LANE_INTERACTIVE
+
+if TYPE_CHECKING:
+    from .scan_lanes import LaneScheduler
+
+# Enqueued by reference so the API never imports the worker stack (Gemini SDK, JWT, scanners).
+RUN_MULTI_SCAN = "apps.worker.tasks.run_multi_scan"
+
+
+@lru_cache(maxsize=1)
+def get_scheduler() -> "LaneScheduler":
+    """Connect to Redis and the lane queues on first enqueue rather than at import."""
+    from redis import Redis
+
+    from .scan_lanes import LaneScheduler
 
-redis = Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
-q = Queue(os.getenv("RQ_QUEUE", "remedy"), connection=redis)
+    return LaneScheduler(Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0")))
 
 
 class RepoNotFoundError(Exception):
     """Raised when an operation is attempted on a repo that does not exist."""
 
 
-def start_scan(db: Session, repo_id: str, kinds: Sequence[str]) -> list[str]:
+def start_scan(
+    db: Session,
+    repo_id: str,
+    kinds: Sequence[str],
+    baseline_sha: Optional[str] = None,
+    head_sha: Optional[str] = None,
+    head_ref: Optional[str] = None,
+    lane: str = LANE_INTERACTIVE,
+) -> list[str]:
     repo = db.get(Repo, repo_id)
     if not repo:
         raise RepoNotFoundError(repo_id)
-    job_ids: list[str] = []
-    for kind in kinds:
-        job = q.enqueue(run_scan, repo_id, kind)
-        job_ids.append(job.id)
-    return job_ids
+    # Repos of one GitHub App installation share a fairness turn; unlinked repos get their own.
+    tenant = f"installation:{repo.installation_id}" if repo.installation_id else f"repo:{repo.id}"
+    # One job per request: the worker clones once and fans out to every kind.
+    job = get_scheduler().submit(
+        lane,
+        RUN_MULTI_SCAN,
+        args=(repo_id, list(dict.fromkeys(kinds))),
+        kwargs={"baseline_sha": baseline_sha, "head_sha": head_sha, "head_ref": head_ref},
+        tenant=tenant,
+        repo=repo.id,
+    )
+    return [job.id]
 
 
 def list_scans(db: Session, repo_id: Optional[str] = None) -> list[Scan]:
@@ -1,14 +1,83 @@
 from collections.abc import Mapping
-from typing import Any
+from datetime import datetime
+from typing import Any, Optional
 
 from sqlalchemy.orm import Session
 
+from ..models.repo import Repo
 from .repo_service import create_repo
+from .scan_lanes import LANE_WEBHOOK
 from .scan_service import start_scan, RepoNotFoundError
 
 
+_NULL_SHA = "0" * 40
+
+
+def _commit_range(event: str, payload: Mapping[str, Any]) -> tuple[Optional[str], Optional[str]]:
+    """Return the (baseline, head) SHAs an incremental scan should diff between."""
+    if event == "push":
+        before = payload.get("before")
+        after = payload.get("after")
+        if not after or after == _NULL_SHA:
+            return None, None
+        if not before or before == _NULL_SHA:
+            # New branch: no baseline to diff against, scan the head in full.
+            return None, str(after)
+        return str(before), str(after)
+
+    pull_request = payload.get("pull_request")
+    if not isinstance(pull_request, Mapping):
+        return None, None
+    base = pull_request.get("base") if isinstance(pull_request.get("base"), Mapping) else {}
+    head = pull_request.get("head") if isinstance(pull_request.get("head"), Mapping) else {}
+    base_sha = base.get("sha")
+    head_sha = head.get("sha")
+    return (str(base_sha) if base_sha else None), (str(head_sha) if head_sha else None)
+
+
+def _head_branch(event: str, payload: Mapping[str, Any]) -> Optional[str]:
+    """Branch in this repository that holds the head commit; ``None`` for forks and tags."""
+    if event == "push":
+        ref = str(payload.get("ref") or "")
+        return ref[len("refs/heads/"):] if ref.startswith("refs/heads/") else None
+
+    pull_request = payload.get("pull_request")
+    if not isinstance(pull_request, Mapping):
+        return None
+    head = pull_request.get("head") if isinstance(pull_request.get("head"), Mapping) else {}
+    head_repo = head.get("repo") if isinstance(head.get("repo"), Mapping) else {}
+    repo_info = payload.get("repository") if isinstance(payload.get("repository"), Mapping) else {}
+    if not head_repo.get("full_name") or head_repo.get("full_name") != repo_info.get("full_name"):
+        return None
+    ref = head.get("ref")
+    return str(ref) if ref else None
+
+
+def _update_repo_metadata(db: Session, repo: Repo, repo_info: Mapping[str, Any], payload: Mapping[str, Any]) -> None:
+    """Refresh the cached GitHub metadata on ``repo`` from a webhook payload."""
+    installation = payload.get("installation")
+    installation_id = installation.get("id") if isinstance(installation, Mapping) else None
+    updates = {
+        "default_branch": repo_info.get("default_branch"),
+        "full_name": repo_info.get("full_name"),
+        "installation_id": str(installation_id) if installation_id else None,
+    }
+    changed = False
+    for field, value in updates.items():
+        if value and getattr(repo, field) != value:
+            setattr(repo, field, value)
+            changed = True
+    if updates["default_branch"]:
+        # The payload is as fresh as an API response, so skip the next revalidation.
+        repo.metadata_synced_at = datetime.utcnow()
+        changed = True
+    if changed:
+        db.add(repo)
+        db.commit()
+
+
 def handle_github_event(db: Session, event: str, payload: Mapping[str, Any]) -> dict[str, Any]:
-    if event not in {"push", "pull_request"}:
+    if event not in {"push", "pull_request", "repository"}:
         return {"status": "ignored", "reason": "unsupported_event"}
 
     repo_info = payload.get("repository") if isinstance(payload, Mapping) else None
@@ -23,15 +92,33 @@ def handle_github_event(db: Session, event: str, payload: Mapping[str, Any]) ->
     if not repo_url:
         return {"status": "ignored", "reason": "missing_repo_url"}
 
+    if event == "repository":
+        # Renames and default-branch changes only refresh metadata of known repos.
+        known = db.query(Repo).filter(Repo.url == str(repo_url)).one_or_none()
+        if known is None:
+            return {"status": "ignored", "reason": "unknown_repository"}
+        _update_repo_metadata(db, known, repo_info, payload)
+        return {"status": "updated", "repo_id": known.id}
+
     repo = create_repo(db, str(repo_url))
+    _update_repo_metadata(db, repo, repo_info, payload)
 
     if event == "pull_request":
         action = payload.get("action")
         if action not in {"opened", "synchronize", "reopened"}:
             return {"status": "ignored", "reason": f"action:{action}"}
 
+    baseline_sha, head_sha = _commit_range(event, payload)
     try:
-        job_ids = start_scan(db, repo.id, ["sast", "sca"])
+        job_ids = start_scan(
+            db,
+            repo.id,
+            ["sast", "sca"],
+            baseline_sha=baseline_sha,
+            head_sha=head_sha,
+            head_ref=_head_branch(event, payload),
+            lane=LANE_WEBHOOK,
+        )
     except RepoNotFoundError:
         # Repo was just created, so this path is unlikely, but guard anyway.
         job_ids = []
@@ -1,16 +1,104 @@
+"""Gemini prioritisation and patch planning.
+
+Findings are pre-ranked deterministically and compacted; the top
+``REMEDY_LLM_CANDIDATES`` are ranked by Gemini, in concurrent shards of
+``REMEDY_PRIORITIZE_BATCH_TOKENS`` that each keep ``REMEDY_PRIORITIZE_SHORTLIST``
+candidates for a final reduce call. Up to ``REMEDY_MAX_PLANS`` findings are then
+planned: findings sharing a file or rule go through ``plan_batch.j2`` in groups
+of at most ``REMEDY_PLAN_BATCH_SIZE`` (``REMEDY_PLAN_BATCH=0`` plans one at a
+time). Plan calls run ``REMEDY_PLAN_CONCURRENCY`` at a time, and plans that miss
+``REMEDY_PLAN_DEADLINE_SECONDS`` are dropped so the job can continue.
+"""
+
 from __future__ import annotations
 
+import hashlib
 import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional
 
 from jinja2 import Template
 
-from .providers.gemini_client import gemini_complete
+from ..tools.rate_limit import PRIORITY_HIGH
+from .providers.gemini_client import LLMUnavailableError, gemini_complete
+from .ranking import rank_findings
+
+logger = logging.getLogger(__name__)
 
 _PROMPT_DIR = Path(__file__).resolve().parent / "prompts"
-_PRIORITIZE_TEMPLATE = Template((_PROMPT_DIR / "prioritize.j2").read_text(encoding="utf-8"))
-_PLAN_TEMPLATE = Template((_PROMPT_DIR / "plan_patch.j2").read_text(encoding="utf-8"))
+
+
+def _load_template(name: str) -> tuple[Template, str]:
+    source = (_PROMPT_DIR / name).read_text(encoding="utf-8")
+    # The version feeds the LLM response cache key, so editing a prompt invalidates it.
+    version = f"{name}@{hashlib.sha256(source.encode('utf-8')).hexdigest()[:12]}"
+    return Template(source), version
+
+
+_PRIORITIZE_TEMPLATE, _PRIORITIZE_VERSION = _load_template("prioritize.j2")
+_PLAN_TEMPLATE, _PLAN_VERSION = _load_template("plan_patch.j2")
+_PLAN_BATCH_TEMPLATE, _PLAN_BATCH_VERSION = _load_template("plan_batch.j2")
+
+
+# Response schemas for Gemini's JSON mode; they mirror the shapes described in the prompts.
+_PRIORITIZE_SCHEMA: dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "ordered_findings": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "finding_id": {"type": "string"},
+                    "summary": {"type": "string"},
+                    "justification": {"type": "string"},
+                    "fix_strategy": {"type": "string"},
+                },
+                "required": ["finding_id"],
+            },
+        },
+    },
+    "required": ["ordered_findings"],
+}
+_PLAN_SCHEMA: dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "finding_id": {"type": "string"},
+        "summary": {"type": "string"},
+        "fix_kind": {"type": "string"},
+        "edits": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "path": {"type": "string"},
+                    "match": {"type": "string", "nullable": True},
+                    "regex": {"type": "string", "nullable": True},
+                    "replace": {"type": "string"},
+                    "note": {"type": "string", "nullable": True},
+                },
+                "required": ["path", "replace"],
+            },
+        },
+        "test": {
+            "type": "object",
+            "properties": {"cmd": {"type": "string"}, "expect": {"type": "string"}},
+        },
+    },
+    "required": ["finding_id", "edits"],
+}
+_PLAN_BATCH_SCHEMA: dict[str, Any] = {
+    "type": "object",
+    "properties": {"plans": {"type": "array", "items": _PLAN_SCHEMA}},
+    "required": ["plans"],
+}
+
+
+_COMPACT_FIELDS = ("finding_id", "severity", "rule_id", "path", "line", "package", "version", "message")
+_MESSAGE_LIMIT = 240
 
 
 def _try_load_json(raw: str, default: Any) -> Any:
@@ -20,45 +108,276 @@ def _try_load_json(raw: str, default: Any) -> Any:
         return default
 
 
+def _compact_finding(finding: dict[str, Any]) -> dict[str, Any]:
+    """Reduce a finding to the fields the ranking prompt needs."""
+    compact = {key: finding.get(key) for key in _COMPACT_FIELDS if finding.get(key) not in (None, "", [])}
+    message = compact.get("message")
+    if isinstance(message, str) and len(message) > _MESSAGE_LIMIT:
+        compact["message"] = message[: _MESSAGE_LIMIT - 3] + "..."
+    return compact
+
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def _shard(compact: list[dict[str, Any]], budget_tokens: int) -> list[list[dict[str, Any]]]:
+    shards: list[list[dict[str, Any]]] = []
+    current: list[dict[str, Any]] = []
+    used = 0
+    for item in compact:
+        cost = _estimate_tokens(json.dumps(item, separators=(",", ":")))
+        if current and used + cost > budget_tokens:
+            shards.append(current)
+            current, used = [], 0
+        current.append(item)
+        used += cost
+    if current:
+        shards.append(current)
+    return shards
+
+
+def _rank(compact: list[dict[str, Any]], limit: int) -> list[dict[str, Any]]:
+    prompt = _PRIORITIZE_TEMPLATE.render(
+        findings=json.dumps(compact, separators=(",", ":")),
+        limit=limit,
+    )
+    raw = gemini_complete(prompt, template_version=_PRIORITIZE_VERSION, response_schema=_PRIORITIZE_SCHEMA)
+    response = _try_load_json(raw, {})
+    ordered = response.get("ordered_findings") if isinstance(response, dict) else None
+    return [item for item in ordered or [] if isinstance(item, dict)]
+
+
+def _rank_map_reduce(compact: list[dict[str, Any]], limit: int) -> list[dict[str, Any]]:
+    """Rank findings in token-budgeted shards concurrently, then rank the shortlist.
+
+    Each map round keeps ``REMEDY_PRIORITIZE_SHORTLIST`` candidates per shard; rounds
+    repeat until the shortlist fits in one prompt, which gets the final ranking.
+    """
+    budget = max(int(os.getenv("REMEDY_PRIORITIZE_BATCH_TOKENS", "24000")), 1)
+    shortlist_size = max(int(os.getenv("REMEDY_PRIORITIZE_SHORTLIST", "5")), limit)
+    fan_out = max(int(os.getenv("REMEDY_PRIORITIZE_CONCURRENCY", "4")), 1)
+
+    candidates = compact
+    shards = _shard(candidates, budget)
+    while len(shards) > 1:
+        with ThreadPoolExecutor(max_workers=min(fan_out, len(shards)), thread_name_prefix="rank") as pool:
+            ranked_shards = list(pool.map(lambda shard: _rank(shard, shortlist_size), shards))
+
+        by_id = {str(item.get("finding_id")): item for item in candidates}
+        shortlisted: list[dict[str, Any]] = []
+        seen: set[str] = set()
+        for ranked in ranked_shards:
+            for item in ranked[:shortlist_size]:
+                finding_id = str(item.get("finding_id"))
+                if finding_id in by_id and finding_id not in seen:
+                    seen.add(finding_id)
+                    shortlisted.append(by_id[finding_id])
+
+        if not shortlisted:
+            return []
+        if len(shortlisted) >= len(candidates):
+            candidates = shortlisted
+            break  # shards are already at shortlist size; stop rather than loop forever
+        logger.info("Prioritisation map round: %d findings -> %d candidates", len(candidates), len(shortlisted))
+        candidates = shortlisted
+        shards = _shard(candidates, budget)
+
+    return _rank(candidates, limit)
+
+
+def _max_plans() -> int:
+    return max(int(os.getenv("REMEDY_MAX_PLANS", "3")), 1)
+
+
+def _plan_batching_enabled() -> bool:
+    return os.getenv("REMEDY_PLAN_BATCH", "1").lower() not in {"0", "false", "no", "off"}
+
+
 def prioritize_and_plan(findings: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Rank ``findings`` with the LLM and request patch plans for the top picks.
+
+    Up to ``REMEDY_MAX_PLANS`` findings are planned. Raises ``LLMUnavailableError``
+    when LLM quota is exhausted, so the caller can report remediation as deferred
+    instead of "nothing to fix".
+    """
     if not findings:
         return []
 
-    priority_prompt = _PRIORITIZE_TEMPLATE.render(findings=json.dumps(findings, indent=2))
-    priority_response = gemini_complete(priority_prompt)
-    priority = _try_load_json(priority_response, {})
-    ordered = priority.get("ordered_findings") if isinstance(priority, dict) else None
+    max_plans = _max_plans()
+    # Local scoring prunes the noise (low severity, vendored, test code) before the LLM sees it.
+    candidate_limit = max(int(os.getenv("REMEDY_LLM_CANDIDATES", "50")), max_plans)
+    candidates = rank_findings(findings)[:candidate_limit]
+    ordered = _rank_map_reduce([_compact_finding(f) for f in candidates], limit=max_plans)
     if not ordered:
         return []
 
-    plans: list[dict[str, Any]] = []
-    for item in ordered[:3]:
+    selected: list[tuple[dict[str, Any], dict[str, Any]]] = []
+    seen: set[str] = set()
+    for item in ordered:
+        if len(selected) >= max_plans:
+            break
         if not isinstance(item, dict):
             continue
         finding_id = str(item.get("finding_id")) if item.get("finding_id") is not None else None
-        if not finding_id:
+        if not finding_id or finding_id in seen:
             continue
         matched = next((f for f in findings if str(f.get("finding_id")) == finding_id), None)
         if not matched:
             continue
+        seen.add(finding_id)
+        selected.append((item, matched))
+
+    return _plan_concurrently(selected)
+
+
+def _group_related(
+    selected: list[tuple[dict[str, Any], dict[str, Any]]],
+) -> list[list[tuple[dict[str, Any], dict[str, Any]]]]:
+    """Group selected findings that share a file, then those that share a rule.
+
+    Groups keep ranking order and are capped at ``REMEDY_PLAN_BATCH_SIZE`` findings.
+    """
+    if not _plan_batching_enabled():
+        return [[pair] for pair in selected]
+
+    by_path: dict[str, list[tuple[dict[str, Any], dict[str, Any]]]] = {}
+    for index, pair in enumerate(selected):
+        by_path.setdefault(str(pair[1].get("path") or f"#{index}"), []).append(pair)
+
+    groups: list[list[tuple[dict[str, Any], dict[str, Any]]]] = []
+    by_rule: dict[str, list[tuple[dict[str, Any], dict[str, Any]]]] = {}
+    for members in by_path.values():
+        rule_id = members[0][1].get("rule_id")
+        if len(members) == 1 and rule_id:
+            if str(rule_id) not in by_rule:
+                by_rule[str(rule_id)] = []
+                groups.append(by_rule[str(rule_id)])
+            by_rule[str(rule_id)].extend(members)
+        else:
+            groups.append(members)
+
+    batch_size = max(int(os.getenv("REMEDY_PLAN_BATCH_SIZE", "5")), 1)
+    return [group[i : i + batch_size] for group in groups for i in range(0, len(group), batch_size)]
+
+
+def _validate_plan(plan: Any, finding_id: str) -> Optional[dict[str, Any]]:
+    """Return a cleaned plan for ``finding_id``, dropping malformed edits, or ``None``."""
+    if not isinstance(plan, dict):
+        return None
+    if plan.get("finding_id") is not None and str(plan["finding_id"]) != finding_id:
+        return None
+    edits = plan.get("edits")
+    if edits is not None and not isinstance(edits, list):
+        return None
+    cleaned = dict(plan)
+    cleaned["finding_id"] = finding_id
+    cleaned["edits"] = [
+        edit
+        for edit in edits or []
+        if isinstance(edit, dict) and isinstance(edit.get("path"), str) and edit.get("path")
+    ]
+    return cleaned
+
 
-        plan_prompt = _PLAN_TEMPLATE.render(
-            finding=json.dumps(matched, indent=2),
-            fix_strategy=item.get("fix_strategy", ""),
-        )
-        plan_response = gemini_complete(plan_prompt)
-        plan = _try_load_json(plan_response, None)
-        if not isinstance(plan, dict):
+def _bundle(item: dict[str, Any], matched: dict[str, Any], plan: dict[str, Any]) -> dict[str, Any]:
+    plan.setdefault("summary", item.get("summary"))
+    return {
+        "finding": matched,
+        "summary": item.get("summary"),
+        "justification": item.get("justification"),
+        "plan": plan,
+    }
+
+
+def _plan_one(item: dict[str, Any], matched: dict[str, Any]) -> Optional[dict[str, Any]]:
+    plan_prompt = _PLAN_TEMPLATE.render(
+        finding=json.dumps(matched, indent=2),
+        fix_strategy=item.get("fix_strategy", ""),
+    )
+    plan_response = gemini_complete(
+        plan_prompt,
+        template_version=_PLAN_VERSION,
+        response_schema=_PLAN_SCHEMA,
+        # Plans finish scans that already spent their ranking calls, so serve them first.
+        priority=PRIORITY_HIGH,
+    )
+    plan = _validate_plan(_try_load_json(plan_response, None), str(item.get("finding_id")))
+    if plan is None:
+        return None
+    return _bundle(item, matched, plan)
+
+
+def _plan_group(group: list[tuple[dict[str, Any], dict[str, Any]]]) -> list[dict[str, Any]]:
+    """Plan a group of related findings, in one LLM call when there is more than one."""
+    if len(group) == 1:
+        bundle = _plan_one(*group[0])
+        return [bundle] if bundle else []
+
+    payload = [{**matched, "fix_strategy": item.get("fix_strategy", "")} for item, matched in group]
+    response = _try_load_json(
+        gemini_complete(
+            _PLAN_BATCH_TEMPLATE.render(findings=json.dumps(payload, indent=2)),
+            template_version=_PLAN_BATCH_VERSION,
+            response_schema=_PLAN_BATCH_SCHEMA,
+            priority=PRIORITY_HIGH,
+        ),
+        {},
+    )
+    raw_plans = response.get("plans") if isinstance(response, dict) else None
+    by_id = {
+        str(plan.get("finding_id")): plan
+        for plan in raw_plans or []
+        if isinstance(plan, dict) and plan.get("finding_id") is not None
+    }
+
+    bundles: list[dict[str, Any]] = []
+    for item, matched in group:
+        finding_id = str(item.get("finding_id"))
+        plan = _validate_plan(by_id.get(finding_id), finding_id)
+        if plan is None:
+            logger.info("Batched plan response had no valid plan for finding %s", finding_id)
             continue
-        plan.setdefault("finding_id", finding_id)
-        plan.setdefault("summary", item.get("summary"))
-        plans.append(
-            {
-                "finding": matched,
-                "summary": item.get("summary"),
-                "justification": item.get("justification"),
-                "plan": plan,
-            }
-        )
-
-    return plans
+        bundles.append(_bundle(item, matched, plan))
+    return bundles
+
+
+def _plan_concurrently(selected: list[tuple[dict[str, Any], dict[str, Any]]]) -> list[dict[str, Any]]:
+    """Request patch plans in parallel, one call per related group, dropping any that miss the deadline."""
+    if not selected:
+        return []
+
+    fan_out = max(int(os.getenv("REMEDY_PLAN_CONCURRENCY", "3")), 1)
+    deadline = float(os.getenv("REMEDY_PLAN_DEADLINE_SECONDS", "120"))
+    groups = _group_related(selected)
+    rank = {str(item.get("finding_id")): index for index, (item, _matched) in enumerate(selected)}
+
+    pool = ThreadPoolExecutor(max_workers=min(fan_out, len(groups)), thread_name_prefix="plan")
+    try:
+        futures = [pool.submit(_plan_group, group) for group in groups]
+        _done, pending = wait(futures, timeout=deadline)
+        if pending:
+            logger.warning("Dropping %d patch plan(s) that missed the %.0fs deadline", len(pending), deadline)
+
+        plans: list[dict[str, Any]] = []
+        throttled: list[LLMUnavailableError] = []
+        for future in futures:
+            if future in pending:
+                continue
+            try:
+                plans.extend(future.result())
+            except LLMUnavailableError as exc:
+                throttled.append(exc)
+                continue
+            except Exception as exc:  # pragma: no cover - defensive, provider already swallows errors
+                logger.warning("Patch planning failed: %s", exc)
+                continue
+        if throttled:
+            if not plans:
+                raise throttled[0]
+            logger.warning("Dropped %d patch plan group(s) on LLM rate limits: %s", len(throttled), throttled[0])
+        # Groups finish out of ranking order; restore it so the PR leads with the top finding.
+        return sorted(plans, key=lambda bundle: rank.get(str(bundle["plan"]["finding_id"]), len(rank)))
+    finally:
+        # Do not block the job on stragglers; their results are discarded.
+        pool.shutdown(wait=False, cancel_futures=True)
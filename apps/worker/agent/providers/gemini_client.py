@@ -1,23 +1,222 @@
+"""Gemini client shared by every prompt in a worker process.
+
+One ``GeminiProvider`` per settings configures the SDK once and requests JSON
+with a per-prompt schema, retrying transient errors with backoff
+(``GEMINI_MODEL``, ``GEMINI_TIMEOUT``, ``GEMINI_MAX_RETRIES``). Calls pass the
+``gemini`` circuit breaker and the fleet-wide rate limiter
+(``REMEDY_LLM_RPM``/``REMEDY_LLM_TPM``); when either refuses, or the API keeps
+throttling, ``LLMUnavailableError`` is raised. Successful responses are cached
+in Redis by model, prompt and template version (``REMEDY_LLM_CACHE_TTL``,
+``REMEDY_LLM_CACHE_MAX_ENTRIES``).
+"""
+
+import hashlib
+import json
 import logging
 import os
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Optional
 
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+
+from ...tools.circuit_breaker import CircuitOpenError, get_breaker
+from ...tools.kv_cache import RedisLRUCache
+from ...tools.rate_limit import PRIORITY_NORMAL, RateLimitTimeout, TokenBucketLimiter, rate_limit_enabled
 
 
 logger = logging.getLogger(__name__)
 
+_DEFAULT_MODEL = "gemini-2.5-pro"
+_TRANSIENT_ERRORS = (
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.TooManyRequests,
+)
+_THROTTLE_ERRORS = (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)
+
+
+class LLMUnavailableError(RuntimeError):
+    """Raised when the LLM quota is exhausted, so callers can tell throttling from "no result".
+
+    ``reason`` is ``"rate_limited"`` for quota exhaustion and ``"circuit_open"``
+    when the Gemini circuit breaker is failing calls fast.
+    """
+
+    def __init__(self, message: str, reason: str = "rate_limited") -> None:
+        super().__init__(message)
+        self.reason = reason
+
+
+@dataclass(frozen=True)
+class GeminiSettings:
+    api_key: str
+    model: str = _DEFAULT_MODEL
+    timeout: float = 120.0
+    max_retries: int = 2
+
+    @classmethod
+    def from_env(cls) -> Optional["GeminiSettings"]:
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            return None
+        return cls(
+            api_key=api_key,
+            model=os.getenv("GEMINI_MODEL", _DEFAULT_MODEL),
+            timeout=float(os.getenv("GEMINI_TIMEOUT", "120")),
+            max_retries=max(int(os.getenv("GEMINI_MAX_RETRIES", "2")), 0),
+        )
+
+
+class GeminiProvider:
+    """Long-lived Gemini client: configured once per process, reused across calls.
+
+    Every request asks for a JSON response (optionally constrained by a schema)
+    and retries transient API errors with exponential backoff.
+    """
+
+    def __init__(self, settings: GeminiSettings) -> None:
+        self.settings = settings
+        genai.configure(api_key=settings.api_key)
+        self._model = genai.GenerativeModel(settings.model)
+
+    def generate_json(self, prompt: str, response_schema: Optional[dict[str, Any]] = None) -> str:
+        generation_config: dict[str, Any] = {"response_mime_type": "application/json"}
+        if response_schema:
+            generation_config["response_schema"] = response_schema
+
+        delay = 1.0
+        for attempt in range(self.settings.max_retries + 1):
+            try:
+                resp = self._model.generate_content(
+                    prompt,
+                    generation_config=generation_config,
+                    request_options={"timeout": self.settings.timeout},
+                )
+                return resp.text or ""
+            except _TRANSIENT_ERRORS as exc:
+                if attempt >= self.settings.max_retries:
+                    raise
+                logger.info("Gemini transient error (%s); retrying in %.1fs", exc, delay)
+                time.sleep(delay)
+                delay = min(delay * 2, 30.0)
+        return ""  # pragma: no cover - loop always returns or raises
+
+
+@lru_cache(maxsize=4)
+def get_provider(settings: GeminiSettings) -> GeminiProvider:
+    return GeminiProvider(settings)
+
+
+@lru_cache(maxsize=4)
+def _limiter(model: str) -> TokenBucketLimiter:
+    return TokenBucketLimiter(
+        f"gemini:{model}",
+        requests_per_minute=int(os.getenv("REMEDY_LLM_RPM", "60")),
+        tokens_per_minute=int(os.getenv("REMEDY_LLM_TPM", "1000000")),
+    )
 
-def gemini_complete(prompt: str) -> str:
-    key = os.getenv("GEMINI_API_KEY")
-    if not key:
+
+def _estimate_tokens(prompt: str) -> int:
+    # Rough prompt size plus the expected response; only used for quota accounting.
+    return len(prompt) // 4 + int(os.getenv("REMEDY_LLM_OUTPUT_TOKENS", "2048"))
+
+
+def _cache_enabled() -> bool:
+    return os.getenv("REMEDY_LLM_CACHE", "1").lower() not in {"0", "false", "no", "off"}
+
+
+@lru_cache(maxsize=1)
+def _response_cache() -> RedisLRUCache:
+    return RedisLRUCache(
+        "llm-responses",
+        ttl_seconds=int(os.getenv("REMEDY_LLM_CACHE_TTL", str(24 * 3600))),
+        max_entries=int(os.getenv("REMEDY_LLM_CACHE_MAX_ENTRIES", "10000")),
+    )
+
+
+def _cache_key(
+    model: str,
+    prompt: str,
+    template_version: Optional[str],
+    response_schema: Optional[dict[str, Any]] = None,
+) -> str:
+    digest = hashlib.sha256(prompt.encode("utf-8"))
+    if response_schema:
+        digest.update(json.dumps(response_schema, sort_keys=True).encode("utf-8"))
+    return f"{model}:{template_version or 'raw'}:{digest.hexdigest()}"
+
+
+def _is_json(text: str) -> bool:
+    try:
+        json.loads(text)
+    except ValueError:
+        return False
+    return True
+
+
+def gemini_complete(
+    prompt: str,
+    template_version: Optional[str] = None,
+    response_schema: Optional[dict[str, Any]] = None,
+    priority: int = PRIORITY_NORMAL,
+) -> str:
+    """Return Gemini's JSON text for ``prompt``.
+
+    Calls are admitted by the fleet-wide rate limiter; lower ``priority`` values
+    are served first. Quota exhaustion, or an open ``gemini`` circuit breaker,
+    raises ``LLMUnavailableError`` rather than returning an empty result. Other
+    failures fall back to ``"[]"``.
+    """
+    settings = GeminiSettings.from_env()
+    if settings is None:
         # Offline/dev fallback: produce no prioritisation
         return '{"ordered_findings":[]}'
 
+    cache_key = _cache_key(settings.model, prompt, template_version, response_schema) if _cache_enabled() else None
+    if cache_key:
+        cached = _response_cache().get(cache_key)
+        if isinstance(cached, str):
+            return cached
+
+    breaker = get_breaker("gemini", float(os.getenv("GEMINI_SLOW_CALL_SECONDS", "90")))
     try:
-        genai.configure(api_key=key)
-        model = genai.GenerativeModel("gemini-2.5-pro")
-        resp = model.generate_content(prompt)
-        return resp.text or "[]"
+        # Fail fast before queueing for rate-limit capacity the call could not use.
+        breaker.check()
+    except CircuitOpenError as exc:
+        raise LLMUnavailableError(str(exc), reason="circuit_open") from exc
+
+    if rate_limit_enabled():
+        try:
+            waited = _limiter(settings.model).acquire(
+                _estimate_tokens(prompt),
+                priority=priority,
+                timeout=float(os.getenv("REMEDY_LLM_MAX_WAIT_SECONDS", "90")),
+            )
+        except RateLimitTimeout as exc:
+            raise LLMUnavailableError(str(exc)) from exc
+        if waited >= 1:
+            logger.info("Waited %.1fs for Gemini capacity", waited)
+
+    try:
+        with breaker.guard():
+            text = get_provider(settings).generate_json(prompt, response_schema)
+    except CircuitOpenError as exc:
+        # Fail fast during an outage; remediation is reported as deferred like a quota miss.
+        raise LLMUnavailableError(str(exc), reason="circuit_open") from exc
+    except _THROTTLE_ERRORS as exc:
+        raise LLMUnavailableError(f"Gemini quota exhausted: {exc}") from exc
     except Exception as exc:  # pragma: no cover - relies on external API
         logger.warning("Gemini request failed: %s", exc)
         return "[]"
+
+    if not text:
+        return "[]"
+    if cache_key and _is_json(text):
+        # Only complete JSON responses are cached; fallbacks and truncated replies are retried.
+        _response_cache().set(cache_key, text)
+    return text
@@ -0,0 +1,84 @@
+"""Deterministic scoring used to order findings before (or without) the LLM.
+
+The score combines normalised severity, rule confidence and exploitability
+metadata (KEV, EPSS, fix availability, agreement between scanners), and
+penalises findings in vendored, generated, build-output and test paths.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Any
+
+_SEVERITY_SCORES = {
+    "CRITICAL": 100,
+    "HIGH": 75,
+    "ERROR": 75,  # Semgrep's highest level
+    "MEDIUM": 50,
+    "MODERATE": 50,
+    "WARNING": 50,
+    "LOW": 25,
+    "INFO": 10,
+    "NEGLIGIBLE": 5,
+}
+_UNKNOWN_SEVERITY = 30
+
+_CONFIDENCE_SCORES = {"HIGH": 10, "MEDIUM": 5, "LOW": 0}
+
+# (pattern, penalty) — first-party application code outranks these.
+_PATH_PENALTIES = (
+    (re.compile(r"(^|/)(node_modules|vendor|third_party|bower_components|\.yarn)/"), 60),
+    (re.compile(r"(^|/)(dist|build|out|target|coverage)/"), 40),
+    (re.compile(r"(\.min\.js|\.bundle\.js|_pb2\.py|\.pb\.go|\.generated\.\w+)$|(^|/)generated/"), 40),
+    (re.compile(r"(^|/)(tests?|__tests__|spec|specs|fixtures|testdata|examples?)/"), 25),
+    (re.compile(r"(_test\.go|\.test\.[jt]sx?|\.spec\.[jt]sx?|(^|/)test_[^/]+\.py|_test\.py)$"), 25),
+)
+
+
+def severity_score(raw: Any) -> int:
+    text = str(raw or "").strip().upper()
+    if text in _SEVERITY_SCORES:
+        return _SEVERITY_SCORES[text]
+    try:
+        cvss = float(text)
+    except ValueError:
+        return _UNKNOWN_SEVERITY  # e.g. bare CVSS vectors from OSV
+    if cvss >= 9.0:
+        return _SEVERITY_SCORES["CRITICAL"]
+    if cvss >= 7.0:
+        return _SEVERITY_SCORES["HIGH"]
+    if cvss >= 4.0:
+        return _SEVERITY_SCORES["MEDIUM"]
+    return _SEVERITY_SCORES["LOW"]
+
+
+def path_penalty(path: Any) -> int:
+    text = str(path or "")
+    return max((penalty for pattern, penalty in _PATH_PENALTIES if pattern.search(text)), default=0)
+
+
+def score_finding(finding: dict[str, Any]) -> float:
+    score = float(severity_score(finding.get("severity")))
+    score += _CONFIDENCE_SCORES.get(str(finding.get("confidence") or "").upper(), 0)
+    if finding.get("known_exploited"):
+        score += 30
+    try:
+        score += 20 * float(finding.get("epss") or 0)
+    except (TypeError, ValueError):
+        pass
+    if finding.get("fix_available"):
+        score += 5  # straightforward remediation
+    if len(finding.get("sources") or []) > 1:
+        score += 3  # corroborated by more than one scanner
+    return score - path_penalty(finding.get("path"))
+
+
+def rank_findings(findings: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Return findings sorted by descending ``priority_score``, which is set on each copy."""
+    scored = []
+    for finding in findings:
+        item = dict(finding)
+        item["priority_score"] = round(score_finding(item), 2)
+        scored.append(item)
+    # Stable sort keeps scanner order for ties.
+    return sorted(scored, key=lambda item: item["priority_score"], reverse=True)
@@ -0,0 +1,103 @@
+"""Weighted lane subscription for RQ workers.
+
+``REMEDY_WORKER_LANES`` lists the lanes a worker serves with integer weights,
+e.g. ``interactive:6,webhook:3,bulk:1`` (the default). Before every dequeue
+the worker draws a queue order by weighted sampling without replacement: the
+interactive lane is polled first about 60% of the time, and an empty lane
+simply falls through to the next. Under saturation each lane gets roughly its
+weighted share of dequeues, so bulk rescans cannot starve interactive scans
+while lower-weight lanes still make progress. Dedicated workers can subscribe
+to a single lane (``REMEDY_WORKER_LANES=interactive``).
+
+Workers also run the lane dispatcher (``LaneScheduler.dispatch``): they top up
+their lanes before waiting for a job and refill the lane they just took a job
+from, so parked jobs keep moving without a separate scheduler process.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import random
+from typing import Any, Optional
+
+from redis.exceptions import RedisError
+from rq import Worker
+
+from apps.api.services.scan_lanes import LANES, LaneScheduler, lane_queue_name
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SUBSCRIPTION = "interactive:6,webhook:3,bulk:1"
+
+
+def parse_subscription(spec: str) -> dict[str, int]:
+    """Parse ``lane[:weight],...``; a missing weight means 1 and weight 0 drops the lane."""
+    weights: dict[str, int] = {}
+    for entry in spec.split(","):
+        lane, _, weight = entry.strip().partition(":")
+        if not lane:
+            continue
+        if lane not in LANES:
+            raise ValueError(f"Unknown scan lane in REMEDY_WORKER_LANES: {lane}")
+        value = int(weight) if weight else 1
+        if value > 0:
+            weights[lane] = value
+    if not weights:
+        raise ValueError("REMEDY_WORKER_LANES subscribes to no lanes")
+    return weights
+
+
+def lane_subscription() -> dict[str, int]:
+    return parse_subscription(os.getenv("REMEDY_WORKER_LANES", DEFAULT_SUBSCRIPTION))
+
+
+def weighted_order(weights: dict[str, int], rng: Optional[random.Random] = None) -> list[str]:
+    """Order keys by weighted random sampling without replacement (Efraimidis-Spirakis)."""
+    draw = (rng or random).random
+    return sorted(weights, key=lambda key: draw() ** (1.0 / weights[key]), reverse=True)
+
+
+class LaneWorkerMixin:
+    """Polls lane queues in weighted random order and feeds them from the fair backlogs."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        subscription = lane_subscription()
+        self._lane_by_queue = {lane_queue_name(lane): lane for lane in LANES}
+        # Queues outside the lane scheme (e.g. the legacy ``remedy`` queue) get weight 1.
+        self._queue_weights = {
+            queue.name: subscription.get(self._lane_by_queue.get(queue.name, ""), 1) for queue in self.queues
+        }
+        self._subscribed_lanes = [self._lane_by_queue[q.name] for q in self.queues if q.name in self._lane_by_queue]
+        self._scheduler = LaneScheduler(self.connection)
+        self.reorder_queues(reference_queue=None)
+
+    def reorder_queues(self, reference_queue: Any) -> None:
+        by_name = {queue.name: queue for queue in self.queues}
+        self._ordered_queues = [by_name[name] for name in weighted_order(self._queue_weights)]
+
+    def _dispatch(self, lanes: list[str]) -> None:
+        for lane in lanes:
+            try:
+                self._scheduler.dispatch(lane)
+            except (RedisError, OSError) as exc:
+                logger.warning("Could not dispatch lane %s: %s", lane, exc)
+
+    def dequeue_job_and_maintain_ttl(self, timeout: Optional[int], max_idle_time: Optional[int] = None) -> Any:
+        self._dispatch(self._subscribed_lanes)
+        result = super().dequeue_job_and_maintain_ttl(timeout, max_idle_time)
+        if result is not None:
+            lane = self._lane_by_queue.get(result[1].name)
+            if lane:
+                self._dispatch([lane])
+        return result
+
+
+class LaneWorker(LaneWorkerMixin, Worker):
+    """Fork-per-job RQ worker subscribed to scan lanes by weight."""
+
+
+def listen_queues() -> list[str]:
+    """Queue names for this worker: its subscribed lanes plus the legacy queue, drained at weight 1."""
+    return [lane_queue_name(lane) for lane in lane_subscription()] + [os.getenv("RQ_QUEUE", "remedy")]
@@ -1,13 +1,17 @@
 from __future__ import annotations
 
 import logging
+import os
 import shutil
 import subprocess
 import tempfile
 import uuid
+from collections.abc import Callable, Sequence
 from datetime import datetime
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional
+
+from sqlalchemy.orm import Session
 
 from apps.api.models.db import SessionLocal
 from apps.api.models.finding import Finding
@@ -16,17 +20,40 @@ from apps.api.models.repo import Repo
 from apps.api.models.scan import Scan
 
 from .agent.orchestrator import prioritize_and_plan
-from .tools.git_tool import create_branch_and_pr
-from .tools.grype_runner import run_grype
+from .agent.providers.gemini_client import LLMUnavailableError
+from .agent.ranking import rank_findings
+from .tools.dedupe import merge_findings, normalize_path
+from .tools.git_tool import create_branch_and_pr, parse_repo_full_name
+from .tools.github_app import GitHubAuthConfig, fetch_repository, get_installation_token
 from .tools.osv_runner import run_osv
 from .tools.patch_apply import apply_patch_plan
-from .tools.semgrep_runner import run_semgrep
-from .tools.syft_runner import generate_sbom
+from .tools.repo_cache import changed_paths, checkout_commit, materialize_workspace, mirror_cache_enabled
+from .tools.result_cache import (
+    commit_sha,
+    config_fingerprint,
+    result_cache_enabled,
+    result_cache_key,
+    result_ttl,
+    run_cached,
+    scanner_version,
+)
+from .tools.sca_pipeline import run_sbom_pipeline
+from .tools.scanner_pool import run_scanners
+from .tools.semgrep_runner import SemgrepError, run_semgrep, semgrep_slot_share
 
 logger = logging.getLogger(__name__)
 
 
 def _clone_repo(repo_url: str, destination: Path) -> None:
+    if mirror_cache_enabled():
+        try:
+            materialize_workspace(repo_url, destination)
+            return
+        except Exception as exc:
+            logger.warning("Mirror cache unavailable for %s, falling back to shallow clone: %s", repo_url, exc)
+            shutil.rmtree(destination, ignore_errors=True)
+            destination.mkdir(parents=True, exist_ok=True)
+
     result = subprocess.run(
         ["git", "clone", "--depth", "1", repo_url, str(destination)],
         capture_output=True,
@@ -37,16 +64,230 @@ def _clone_repo(repo_url: str, destination: Path) -> None:
         raise RuntimeError(f"git clone failed: {result.stderr.strip()}")
 
 
+def _scanner_jobs(
+    repo_dir: str,
+    kind: str,
+    sast_targets: Optional[list[str]] = None,
+    repo_url: Optional[str] = None,
+) -> dict[str, Callable[[], list[dict[str, Any]]]]:
+    if kind == "sast":
+        if sast_targets is not None:
+            return {"semgrep": lambda: run_semgrep(repo_dir, targets=sast_targets)}
+        return {"semgrep": lambda: run_semgrep(repo_dir)}
+    return {
+        "osv": lambda: run_osv(repo_dir),
+        "syft+grype": lambda: run_sbom_pipeline(repo_dir, repo_url),
+    }
+
+
 def _enrich_findings(raw_findings: list[dict[str, Any]]) -> list[dict[str, Any]]:
     enriched: list[dict[str, Any]] = []
     for finding in raw_findings:
         item = dict(finding)
-        item.setdefault("finding_id", str(uuid.uuid4()))
+        item.setdefault("finding_id", item.get("fingerprint") or str(uuid.uuid4()))
         enriched.append(item)
     return enriched
 
 
-def run_scan(repo_id: str, kind: str) -> dict[str, Any]:
+def _incremental_max_files() -> int:
+    try:
+        return int(os.getenv("REMEDY_INCREMENTAL_MAX_FILES", "200"))
+    except ValueError:
+        return 200
+
+
+def _sast_ruleset() -> dict[str, Optional[str]]:
+    """The Semgrep version and rule fingerprint a SAST scan's findings depend on."""
+    return {"semgrep_version": scanner_version("semgrep"), "rules_fingerprint": config_fingerprint("semgrep")}
+
+
+def _last_sast_snapshot(
+    session: Session,
+    repo_id: str,
+    ruleset: dict[str, Optional[str]],
+) -> Optional[tuple[Scan, str]]:
+    """Return the latest completed SAST scan and the commit it covered.
+
+    Full and incremental scans both store a complete finding set, so the most
+    recent one is the base to chain from. Its carried findings are only valid
+    for the rules that produced them: a scan that predates ``commit_sha`` or ran
+    with a different Semgrep version or ruleset breaks the chain and forces a
+    full scan.
+    """
+    latest = (
+        session.query(Scan)
+        .filter(Scan.repo_id == repo_id, Scan.kind == "sast", Scan.status == "completed")
+        .order_by(Scan.created_at.desc())
+        .first()
+    )
+    payload = latest.findings_json if latest is not None else None
+    if not isinstance(payload, dict) or not payload.get("commit_sha"):
+        return None
+    if any(payload.get(name) != value for name, value in ruleset.items()):
+        return None
+    return latest, str(payload["commit_sha"])
+
+
+def _plan_incremental_sast(
+    session: Session,
+    repo_id: str,
+    repo_dir: Path,
+    baseline_sha: Optional[str],
+    ruleset: dict[str, Optional[str]],
+) -> Optional[dict[str, Any]]:
+    """Decide whether SAST can run on the changed files only.
+
+    Webhook jobs (those with a ``baseline_sha``) may scan incrementally. The
+    diff runs from the commit the last SAST scan covered, not the event's own
+    baseline, so no file changed since that scan keeps stale findings. Returns
+    the incremental context (changed paths, scan targets, base scan and its
+    commit) or ``None`` when a full scan is required.
+    """
+    if not baseline_sha:
+        return None
+    snapshot = _last_sast_snapshot(session, repo_id, ruleset)
+    if snapshot is None:
+        return None
+    base_scan, base_sha = snapshot
+    paths = changed_paths(repo_dir, base_sha)
+    if paths is None or len(paths) > _incremental_max_files():
+        return None
+    targets = [path for path in paths if (repo_dir / path).is_file()]
+    return {"changed_paths": paths, "targets": targets, "base_scan": base_scan, "base_sha": base_sha}
+
+
+def _merge_incremental_findings(
+    base_scan: Scan,
+    changed: list[str],
+    fresh: list[dict[str, Any]],
+) -> list[dict[str, Any]]:
+    changed_set = set(changed)
+    base_items = (base_scan.findings_json or {}).get("items") or []
+    carried = [
+        item
+        for item in base_items
+        if isinstance(item, dict) and item.get("path") not in changed_set
+    ]
+    return carried + fresh
+
+
+def _repo_relative(findings: list[dict[str, Any]], repo_dir: str) -> list[dict[str, Any]]:
+    """Strip the per-job checkout prefix so findings stay valid when served from the cache."""
+    return [
+        {**finding, "path": normalize_path(finding["path"], repo_dir)}
+        if isinstance(finding, dict) and finding.get("path")
+        else finding
+        for finding in findings
+    ]
+
+
+def _with_result_cache(
+    job: Callable[[], list[dict[str, Any]]],
+    repo_dir: str,
+    repo_url: str,
+    sha: Optional[str],
+    scanner: str,
+    extra: str,
+    hits: dict[str, bool],
+) -> Callable[[], list[dict[str, Any]]]:
+    def _scan() -> list[dict[str, Any]]:
+        findings = job()
+        return _repo_relative(findings, repo_dir) if isinstance(findings, list) else findings
+
+    def _run() -> list[dict[str, Any]]:
+        key = result_cache_key(repo_url, sha, scanner, extra) if sha else None
+        findings, hits[scanner] = run_cached(key, _scan, ttl_seconds=result_ttl(scanner))
+        return findings
+
+    return _run
+
+
+def _recording_failures(
+    job: Callable[[], list[dict[str, Any]]],
+    name: str,
+    failures: list[str],
+) -> Callable[[], list[dict[str, Any]]]:
+    def _run() -> list[dict[str, Any]]:
+        try:
+            return job()
+        except SemgrepError as exc:
+            logger.warning("Scanner %s failed: %s", name, exc)
+            failures.append(f"{name}: {exc}")
+            return []
+
+    return _run
+
+
+def _refresh_repo_metadata(session: Session, repo: Repo) -> None:
+    """Keep the ``Repo`` row's GitHub metadata cache fresh.
+
+    Rows refreshed within ``REMEDY_REPO_METADATA_TTL_SECONDS`` (by a webhook or
+    an earlier scan) are used as-is; stale rows are revalidated with the stored
+    ETag, so unchanged metadata costs a 304 rather than rate-limit quota.
+    """
+    ttl = float(os.getenv("REMEDY_REPO_METADATA_TTL_SECONDS", str(6 * 3600)))
+    synced_at = repo.metadata_synced_at
+    if repo.default_branch and synced_at and (datetime.utcnow() - synced_at).total_seconds() < ttl:
+        return
+
+    full_name = repo.full_name or parse_repo_full_name(repo.url)
+    config = GitHubAuthConfig.from_env(repo.installation_id)
+    token = get_installation_token(config) if config and full_name else None
+    if not token:
+        return
+    info = fetch_repository(token, full_name, etag=repo.metadata_etag if repo.default_branch else None)
+    if info is None:
+        return
+    if not info.not_modified:
+        repo.default_branch = info.default_branch or repo.default_branch
+        repo.full_name = info.full_name
+        repo.metadata_etag = info.etag
+    repo.metadata_synced_at = datetime.utcnow()
+    session.add(repo)
+    session.commit()
+
+
+def _collect_scanner_findings(
+    repo_dir: str,
+    repo_url: str,
+    kinds: Sequence[str],
+    sast_targets: Optional[list[str]] = None,
+) -> tuple[dict[str, list[dict[str, Any]]], dict[str, dict[str, bool]], dict[str, list[str]]]:
+    """Run every scanner for ``kinds``; return findings, per-scanner cache hits and failures by kind."""
+    sha = commit_sha(repo_dir) if result_cache_enabled() else None
+    jobs: dict[str, Callable[[], list[dict[str, Any]]]] = {}
+    hits: dict[str, dict[str, bool]] = {kind: {} for kind in kinds}
+    failures: dict[str, list[str]] = {kind: [] for kind in kinds}
+    for kind in kinds:
+        extra = ""
+        if kind == "sast" and sast_targets is not None:
+            extra = "targets:" + "\n".join(sast_targets)
+        for name, job in _scanner_jobs(repo_dir, kind, sast_targets, repo_url).items():
+            cached_job = _with_result_cache(job, repo_dir, repo_url, sha, name, extra, hits[kind])
+            jobs[f"{kind}/{name}"] = _recording_failures(cached_job, name, failures[kind])
+
+    by_kind: dict[str, list[dict[str, Any]]] = {kind: [] for kind in kinds}
+    for job_name, results in run_scanners(jobs, shares={"sast/semgrep": semgrep_slot_share()}).items():
+        if isinstance(results, list):
+            by_kind[job_name.split("/", 1)[0]].extend(results)
+    return by_kind, hits, failures
+
+
+def run_multi_scan(
+    repo_id: str,
+    kinds: Sequence[str],
+    baseline_sha: Optional[str] = None,
+    head_sha: Optional[str] = None,
+    head_ref: Optional[str] = None,
+) -> dict[str, Any]:
+    """Clone once and run every requested scan kind against the shared checkout.
+
+    When ``baseline_sha`` is given, SAST only scans files changed since the last
+    SAST scan's commit and merges the result with that scan's findings. Fix PRs
+    for a ``head_sha`` checkout target its branch (``head_ref``); without one
+    (e.g. a pull request from a fork) remediation is not committed.
+    """
+    kinds = list(dict.fromkeys(kinds))
     tmpdir = Path(tempfile.mkdtemp(prefix="remedy_"))
     with SessionLocal() as session:
         repo = session.get(Repo, repo_id)
@@ -55,58 +296,129 @@ def run_scan(repo_id: str, kind: str) -> dict[str, Any]:
             logger.error("Repository %s not found for scan", repo_id)
             return {"error": "repo_not_found", "repo_id": repo_id}
 
-        scan = Scan(
-            id=str(uuid.uuid4()),
-            repo_id=repo_id,
-            kind=kind,
-            status="running",
-            created_at=datetime.utcnow(),
-        )
-        session.add(scan)
+        scans: dict[str, Scan] = {}
+        for kind in kinds:
+            scans[kind] = Scan(
+                id=str(uuid.uuid4()),
+                repo_id=repo_id,
+                kind=kind,
+                status="running",
+                created_at=datetime.utcnow(),
+            )
+            session.add(scans[kind])
         session.commit()
-        session.refresh(scan)
+        scan_ids = {kind: scan.id for kind, scan in scans.items()}
 
         try:
             _clone_repo(repo.url, tmpdir)
+            on_head = False
+            if head_sha:
+                on_head = checkout_commit(tmpdir, head_sha)
+                if not on_head:
+                    logger.warning("Could not check out %s; scanning default branch in full", head_sha)
+                    baseline_sha = None
+            scanned_sha = commit_sha(str(tmpdir))
+
+            incremental = None
+            ruleset: dict[str, Optional[str]] = {}
+            if "sast" in scans:
+                ruleset = _sast_ruleset()
+                incremental = _plan_incremental_sast(session, repo_id, tmpdir, baseline_sha, ruleset)
 
-            if kind == "sast":
-                raw_findings = run_semgrep(str(tmpdir))
-            else:
-                raw_findings = run_osv(str(tmpdir))
-                sbom_path = generate_sbom(str(tmpdir))
-                if sbom_path:
-                    try:
-                        raw_findings.extend(run_grype(sbom_path))
-                    finally:
-                        sbom_path.unlink(missing_ok=True)
-
-            if not isinstance(raw_findings, list):
-                raw_findings = []
-
-            findings = _enrich_findings(raw_findings)
-            scan.findings_json = {"items": findings}
-            scan.status = "completed"
-            session.add(scan)
+            raw_by_kind, cache_hits, failures = _collect_scanner_findings(
+                str(tmpdir),
+                repo.url,
+                kinds,
+                sast_targets=incremental["targets"] if incremental else None,
+            )
+
+            findings: list[dict[str, Any]] = []
+            finding_scan_ids: dict[str, str] = {}
+            for kind, scan in scans.items():
+                if failures.get(kind):
+                    # A partial result must not become the base later incremental scans chain from.
+                    scan.findings_json = {"commit_sha": scanned_sha, "error": "; ".join(failures[kind])}
+                    scan.status = "failed"
+                    session.add(scan)
+                    continue
+                kind_findings = _enrich_findings(merge_findings(raw_by_kind.get(kind, []), str(tmpdir)))
+                findings_json: dict[str, Any] = {"mode": "full", "commit_sha": scanned_sha}
+                if kind == "sast" and incremental:
+                    kind_findings = _merge_incremental_findings(
+                        incremental["base_scan"], incremental["changed_paths"], kind_findings
+                    )
+                    findings_json = {
+                        "mode": "incremental",
+                        "commit_sha": scanned_sha,
+                        "baseline_sha": incremental["base_sha"],
+                        "head_sha": head_sha,
+                        "base_scan_id": incremental["base_scan"].id,
+                        "changed_paths": incremental["changed_paths"],
+                    }
+                if kind == "sast":
+                    findings_json.update(ruleset)
+                # Stored in priority order so the API has a usable ranking even without Gemini.
+                kind_findings = rank_findings(kind_findings)
+                findings_json["items"] = kind_findings
+                kind_hits = cache_hits.get(kind, {})
+                findings_json["cached"] = bool(kind_hits) and all(kind_hits.values())
+                if any(kind_hits.values()):
+                    findings_json["cached_scanners"] = sorted(name for name, hit in kind_hits.items() if hit)
+                for finding in kind_findings:
+                    finding_scan_ids[str(finding["finding_id"])] = scan.id
+                findings.extend(kind_findings)
+                scan.findings_json = findings_json
+                scan.status = "completed"
+                session.add(scan)
             session.commit()
 
-            plans = prioritize_and_plan(findings)
+            remediation = "planned"
+            try:
+                plans = prioritize_and_plan(findings)
+            except LLMUnavailableError as exc:
+                # Keep the scan results; only the remediation step is deferred.
+                logger.warning("Remediation deferred for scans %s: %s", ", ".join(scan_ids.values()), exc)
+                remediation = exc.reason
+                plans = []
+                for kind in kinds:
+                    scan = session.get(Scan, scan_ids[kind])
+                    if scan is not None:
+                        scan.findings_json = {
+                            **(scan.findings_json or {}),
+                            "remediation": {"status": remediation, "error": str(exc)},
+                        }
+                        session.add(scan)
+                session.commit()
             plan_payloads = [p.get("plan") for p in plans if isinstance(p, dict) and p.get("plan")]
             plan_payloads = [p for p in plan_payloads if isinstance(p, dict)]
 
             apply_result = None
             git_metadata = None
+            if plan_payloads and on_head and not head_ref:
+                # The fix would sit on unmerged commits that no PR base here contains.
+                logger.info("Not committing fixes for %s: head %s has no branch in this repo", repo_id, head_sha)
+                plan_payloads = []
             if plan_payloads:
                 apply_result = apply_patch_plan(str(tmpdir), plan_payloads)
                 if apply_result.get("touched"):
-                    git_metadata = create_branch_and_pr(str(tmpdir), repo.url, plan_payloads)
+                    _refresh_repo_metadata(session, repo)
+                    git_metadata = create_branch_and_pr(
+                        str(tmpdir),
+                        repo.url,
+                        plan_payloads,
+                        default_branch=repo.default_branch,
+                        installation_id=repo.installation_id,
+                        base_branch=head_ref if on_head else None,
+                    )
 
+            default_scan_id = scan_ids[kinds[0]]
             for bundle in plans:
                 finding_data = bundle.get("finding", {}) if isinstance(bundle, dict) else {}
                 plan_data = bundle.get("plan") if isinstance(bundle, dict) else None
                 session.add(
                     Finding(
                         id=str(uuid.uuid4()),
-                        scan_id=scan.id,
+                        scan_id=finding_scan_ids.get(str(finding_data.get("finding_id")), default_scan_id),
                         severity=str(finding_data.get("severity", "UNKNOWN")),
                         path=str(finding_data.get("path", "")),
                         line=finding_data.get("line"),
@@ -136,20 +448,52 @@ def run_scan(repo_id: str, kind: str) -> dict[str, Any]:
             session.commit()
 
             return {
-                "scan_id": scan.id,
                 "repo_id": repo_id,
-                "kind": kind,
+                "scans": [
+                    {
+                        "scan_id": scan_ids[kind],
+                        "kind": kind,
+                        "finding_count": sum(1 for sid in finding_scan_ids.values() if sid == scan_ids[kind]),
+                    }
+                    for kind in kinds
+                ],
                 "finding_count": len(findings),
                 "applied_files": (apply_result or {}).get("touched", []),
                 "branch": (git_metadata or {}).get("branch"),
+                "remediation": remediation,
             }
         except Exception as exc:  # pragma: no cover - worker level safety
             session.rollback()
-            scan.status = "failed"
-            scan.findings_json = {"error": str(exc)}
-            session.add(scan)
+            for kind in kinds:
+                scan = session.get(Scan, scan_ids[kind])
+                if scan is None:
+                    continue
+                scan.status = "failed"
+                scan.findings_json = {"error": str(exc)}
+                session.add(scan)
             session.commit()
-            logger.exception("Scan %s failed", scan.id)
+            logger.exception("Scans %s failed", ", ".join(scan_ids.values()))
             raise
         finally:
             shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def run_scan(
+    repo_id: str,
+    kind: str,
+    baseline_sha: Optional[str] = None,
+    head_sha: Optional[str] = None,
+    head_ref: Optional[str] = None,
+) -> dict[str, Any]:
+    result = run_multi_scan(repo_id, [kind], baseline_sha=baseline_sha, head_sha=head_sha, head_ref=head_ref)
+    if "error" in result:
+        return result
+    scan_summary = result["scans"][0]
+    return {
+        "scan_id": scan_summary["scan_id"],
+        "repo_id": repo_id,
+        "kind": kind,
+        "finding_count": result["finding_count"],
+        "applied_files": result["applied_files"],
+        "branch": result["branch"],
+    }
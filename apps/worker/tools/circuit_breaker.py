@@ -0,0 +1,169 @@
+"""Redis-backed circuit breakers for external services (Gemini, GitHub).
+
+State is shared by every worker so one outage trips the breaker fleet-wide:
+
+* ``closed`` — calls go through; consecutive failures (errors or calls slower
+  than ``slow_call_seconds``) are counted.
+* ``open`` — after ``failure_threshold`` failures, calls fail fast with
+  ``CircuitOpenError`` for ``reset_seconds``.
+* ``half-open`` — once the open period lapses, a single caller is let through
+  as a probe; success closes the breaker, failure re-opens it.
+
+Redis failures fail open (calls proceed), matching the other worker caches.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Optional
+
+from redis import Redis
+from redis.exceptions import RedisError
+
+from .redis_conn import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a service whose breaker is open."""
+
+
+def breakers_enabled() -> bool:
+    return os.getenv("REMEDY_BREAKER_ENABLED", "1").lower() not in {"0", "false", "no", "off"}
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_seconds: float = 30.0,
+        slow_call_seconds: float = 30.0,
+        connection: Optional[Redis] = None,
+    ) -> None:
+        self.name = name
+        prefix = f"remedy:breaker:{name}"
+        self._failures_key = f"{prefix}:failures"
+        self._open_key = f"{prefix}:open"
+        self._tripped_key = f"{prefix}:tripped"
+        self._probe_key = f"{prefix}:probe"
+        self.failure_threshold = max(int(failure_threshold), 1)
+        self.reset_ms = max(int(reset_seconds * 1000), 1)
+        self.slow_call_seconds = slow_call_seconds
+        self._connection = connection
+        # Local copy of the open deadline so fail-fast paths skip the Redis round trip.
+        self._open_until = 0.0
+
+    @property
+    def redis(self) -> Redis:
+        return self._connection if self._connection is not None else get_redis()
+
+    def _admit(self) -> bool:
+        """Return whether this call is the half-open probe; raise if the breaker is open."""
+        if time.monotonic() < self._open_until:
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        try:
+            is_open, tripped = self.redis.mget(self._open_key, self._tripped_key)
+            if is_open:
+                self._open_until = time.monotonic() + min(self.reset_ms / 1000, 1.0)
+                raise CircuitOpenError(f"{self.name} circuit is open")
+            if not tripped:
+                return False
+            # Half-open: the probe lock outlives a slow call so only one caller probes.
+            probe_ms = int(max(self.slow_call_seconds * 2000, self.reset_ms))
+            if self.redis.set(self._probe_key, "1", nx=True, px=probe_ms):
+                logger.info("Probing %s after circuit was open", self.name)
+                return True
+        except (RedisError, OSError) as exc:
+            logger.debug("Circuit breaker %s unavailable: %s", self.name, exc)
+            return False
+        raise CircuitOpenError(f"{self.name} circuit is half-open; probe in flight")
+
+    def check(self) -> None:
+        """Raise ``CircuitOpenError`` while the breaker is open, without claiming the probe.
+
+        Lets callers fail fast before queueing for other resources, such as
+        rate-limit capacity, that the guarded call would need.
+        """
+        if not breakers_enabled():
+            return
+        if time.monotonic() < self._open_until:
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        try:
+            is_open = self.redis.get(self._open_key)
+        except (RedisError, OSError) as exc:
+            logger.debug("Circuit breaker %s unavailable: %s", self.name, exc)
+            return
+        if is_open:
+            self._open_until = time.monotonic() + min(self.reset_ms / 1000, 1.0)
+            raise CircuitOpenError(f"{self.name} circuit is open")
+
+    def _trip(self) -> None:
+        self.redis.set(self._open_key, "1", px=self.reset_ms)
+        self.redis.set(self._tripped_key, "1", ex=24 * 3600)
+        self.redis.delete(self._failures_key, self._probe_key)
+        self._open_until = time.monotonic() + self.reset_ms / 1000
+        logger.warning("%s circuit opened for %.0fs", self.name, self.reset_ms / 1000)
+
+    def record_failure(self, probing: bool = False) -> None:
+        try:
+            if probing:
+                self._trip()
+                return
+            failures = self.redis.incr(self._failures_key)
+            self.redis.expire(self._failures_key, 10 * 60)
+            if failures >= self.failure_threshold:
+                self._trip()
+        except (RedisError, OSError) as exc:
+            logger.debug("Circuit breaker %s unavailable: %s", self.name, exc)
+
+    def record_success(self, probing: bool = False) -> None:
+        try:
+            if probing:
+                self.redis.delete(self._tripped_key, self._probe_key, self._failures_key)
+                logger.info("%s circuit closed", self.name)
+            else:
+                self.redis.delete(self._failures_key)
+        except (RedisError, OSError) as exc:
+            logger.debug("Circuit breaker %s unavailable: %s", self.name, exc)
+
+    @contextmanager
+    def guard(self) -> Iterator[None]:
+        """Run the enclosed call under the breaker.
+
+        Exceptions raised inside the block count as failures and propagate; calls
+        slower than ``slow_call_seconds`` count as failures even if they succeed.
+        """
+        if not breakers_enabled():
+            yield
+            return
+        probing = self._admit()
+        started = time.monotonic()
+        try:
+            yield
+        except Exception:
+            self.record_failure(probing)
+            raise
+        elapsed = time.monotonic() - started
+        if elapsed > self.slow_call_seconds:
+            logger.warning("%s call took %.1fs (slow-call threshold %.0fs)", self.name, elapsed, self.slow_call_seconds)
+            self.record_failure(probing)
+        else:
+            self.record_success(probing)
+
+
+@lru_cache(maxsize=None)
+def get_breaker(name: str, slow_call_seconds: float) -> CircuitBreaker:
+    """Process-wide breaker for ``name``; thresholds come from ``REMEDY_BREAKER_*``."""
+    return CircuitBreaker(
+        name,
+        failure_threshold=int(os.getenv("REMEDY_BREAKER_FAILURES", "5")),
+        reset_seconds=float(os.getenv("REMEDY_BREAKER_RESET_SECONDS", "30")),
+        slow_call_seconds=slow_call_seconds,
+    )
@@ -0,0 +1,113 @@
+"""Normalise scanner findings and merge duplicates reported by more than one scanner."""
+
+from __future__ import annotations
+
+import hashlib
+from typing import Any, Optional
+
+_SEVERITY_RANK = {"CRITICAL": 4, "HIGH": 3, "MEDIUM": 2, "MODERATE": 2, "LOW": 1, "NEGLIGIBLE": 0, "INFO": 0}
+
+
+def normalize_path(path: Any, repo_dir: Optional[str] = None) -> str:
+    """Make a finding path repo-relative: OSV reports absolute lockfile paths, Grype ``/``-rooted ones."""
+    text = str(path or "")
+    if repo_dir:
+        root = repo_dir.rstrip("/") + "/"
+        if text.startswith(root):
+            text = text[len(root):]
+    return text.lstrip("/")
+
+
+def _advisory_ids(finding: dict[str, Any]) -> set[str]:
+    ids = {str(alias).upper() for alias in finding.get("aliases") or [] if alias}
+    if finding.get("rule_id"):
+        ids.add(str(finding["rule_id"]).upper())
+    return ids
+
+
+def _group_key(finding: dict[str, Any]) -> tuple[str, ...]:
+    package = finding.get("package")
+    if package:
+        return (
+            "dependency",
+            str(package).lower(),
+            str(finding.get("version") or ""),
+            str(finding.get("path") or ""),
+        )
+    return (
+        "code",
+        str(finding.get("rule_id") or ""),
+        str(finding.get("path") or ""),
+        str(finding.get("line") or ""),
+    )
+
+
+def _severity_rank(finding: dict[str, Any]) -> int:
+    return _SEVERITY_RANK.get(str(finding.get("severity", "")).upper(), -1)
+
+
+def fingerprint(group_key: tuple[str, ...], advisory_ids: set[str]) -> str:
+    material = "\0".join(group_key) + "\0" + (min(advisory_ids) if advisory_ids else "")
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()[:32]
+
+
+def _merge_group(members: list[dict[str, Any]]) -> dict[str, Any]:
+    # Prefer the member with a named severity (Grype/GHSA) over raw CVSS vectors.
+    primary = max(members, key=_severity_rank)
+    merged = dict(primary)
+    advisory_ids: set[str] = set()
+    for member in members:
+        advisory_ids |= _advisory_ids(member)
+    merged["aliases"] = sorted(advisory_ids - {str(primary.get("rule_id") or "").upper()})
+    if not merged.get("message"):
+        merged["message"] = next((m.get("message") for m in members if m.get("message")), "")
+    merged["sources"] = [
+        {
+            "scanner": member.get("scanner"),
+            "rule_id": member.get("rule_id"),
+            "severity": member.get("severity"),
+        }
+        for member in members
+    ]
+    merged["fingerprint"] = fingerprint(_group_key(primary), advisory_ids)
+    return merged
+
+
+def merge_findings(findings: list[dict[str, Any]], repo_dir: Optional[str] = None) -> list[dict[str, Any]]:
+    """Collapse findings that describe the same issue, keeping provenance in ``sources``.
+
+    Dependency findings merge when package, version and manifest path match and
+    their advisory IDs (including aliases, e.g. GHSA ↔ CVE) overlap. Code findings
+    merge when rule, path and line match.
+    """
+    normalized: list[dict[str, Any]] = []
+    for finding in findings:
+        if not isinstance(finding, dict):
+            continue
+        item = dict(finding)
+        item["path"] = normalize_path(item.get("path"), repo_dir)
+        normalized.append(item)
+
+    # Union-find over findings sharing a group key and at least one advisory ID.
+    parent = list(range(len(normalized)))
+
+    def find(index: int) -> int:
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    owners: dict[tuple[tuple[str, ...], str], int] = {}
+    for index, item in enumerate(normalized):
+        key = _group_key(item)
+        ids = _advisory_ids(item) if key[0] == "dependency" else {""}
+        for advisory in ids or {""}:
+            owner = owners.setdefault((key, advisory), index)
+            if owner != index:
+                parent[find(index)] = find(owner)
+
+    groups: dict[int, list[dict[str, Any]]] = {}
+    for index, item in enumerate(normalized):
+        groups.setdefault(find(index), []).append(item)
+
+    return [_merge_group(members) for _root, members in sorted(groups.items())]
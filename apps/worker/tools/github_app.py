@@ -1,16 +1,94 @@
+"""GitHub App REST client.
+
+Calls share one keep-alive ``requests.Session`` with urllib3 retries
+(``GITHUB_HTTP_RETRIES``, ``GITHUB_HTTP_POOL_SIZE``); 429/5xx responses are only
+retried for idempotent methods. Calls run behind the ``github`` circuit
+breaker. Installation tokens are cached per installation and refreshed
+``GITHUB_TOKEN_REFRESH_MARGIN_SECONDS`` before they expire.
+"""
+
 from __future__ import annotations
 
 import base64
 import json
+import logging
 import os
+import threading
 import time
 from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
 from typing import Optional
 
 import jwt
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .circuit_breaker import CircuitOpenError, get_breaker
+
+logger = logging.getLogger(__name__)
 
 GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
+_TIMEOUT = float(os.getenv("GITHUB_HTTP_TIMEOUT", "30"))
+
+
+# Installation tokens live for an hour; refresh this long before they expire.
+_TOKEN_REFRESH_MARGIN = float(os.getenv("GITHUB_TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+_TOKEN_CACHE: dict[tuple[str, str], tuple[str, float]] = {}
+_TOKEN_LOCK = threading.Lock()
+
+
+class _GitHubServerError(RuntimeError):
+    pass
+
+
+@lru_cache(maxsize=1)
+def _session() -> requests.Session:
+    """Process-wide keep-alive session for the GitHub API.
+
+    Connection errors are retried for every method; 429/5xx responses only for
+    idempotent ones, so a retried POST cannot open a duplicate pull request.
+    """
+    retry = Retry(
+        total=int(os.getenv("GITHUB_HTTP_RETRIES", "2")),
+        backoff_factor=0.5,
+        status_forcelist=(429, 502, 503, 504),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=int(os.getenv("GITHUB_HTTP_POOL_SIZE", "10")),
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept": "application/vnd.github+json", "X-GitHub-Api-Version": "2022-11-28"})
+    return session
+
+
+def _send(method: str, url: str, **kwargs) -> Optional[requests.Response]:
+    """Issue a GitHub API request under the shared ``github`` circuit breaker.
+
+    Transport errors and 5xx responses count against the breaker; 4xx responses
+    are returned to the caller. Returns ``None`` when the request failed or the
+    breaker is open.
+    """
+    breaker = get_breaker("github", float(os.getenv("GITHUB_SLOW_CALL_SECONDS", "10")))
+    try:
+        with breaker.guard():
+            response = _session().request(method, url, timeout=_TIMEOUT, **kwargs)
+            if response.status_code >= 500:
+                raise _GitHubServerError(f"{response.status_code} from {url}")
+    except CircuitOpenError as exc:
+        logger.warning("Skipping GitHub call: %s", exc)
+        return None
+    except (requests.RequestException, _GitHubServerError) as exc:
+        logger.warning("GitHub request failed: %s", exc)
+        return None
+    return response
 
 
 @dataclass
@@ -20,9 +98,10 @@ class GitHubAuthConfig:
     private_key_b64: str
 
     @classmethod
-    def from_env(cls) -> Optional["GitHubAuthConfig"]:
+    def from_env(cls, installation_id: Optional[str] = None) -> Optional["GitHubAuthConfig"]:
+        """Read App credentials from the environment; ``installation_id`` overrides the default one."""
         app_id = os.getenv("GITHUB_APP_ID")
-        installation_id = os.getenv("GITHUB_INSTALLATION_ID")
+        installation_id = installation_id or os.getenv("GITHUB_INSTALLATION_ID")
         private_key = os.getenv("GITHUB_PRIVATE_KEY")
         if not app_id or not installation_id or not private_key:
             return None
@@ -43,24 +122,38 @@ def _build_jwt(config: GitHubAuthConfig) -> str:
     return token
 
 
-def get_installation_token(config: GitHubAuthConfig) -> Optional[str]:
+def _parse_expiry(value: Optional[str]) -> float:
     try:
-        jwt_token = _build_jwt(config)
-    except Exception:
-        return None
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return time.time() + 3600  # GitHub's documented token lifetime
 
-    url = f"{GITHUB_API_URL}/app/installations/{config.installation_id}/access_tokens"
-    headers = {
-        "Authorization": f"Bearer {jwt_token}",
-        "Accept": "application/vnd.github+json",
-    }
 
-    response = requests.post(url, headers=headers, timeout=30)
-    if response.status_code != 201:
-        return None
+def get_installation_token(config: GitHubAuthConfig) -> Optional[str]:
+    """Return an installation token, reusing the cached one until shortly before it expires."""
+    key = (config.app_id, config.installation_id)
+    with _TOKEN_LOCK:
+        cached = _TOKEN_CACHE.get(key)
+        if cached and cached[1] - _TOKEN_REFRESH_MARGIN > time.time():
+            return cached[0]
 
-    data = response.json()
-    return data.get("token")
+        try:
+            jwt_token = _build_jwt(config)
+        except Exception:
+            return None
+
+        url = f"{GITHUB_API_URL}/app/installations/{config.installation_id}/access_tokens"
+        headers = {"Authorization": f"Bearer {jwt_token}"}
+
+        response = _send("POST", url, headers=headers)
+        if response is None or response.status_code != 201:
+            return None
+
+        data = response.json()
+        token = data.get("token")
+        if token:
+            _TOKEN_CACHE[key] = (token, _parse_expiry(data.get("expires_at")))
+        return token
 
 
 def open_pull_request(
@@ -72,27 +165,95 @@ def open_pull_request(
     body: str,
 ) -> Optional[str]:
     url = f"{GITHUB_API_URL}/repos/{repo_full_name}/pulls"
-    headers = {
-        "Authorization": f"token {token}",
-        "Accept": "application/vnd.github+json",
-    }
+    headers = {"Authorization": f"token {token}"}
     payload = {"title": title, "head": head, "base": base, "body": body}
 
-    response = requests.post(url, headers=headers, json=payload, timeout=30)
-    if response.status_code not in {200, 201}:
+    response = _send("POST", url, headers=headers, json=payload)
+    if response is None or response.status_code not in {200, 201}:
         return None
     data = response.json()
     return data.get("html_url")
 
 
-def fetch_default_branch(token: str, repo_full_name: str) -> Optional[str]:
+@dataclass
+class RepositoryInfo:
+    default_branch: Optional[str]
+    full_name: Optional[str]
+    etag: Optional[str]
+    not_modified: bool = False
+
+
+def fetch_repository(token: str, repo_full_name: str, etag: Optional[str] = None) -> Optional[RepositoryInfo]:
+    """Fetch repository metadata, conditionally when ``etag`` is given.
+
+    A ``304 Not Modified`` answer (which GitHub does not count against the rate
+    limit) comes back as ``RepositoryInfo(not_modified=True)``.
+    """
     url = f"{GITHUB_API_URL}/repos/{repo_full_name}"
-    headers = {
-        "Authorization": f"token {token}",
-        "Accept": "application/vnd.github+json",
-    }
-    response = requests.get(url, headers=headers, timeout=30)
+    headers = {"Authorization": f"token {token}"}
+    if etag:
+        headers["If-None-Match"] = etag
+    response = _send("GET", url, headers=headers)
+    if response is None:
+        return None
+    if response.status_code == 304:
+        return RepositoryInfo(default_branch=None, full_name=repo_full_name, etag=etag, not_modified=True)
     if response.status_code != 200:
         return None
     data = response.json()
-    return data.get("default_branch")
+    return RepositoryInfo(
+        default_branch=data.get("default_branch"),
+        full_name=data.get("full_name") or repo_full_name,
+        etag=response.headers.get("ETag"),
+    )
+
+
+def fetch_default_branch(token: str, repo_full_name: str) -> Optional[str]:
+    info = fetch_repository(token, repo_full_name)
+    return info.default_branch if info else None
+
+
+def create_tree(token: str, repo_full_name: str, base_tree: str, entries: list[dict]) -> Optional[str]:
+    """Create a tree on top of ``base_tree``; entries with ``content`` create their blobs inline."""
+    url = f"{GITHUB_API_URL}/repos/{repo_full_name}/git/trees"
+    headers = {"Authorization": f"token {token}"}
+    response = _send("POST", url, headers=headers, json={"base_tree": base_tree, "tree": entries})
+    if response is None or response.status_code != 201:
+        return None
+    return response.json().get("sha")
+
+
+def create_blob(token: str, repo_full_name: str, content: bytes) -> Optional[str]:
+    url = f"{GITHUB_API_URL}/repos/{repo_full_name}/git/blobs"
+    headers = {"Authorization": f"token {token}"}
+    payload = {"content": base64.b64encode(content).decode("ascii"), "encoding": "base64"}
+    response = _send("POST", url, headers=headers, json=payload)
+    if response is None or response.status_code != 201:
+        return None
+    return response.json().get("sha")
+
+
+def create_commit(
+    token: str,
+    repo_full_name: str,
+    message: str,
+    tree: str,
+    parents: list[str],
+    author: Optional[dict[str, str]] = None,
+) -> Optional[str]:
+    url = f"{GITHUB_API_URL}/repos/{repo_full_name}/git/commits"
+    headers = {"Authorization": f"token {token}"}
+    payload: dict = {"message": message, "tree": tree, "parents": parents}
+    if author:
+        payload["author"] = author
+    response = _send("POST", url, headers=headers, json=payload)
+    if response is None or response.status_code != 201:
+        return None
+    return response.json().get("sha")
+
+
+def create_ref(token: str, repo_full_name: str, branch: str, sha: str) -> bool:
+    url = f"{GITHUB_API_URL}/repos/{repo_full_name}/git/refs"
+    headers = {"Authorization": f"token {token}"}
+    response = _send("POST", url, headers=headers, json={"ref": f"refs/heads/{branch}", "sha": sha})
+    return response is not None and response.status_code == 201
@@ -1,66 +1,93 @@
 from __future__ import annotations
 
-import json
 import logging
 import subprocess
+import tempfile
+from collections.abc import Iterator
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional, TextIO
+
+from .json_stream import iter_array_items
 
 logger = logging.getLogger(__name__)
 
 
-def run_grype(sbom_path: str | Path) -> list[dict[str, Any]]:
+def _to_finding(match: dict[str, Any]) -> Optional[dict[str, Any]]:
+    vuln = match.get("vulnerability", {}) or {}
+    artifact = match.get("artifact", {}) or {}
+    locations = artifact.get("locations") or []
+    location = locations[0] if locations else {}
+    path_hint = location.get("path") or location.get("filepath") or artifact.get("name")
+    summary = vuln.get("description") or vuln.get("summary")
+    identifier = vuln.get("id") or vuln.get("ids", [{}])[0].get("id")
+    severity = (vuln.get("severity") or "UNKNOWN").upper()
+    epss = next((entry.get("epss") for entry in vuln.get("epss") or [] if isinstance(entry, dict)), None)
+
+    if not identifier:
+        return None
+
+    return {
+        "severity": severity,
+        "path": path_hint or artifact.get("name", "dependency"),
+        "line": None,
+        "rule_id": identifier,
+        "message": summary or f"{artifact.get('name')} {artifact.get('version')} vulnerable ({identifier})",
+        "scanner": "grype",
+        "aliases": [
+            related.get("id")
+            for related in match.get("relatedVulnerabilities") or []
+            if isinstance(related, dict) and related.get("id")
+        ],
+        "package": artifact.get("name"),
+        "version": artifact.get("version"),
+        "ecosystem": artifact.get("type"),
+        "fix_available": (vuln.get("fix") or {}).get("state") == "fixed",
+        "known_exploited": bool(vuln.get("knownExploited")),
+        "epss": epss,
+    }
+
+
+def iter_grype_report(report: TextIO) -> Iterator[dict[str, Any]]:
+    """Parse a Grype JSON report one match at a time."""
+    try:
+        for match in iter_array_items(report, "matches"):
+            if not isinstance(match, dict):
+                continue
+            finding = _to_finding(match)
+            if finding:
+                yield finding
+    except ValueError:
+        logger.warning("Grype returned invalid JSON")
+
+
+def iter_grype_findings(sbom_path: str | Path) -> Iterator[dict[str, Any]]:
+    """Scan an SBOM with Grype, parsing its report one match at a time."""
     path = Path(sbom_path)
     if not path.is_file():
-        return []
+        return
 
     cmd = ["grype", f"sbom:{path}", "-o", "json"]
 
-    try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            check=False,
-        )
-    except FileNotFoundError:
-        logger.warning("Grype binary not found; skipping SBOM scan")
-        return []
-
-    if result.returncode not in {0, 1}:
-        logger.warning("Grype failed (%s): %s", result.returncode, result.stderr.strip())
-        return []
+    with tempfile.TemporaryFile(mode="w+", encoding="utf-8") as output:
+        try:
+            result = subprocess.run(
+                cmd,
+                stdout=output,
+                stderr=subprocess.PIPE,
+                text=True,
+                check=False,
+            )
+        except FileNotFoundError:
+            logger.warning("Grype binary not found; skipping SBOM scan")
+            return
 
-    try:
-        payload = json.loads(result.stdout or "{}")
-    except json.JSONDecodeError:
-        logger.warning("Grype returned invalid JSON")
-        return []
-
-    findings: list[dict[str, Any]] = []
-    for match in payload.get("matches", []) or []:
-        if not isinstance(match, dict):
-            continue
-        vuln = match.get("vulnerability", {}) or {}
-        artifact = match.get("artifact", {}) or {}
-        locations = artifact.get("locations") or []
-        location = locations[0] if locations else {}
-        path_hint = location.get("path") or location.get("filepath") or artifact.get("name")
-        summary = vuln.get("description") or vuln.get("summary")
-        identifier = vuln.get("id") or vuln.get("ids", [{}])[0].get("id")
-        severity = (vuln.get("severity") or "UNKNOWN").upper()
-
-        if not identifier:
-            continue
-
-        findings.append(
-            {
-                "severity": severity,
-                "path": path_hint or artifact.get("name", "dependency"),
-                "line": None,
-                "rule_id": identifier,
-                "message": summary or f"{artifact.get('name')} {artifact.get('version')} vulnerable ({identifier})",
-            }
-        )
-
-    return findings
+        if result.returncode not in {0, 1}:
+            logger.warning("Grype failed (%s): %s", result.returncode, result.stderr.strip())
+            return
+
+        output.seek(0)
+        yield from iter_grype_report(output)
+
+
+def run_grype(sbom_path: str | Path) -> list[dict[str, Any]]:
+    return list(iter_grype_findings(sbom_path))
@@ -0,0 +1,98 @@
+"""Incremental parsing for large scanner JSON reports.
+
+Scanner reports are a single top-level object whose bulk lives in one array
+(``results`` for Semgrep/OSV, ``matches`` for Grype). ``iter_array_items``
+walks that object from a file handle and yields the array's elements one at a
+time, so memory stays proportional to the largest element rather than the
+whole report.
+"""
+
+from __future__ import annotations
+
+import json
+from collections.abc import Iterator
+from typing import Any, TextIO
+
+_CHUNK_SIZE = 64 * 1024
+_WHITESPACE = " \t\n\r"
+
+
+class _StreamReader:
+    def __init__(self, stream: TextIO, chunk_size: int = _CHUNK_SIZE) -> None:
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self, size: int) -> bool:
+        if self._eof:
+            return False
+        if self._pos > self._chunk_size:
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+        data = self._stream.read(size)
+        if not data:
+            self._eof = True
+            return False
+        self._buffer += data
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill(self._chunk_size):
+                raise json.JSONDecodeError("Unexpected end of JSON stream", self._buffer, self._pos)
+
+    def take(self, expected: str | None = None) -> str:
+        char = self.peek()
+        if expected is not None and char not in expected:
+            raise json.JSONDecodeError(f"Expected one of {expected!r}", self._buffer, self._pos)
+        self._pos += 1
+        return char
+
+    def value(self) -> Any:
+        self.peek()
+        read_size = self._chunk_size
+        while True:
+            try:
+                parsed, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                # Grow reads geometrically so one huge element is not re-parsed per chunk.
+                if not self._fill(read_size):
+                    raise
+                read_size = max(read_size, len(self._buffer) - self._pos)
+                continue
+            if end == len(self._buffer) and self._fill(self._chunk_size):
+                continue  # a bare number may continue past the buffer edge
+            self._pos = end
+            return parsed
+
+
+def iter_array_items(stream: TextIO, key: str, chunk_size: int = _CHUNK_SIZE) -> Iterator[Any]:
+    """Yield the elements of the top-level ``key`` array in a JSON object stream."""
+    reader = _StreamReader(stream, chunk_size)
+    reader.take("{")
+    if reader.peek() == "}":
+        return
+
+    while True:
+        name = reader.value()
+        reader.take(":")
+        if name == key and reader.peek() == "[":
+            reader.take("[")
+            if reader.peek() == "]":
+                reader.take("]")
+            else:
+                while True:
+                    yield reader.value()
+                    if reader.take(",]") == "]":
+                        break
+        else:
+            reader.value()
+        if reader.take(",}") == "}":
+            return
@@ -0,0 +1,84 @@
+"""Redis-backed JSON cache with TTL and least-recently-used eviction."""
+
+from __future__ import annotations
+
+import json
+import logging
+import time
+import zlib
+from typing import Any, Optional
+
+from redis import Redis
+from redis.exceptions import RedisError
+
+from .redis_conn import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class RedisLRUCache:
+    """Stores compressed JSON values under ``remedy:<namespace>:<key>``.
+
+    A sorted set indexes keys by last access time so the cache can be trimmed to
+    ``max_entries``. Redis failures are logged and treated as misses: callers
+    always fall back to computing the value.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        ttl_seconds: int,
+        max_entries: int,
+        connection: Optional[Redis] = None,
+    ) -> None:
+        self.prefix = f"remedy:{namespace}"
+        self.index_key = f"{self.prefix}:lru"
+        self.ttl_seconds = max(int(ttl_seconds), 1)
+        self.max_entries = max(int(max_entries), 1)
+        self._connection = connection
+
+    @property
+    def redis(self) -> Redis:
+        return self._connection if self._connection is not None else get_redis()
+
+    def _entry_key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            raw = self.redis.get(self._entry_key(key))
+            if raw is None:
+                self.redis.zrem(self.index_key, key)
+                return None
+            self.redis.zadd(self.index_key, {key: time.time()})
+            return json.loads(zlib.decompress(raw))
+        except (RedisError, OSError, ValueError, zlib.error) as exc:
+            logger.debug("Cache %s get failed: %s", self.prefix, exc)
+            return None
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[int] = None) -> None:
+        try:
+            payload = zlib.compress(json.dumps(value).encode("utf-8"))
+            now = time.time()
+            ttl = max(int(ttl_seconds), 1) if ttl_seconds is not None else self.ttl_seconds
+            pipe = self.redis.pipeline()
+            pipe.setex(self._entry_key(key), ttl, payload)
+            pipe.zadd(self.index_key, {key: now})
+            pipe.zremrangebyscore(self.index_key, "-inf", now - self.ttl_seconds)
+            pipe.zcard(self.index_key)
+            size = pipe.execute()[-1]
+            if size > self.max_entries:
+                self._evict(size - self.max_entries)
+        except (RedisError, OSError, TypeError, ValueError) as exc:
+            logger.debug("Cache %s set failed: %s", self.prefix, exc)
+
+    def _evict(self, count: int) -> None:
+        oldest = self.redis.zrange(self.index_key, 0, count - 1)
+        if not oldest:
+            return
+        pipe = self.redis.pipeline()
+        for member in oldest:
+            name = member.decode("utf-8") if isinstance(member, bytes) else str(member)
+            pipe.delete(self._entry_key(name))
+        pipe.zrem(self.index_key, *oldest)
+        pipe.execute()
@@ -1,64 +1,91 @@
 from __future__ import annotations
 
-import json
 import logging
 import os
 import subprocess
 import tempfile
+from collections.abc import Iterator
 from pathlib import Path
 from typing import Any
 
+from .json_stream import iter_array_items
+
 
 logger = logging.getLogger(__name__)
-_DEFAULT_CONFIG = Path(__file__).resolve().parents[2] / "scanners" / "osv" / "config.toml"
+_DEFAULT_CONFIG = Path(__file__).resolve().parents[3] / "scanners" / "osv" / "config.toml"
 
 
-def run_osv(repo_dir: str) -> list[dict[str, Any]]:
+def osv_config_path() -> Path | None:
+    config_override = os.getenv("OSV_CONFIG_PATH")
+    if config_override:
+        return Path(config_override)
+    return _DEFAULT_CONFIG if _DEFAULT_CONFIG.exists() else None
+
+
+def _to_finding(vuln: dict[str, Any], source: str, package: dict[str, Any]) -> dict[str, Any]:
+    severity = (vuln.get("database_specific") or {}).get("severity")
+    if not severity:
+        severity_list = vuln.get("severity") or []
+        severity = next((s.get("score") for s in severity_list if s.get("score")), "UNSPECIFIED")
+    return {
+        "severity": str(severity).upper(),
+        "path": source,
+        "line": None,
+        "rule_id": vuln.get("id"),
+        "message": vuln.get("summary") or vuln.get("details", ""),
+        "scanner": "osv",
+        "aliases": [alias for alias in vuln.get("aliases") or [] if isinstance(alias, str)],
+        "package": package.get("name"),
+        "version": package.get("version"),
+        "ecosystem": package.get("ecosystem"),
+    }
+
+
+def _entry_findings(entry: dict[str, Any]) -> Iterator[dict[str, Any]]:
+    source = entry.get("source", "")
+    if isinstance(source, dict):
+        source = source.get("path", "")
+    # osv-scanner nests vulnerabilities per package; older reports listed them per source.
+    for vuln in entry.get("vulnerabilities", []) or []:
+        yield _to_finding(vuln, source, {})
+    for package_entry in entry.get("packages", []) or []:
+        package = package_entry.get("package") or {}
+        for vuln in package_entry.get("vulnerabilities", []) or []:
+            yield _to_finding(vuln, source, package)
+
+
+def iter_osv_findings(repo_dir: str) -> Iterator[dict[str, Any]]:
     tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".json")
     tmp_path = Path(tmp.name)
     tmp.close()
 
-    config_override = os.getenv("OSV_CONFIG_PATH")
-    cmd = ["osv-scanner", "--recursive", repo_dir, "--format", "json", "--output", str(tmp_path)]
-    if config_override:
-        cmd.extend(["--config", config_override])
-    elif _DEFAULT_CONFIG.exists():
-        cmd.extend(["--config", str(_DEFAULT_CONFIG)])
-
     try:
-        result = subprocess.run(cmd, check=False, capture_output=True, text=True)
-    except FileNotFoundError:
-        logger.warning("osv-scanner binary not found; skipping dependency scan")
-        tmp_path.unlink(missing_ok=True)
-        return []
+        config_path = osv_config_path()
+        cmd = ["osv-scanner", "--recursive", repo_dir, "--format", "json", "--output", str(tmp_path)]
+        if config_path:
+            cmd.extend(["--config", str(config_path)])
 
-    if result.returncode not in {0, 1}:  # osv-scanner returns 1 when it finds vulns
-        logger.warning("osv-scanner failed (%s): %s", result.returncode, result.stderr.strip())
-        tmp_path.unlink(missing_ok=True)
-        return []
+        try:
+            result = subprocess.run(cmd, check=False, capture_output=True, text=True)
+        except FileNotFoundError:
+            logger.warning("osv-scanner binary not found; skipping dependency scan")
+            return
 
-    try:
-        data = json.loads(tmp_path.read_text(encoding="utf-8"))
-    except Exception as exc:  # pragma: no cover - defensive
-        logger.warning("Unable to parse osv-scanner output: %s", exc)
-        tmp_path.unlink(missing_ok=True)
-        return []
+        if result.returncode not in {0, 1}:  # osv-scanner returns 1 when it finds vulns
+            logger.warning("osv-scanner failed (%s): %s", result.returncode, result.stderr.strip())
+            return
+
+        try:
+            with tmp_path.open(encoding="utf-8") as report:
+                for entry in iter_array_items(report, "results"):
+                    if not isinstance(entry, dict):
+                        continue
+                    yield from _entry_findings(entry)
+        except (OSError, ValueError) as exc:
+            logger.warning("Unable to parse osv-scanner output: %s", exc)
     finally:
         tmp_path.unlink(missing_ok=True)
 
-    findings: list[dict[str, Any]] = []
-    for entry in data.get("results", []) or []:
-        for vuln in entry.get("vulnerabilities", []) or []:
-            severity_list = vuln.get("severity") or []
-            severity = next((s.get("score") for s in severity_list if s.get("score")), "UNSPECIFIED")
-            findings.append(
-                {
-                    "severity": str(severity).upper(),
-                    "path": entry.get("source", ""),
-                    "line": None,
-                    "rule_id": vuln.get("id"),
-                    "message": vuln.get("summary") or vuln.get("details", ""),
-                }
-            )
-
-    return findings
+
+def run_osv(repo_dir: str) -> list[dict[str, Any]]:
+    return list(iter_osv_findings(repo_dir))
@@ -1,53 +1,115 @@
+"""Apply LLM patch plans as literal or regex replacements.
+
+Edits are grouped by file; each file is read once, edited in memory in plan
+order and written at most once. An edit that would rewrite text produced by an
+earlier edit in the same file is skipped as a ``conflict``, and regexes run
+under ``safe_regex``'s time budget.
+"""
+
 from __future__ import annotations
 
 import re
 import subprocess
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional
 
+from .safe_regex import RegexTimeout, regex_spans
 
-def _rewrite_file(path: Path, edit: dict[str, Any], results: dict[str, list]):
-    if not path.is_file():
-        results["skipped"].append({"path": edit.get("path"), "reason": "missing_file"})
-        return
+Span = tuple[int, int]
 
-    original = path.read_text(encoding="utf-8", errors="ignore")
-    updated = original
 
+def _overlaps(span: Span, written: list[Span]) -> bool:
+    start, end = span
+    return any((start < w_end and w_start < end) or start == end == w_start for w_start, w_end in written)
+
+
+def _literal_spans(text: str, literal: str) -> list[Span]:
+    spans = []
+    index = text.find(literal)
+    while index != -1:
+        spans.append((index, index + len(literal)))
+        index = text.find(literal, index + len(literal))
+    return spans
+
+
+def _apply_edit(text: str, edit: dict[str, Any], written: list[Span]) -> tuple[str, list[Span], Optional[str]]:
+    """Apply one edit to ``text`` in memory.
+
+    ``written`` holds the ranges earlier edits produced (in ``text`` coordinates);
+    an edit that would rewrite any of them is a conflict. Returns the new text,
+    the updated ranges and a skip reason (``None`` when applied).
+    """
     match_literal = edit.get("match")
     regex_pattern = edit.get("regex")
     replacement = edit.get("replace", "")
 
     if match_literal:
-        if match_literal not in original:
-            results["skipped"].append({"path": edit.get("path"), "reason": "match_not_found"})
-            return
-        updated = original.replace(match_literal, replacement)
+        spans = [(span, replacement) for span in _literal_spans(text, match_literal)]
+        if not spans:
+            return text, written, "match_not_found"
     elif regex_pattern:
         try:
-            updated, count = re.subn(regex_pattern, replacement, original, flags=re.MULTILINE)
+            spans = regex_spans(regex_pattern, text, replacement)
         except re.error as exc:  # pragma: no cover - defensive
-            results["skipped"].append({"path": edit.get("path"), "reason": f"regex_error:{exc}"})
-            return
-        if count == 0:
-            results["skipped"].append({"path": edit.get("path"), "reason": "regex_no_match"})
-            return
+            return text, written, f"regex_error:{exc}"
+        except RegexTimeout:
+            return text, written, "regex_timeout"
+        if not spans:
+            return text, written, "regex_no_match"
     else:
-        results["skipped"].append({"path": edit.get("path"), "reason": "no_operation"})
-        return
+        return text, written, "no_operation"
+
+    if all(text[start:end] == new for (start, end), new in spans):
+        return text, written, "no_change"
+    if any(_overlaps(span, written) for span, _ in spans):
+        return text, written, "conflict"
+
+    pieces: list[str] = []
+    new_written: list[Span] = []
+    cursor = 0
+    shift = 0
+    for (start, end), new in spans:
+        pieces.append(text[cursor:start])
+        pieces.append(new)
+        new_written.append((start + shift, start + shift + len(new)))
+        shift += len(new) - (end - start)
+        cursor = end
+    pieces.append(text[cursor:])
+
+    # Move earlier ranges by the length change of every replacement before them.
+    shifted: list[Span] = []
+    for w_start, w_end in written:
+        delta = sum(len(new) - (end - start) for (start, end), new in spans if end <= w_start)
+        shifted.append((w_start + delta, w_end + delta))
+    return "".join(pieces), sorted(shifted + new_written), None
+
 
-    if updated == original:
-        results["skipped"].append({"path": edit.get("path"), "reason": "no_change"})
+def _rewrite_file(path: Path, rel_path: str, edits: list[dict[str, Any]], results: dict[str, list]) -> None:
+    """Apply every edit for one file in a single read and at most one write."""
+    if not path.is_file():
+        results["skipped"].extend({"path": edit.get("path"), "reason": "missing_file"} for edit in edits)
         return
 
-    path.write_text(updated, encoding="utf-8")
-    results["touched"].append(edit.get("path"))
+    original = path.read_text(encoding="utf-8", errors="ignore")
+    updated = original
+    written: list[Span] = []
+    for edit in edits:
+        updated, written, reason = _apply_edit(updated, edit, written)
+        if reason:
+            results["skipped"].append({"path": edit.get("path"), "reason": reason})
+
+    if updated != original:
+        path.write_text(updated, encoding="utf-8")
+        results["touched"].append(rel_path)
 
 
 def apply_patch_plan(repo_dir: str, plan: list[dict[str, Any]] | None) -> dict[str, Any]:
     repo_path = Path(repo_dir)
+    repo_root = repo_path.resolve()
     results: dict[str, list] = {"touched": [], "skipped": []}
 
+    # Group edits per file, keeping plan order within each file.
+    by_file: dict[Path, tuple[str, list[dict[str, Any]]]] = {}
     for item in plan or []:
         for edit in item.get("edits", []) or []:
             rel_path = edit.get("path")
@@ -56,21 +118,28 @@ def apply_patch_plan(repo_dir: str, plan: list[dict[str, Any]] | None) -> dict[s
                 continue
             target = (repo_path / rel_path).resolve()
             try:
-                target.relative_to(repo_path.resolve())
+                target.relative_to(repo_root)
             except ValueError:
                 results["skipped"].append({"path": rel_path, "reason": "outside_repo"})
                 continue
-            _rewrite_file(target, edit, results)
+            by_file.setdefault(target, (rel_path, []))[1].append(edit)
+
+    for target, (rel_path, edits) in by_file.items():
+        _rewrite_file(target, rel_path, edits, results)
 
-    diff_proc = subprocess.run(
-        ["git", "diff"],
-        cwd=repo_dir,
-        capture_output=True,
-        text=True,
-    )
+    touched = sorted(set(results["touched"]))
+    diff = ""
+    if touched:
+        diff_proc = subprocess.run(
+            ["git", "diff", "--", *touched],
+            cwd=repo_dir,
+            capture_output=True,
+            text=True,
+        )
+        diff = diff_proc.stdout
 
     return {
-        "touched": sorted(set(results["touched"])),
+        "touched": touched,
         "skipped": results["skipped"],
-        "diff": diff_proc.stdout,
+        "diff": diff,
     }
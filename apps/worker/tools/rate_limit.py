@@ -0,0 +1,171 @@
+"""Fleet-wide token-bucket limiter for LLM calls, shared by all workers through Redis.
+
+Two buckets refill continuously: one counts requests per minute, the other
+estimated tokens per minute. Callers that cannot be served immediately wait in
+a Redis sorted set ordered by (priority, arrival), and only the head of that
+queue may draw from the buckets, so a burst of bulk scans cannot starve
+interactive work. Waiters that stop polling (crashed workers) are pruned.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import random
+import time
+import uuid
+from typing import Optional
+
+from redis import Redis
+from redis.exceptions import RedisError
+
+from .redis_conn import get_redis
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 9
+
+_POLL_SECONDS = 0.1
+_STALE_WAITER_MS = 5000
+_PRIORITY_STRIDE = 10**13  # keeps priority dominant over the millisecond arrival time
+
+# KEYS: request bucket, token bucket, waiter queue, waiter heartbeats
+# ARGV: requests/min, tokens/min, tokens needed, waiter id, waiter score, stale after (ms)
+# Returns 0 when granted, -1 when another waiter is ahead, else the suggested wait in ms.
+_ACQUIRE_LUA = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local rpm = tonumber(ARGV[1])
+local tpm = tonumber(ARGV[2])
+local need = math.min(tonumber(ARGV[3]), tpm)
+local waiter = ARGV[4]
+local stale_before = now - tonumber(ARGV[6])
+
+redis.call('ZADD', KEYS[3], 'NX', ARGV[5], waiter)
+redis.call('HSET', KEYS[4], waiter, now)
+redis.call('PEXPIRE', KEYS[3], 60000)
+redis.call('PEXPIRE', KEYS[4], 60000)
+
+for _, member in ipairs(redis.call('ZRANGE', KEYS[3], 0, 9)) do
+  if member ~= waiter then
+    local seen = tonumber(redis.call('HGET', KEYS[4], member) or '0')
+    if seen < stale_before then
+      redis.call('ZREM', KEYS[3], member)
+      redis.call('HDEL', KEYS[4], member)
+    end
+  end
+end
+if redis.call('ZRANK', KEYS[3], waiter) ~= 0 then
+  return -1
+end
+
+local function level(key, capacity)
+  local state = redis.call('HMGET', key, 'level', 'ts')
+  local current = tonumber(state[1]) or capacity
+  local ts = tonumber(state[2]) or now
+  return math.min(capacity, current + math.max(now - ts, 0) * capacity / 60000)
+end
+
+local requests = level(KEYS[1], rpm)
+local tokens = level(KEYS[2], tpm)
+local wait = 0
+if requests < 1 then
+  wait = math.max(wait, (1 - requests) * 60000 / rpm)
+end
+if tokens < need then
+  wait = math.max(wait, (need - tokens) * 60000 / tpm)
+end
+if wait > 0 then
+  return math.max(math.ceil(wait), 1)
+end
+
+redis.call('HSET', KEYS[1], 'level', requests - 1, 'ts', now)
+redis.call('HSET', KEYS[2], 'level', tokens - need, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], 120000)
+redis.call('PEXPIRE', KEYS[2], 120000)
+redis.call('ZREM', KEYS[3], waiter)
+redis.call('HDEL', KEYS[4], waiter)
+return 0
+"""
+
+
+class RateLimitTimeout(RuntimeError):
+    """Raised when a caller waited longer than its budget for LLM capacity."""
+
+
+def rate_limit_enabled() -> bool:
+    return os.getenv("REMEDY_LLM_RATE_LIMIT", "1").lower() not in {"0", "false", "no", "off"}
+
+
+class TokenBucketLimiter:
+    """Requests/minute and tokens/minute quotas under ``remedy:ratelimit:<name>``.
+
+    Redis failures fail open: the caller proceeds unthrottled rather than
+    blocking remediation on the limiter itself.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: int,
+        tokens_per_minute: int,
+        connection: Optional[Redis] = None,
+    ) -> None:
+        prefix = f"remedy:ratelimit:{name}"
+        self.keys = [f"{prefix}:requests", f"{prefix}:tokens", f"{prefix}:waiters", f"{prefix}:seen"]
+        self.requests_per_minute = max(int(requests_per_minute), 1)
+        self.tokens_per_minute = max(int(tokens_per_minute), 1)
+        self._connection = connection
+        self._script = None
+
+    @property
+    def redis(self) -> Redis:
+        return self._connection if self._connection is not None else get_redis()
+
+    def _evaluate(self, waiter: str, score: int, tokens: int) -> int:
+        if self._script is None:
+            self._script = self.redis.register_script(_ACQUIRE_LUA)
+        result = self._script(
+            keys=self.keys,
+            args=[self.requests_per_minute, self.tokens_per_minute, tokens, waiter, score, _STALE_WAITER_MS],
+            client=self.redis,
+        )
+        return int(result)
+
+    def _withdraw(self, waiter: str) -> None:
+        try:
+            pipe = self.redis.pipeline()
+            pipe.zrem(self.keys[2], waiter)
+            pipe.hdel(self.keys[3], waiter)
+            pipe.execute()
+        except (RedisError, OSError) as exc:
+            logger.debug("Rate limiter withdraw failed: %s", exc)
+
+    def acquire(self, tokens: int, priority: int = PRIORITY_NORMAL, timeout: float = 60.0) -> float:
+        """Block until one request and ``tokens`` tokens are available; return seconds waited.
+
+        Lower ``priority`` values are served first; ties are served in arrival order.
+        """
+        waiter = uuid.uuid4().hex
+        score = int(priority) * _PRIORITY_STRIDE + int(time.time() * 1000)
+        started = time.monotonic()
+        deadline = started + max(timeout, 0.0)
+        while True:
+            try:
+                wait_ms = self._evaluate(waiter, score, max(int(tokens), 1))
+            except (RedisError, OSError) as exc:
+                logger.debug("Rate limiter unavailable, proceeding unthrottled: %s", exc)
+                return time.monotonic() - started
+            if wait_ms == 0:
+                return time.monotonic() - started
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._withdraw(waiter)
+                raise RateLimitTimeout(f"LLM rate limit: no capacity after waiting {timeout:.0f}s")
+            # Poll well within the staleness window so the head of the queue keeps its place.
+            delay = _POLL_SECONDS if wait_ms < 0 else min(wait_ms / 1000, _STALE_WAITER_MS / 2000)
+            # Jitter spreads out polls from waiters woken by the same refill.
+            time.sleep(min(delay + random.uniform(0, _POLL_SECONDS), remaining))
@@ -0,0 +1,16 @@
+from __future__ import annotations
+
+import os
+from functools import lru_cache
+
+from redis import Redis
+
+
+@lru_cache(maxsize=1)
+def get_redis() -> Redis:
+    """Process-wide Redis client for worker-side caches and coordination state."""
+    return Redis.from_url(
+        os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+        socket_connect_timeout=float(os.getenv("REMEDY_REDIS_CONNECT_TIMEOUT", "1")),
+        socket_timeout=float(os.getenv("REMEDY_REDIS_TIMEOUT", "2")),
+    )
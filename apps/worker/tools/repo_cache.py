@@ -0,0 +1,198 @@
+"""Per-host bare mirror cache used to materialise scan workspaces cheaply.
+
+Each repo URL gets one bare mirror under ``REMEDY_MIRROR_DIR``, refreshed with
+an incremental fetch; scan workspaces are local clones of it. Mirrors are
+evicted least-recently-used once ``REMEDY_MIRROR_BUDGET_MB`` is exceeded. Set
+``REMEDY_MIRROR_CACHE=0`` to fall back to shallow clones.
+"""
+
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_CACHE_DIR = Path(tempfile.gettempdir()) / "remedy_mirrors"
+_DEFAULT_BUDGET_MB = 10 * 1024
+_LAST_USED_MARKER = ".remedy-last-used"
+
+
+def mirror_cache_enabled() -> bool:
+    return os.getenv("REMEDY_MIRROR_CACHE", "1").lower() not in {"0", "false", "no", "off"}
+
+
+def _cache_root() -> Path:
+    root = Path(os.getenv("REMEDY_MIRROR_DIR", str(_DEFAULT_CACHE_DIR)))
+    root.mkdir(parents=True, exist_ok=True)
+    return root
+
+
+def _budget_bytes() -> int:
+    try:
+        budget_mb = int(os.getenv("REMEDY_MIRROR_BUDGET_MB", str(_DEFAULT_BUDGET_MB)))
+    except ValueError:
+        budget_mb = _DEFAULT_BUDGET_MB
+    return max(budget_mb, 0) * 1024 * 1024
+
+
+def _git(cmd: list[str], cwd: Optional[Path] = None) -> subprocess.CompletedProcess[str]:
+    env = {**os.environ, "GIT_TERMINAL_PROMPT": "0"}
+    return subprocess.run(cmd, cwd=cwd, capture_output=True, text=True, check=False, env=env)
+
+
+def mirror_path(repo_url: str) -> Path:
+    digest = hashlib.sha256(repo_url.encode("utf-8")).hexdigest()[:32]
+    return _cache_root() / f"{digest}.git"
+
+
+@contextmanager
+def _locked(mirror: Path, shared: bool = False) -> Iterator[None]:
+    lock_path = mirror.with_suffix(".lock")
+    with open(lock_path, "a+") as handle:
+        fcntl.flock(handle, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _touch(mirror: Path) -> None:
+    (mirror / _LAST_USED_MARKER).touch()
+
+
+def _last_used(mirror: Path) -> float:
+    marker = mirror / _LAST_USED_MARKER
+    try:
+        return marker.stat().st_mtime
+    except OSError:
+        return 0.0
+
+
+def _dir_size(path: Path) -> int:
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                continue
+    return total
+
+
+def _sync_mirror(repo_url: str, mirror: Path) -> None:
+    if (mirror / "HEAD").is_file():
+        result = _git(["git", "remote", "update", "--prune"], cwd=mirror)
+        if result.returncode == 0:
+            return
+        # A corrupt or half-written mirror is cheaper to rebuild than to repair.
+        logger.warning("Mirror fetch failed for %s, recloning: %s", repo_url, result.stderr.strip())
+        shutil.rmtree(mirror, ignore_errors=True)
+
+    staging = Path(tempfile.mkdtemp(prefix="mirror_", dir=mirror.parent))
+    try:
+        result = _git(["git", "clone", "--mirror", repo_url, str(staging / "repo.git")])
+        if result.returncode != 0:
+            raise RuntimeError(f"git clone --mirror failed: {result.stderr.strip()}")
+        os.replace(staging / "repo.git", mirror)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def evict_mirrors(keep: Optional[Path] = None) -> list[Path]:
+    """Drop least-recently-used mirrors until the cache fits its disk budget."""
+    budget = _budget_bytes()
+    mirrors = [p for p in _cache_root().glob("*.git") if p.is_dir()]
+    sizes = {p: _dir_size(p) for p in mirrors}
+    total = sum(sizes.values())
+    evicted: list[Path] = []
+
+    for mirror in sorted(mirrors, key=_last_used):
+        if total <= budget:
+            break
+        if keep is not None and mirror == keep:
+            continue
+        lock_path = mirror.with_suffix(".lock")
+        with open(lock_path, "a+") as handle:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue  # in use by another job on this host
+            try:
+                shutil.rmtree(mirror, ignore_errors=True)
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+        lock_path.unlink(missing_ok=True)
+        total -= sizes[mirror]
+        evicted.append(mirror)
+
+    return evicted
+
+
+def materialize_workspace(repo_url: str, destination: Path) -> None:
+    """Refresh the mirror for ``repo_url`` and check out a workspace at ``destination``."""
+    mirror = mirror_path(repo_url)
+    started = time.monotonic()
+
+    with _locked(mirror):
+        _sync_mirror(repo_url, mirror)
+        _touch(mirror)
+
+    with _locked(mirror, shared=True):
+        # --local hardlinks object files, so the workspace survives later mirror eviction.
+        result = _git(["git", "clone", "--local", str(mirror), str(destination)])
+        if result.returncode != 0:
+            raise RuntimeError(f"git clone from mirror failed: {result.stderr.strip()}")
+
+    _git(["git", "remote", "set-url", "origin", repo_url], cwd=destination)
+    logger.info("Materialised %s from mirror in %.2fs", repo_url, time.monotonic() - started)
+
+    evict_mirrors(keep=mirror)
+
+
+def _has_commit(repo_dir: Path, sha: str) -> bool:
+    return _git(["git", "cat-file", "-e", f"{sha}^{{commit}}"], cwd=repo_dir).returncode == 0
+
+
+def _ensure_commit(repo_dir: Path, sha: str) -> bool:
+    if _has_commit(repo_dir, sha):
+        return True
+    _git(["git", "fetch", "--quiet", "origin", sha], cwd=repo_dir)
+    return _has_commit(repo_dir, sha)
+
+
+def checkout_commit(repo_dir: str | Path, sha: str) -> bool:
+    """Detach the workspace at ``sha``, fetching it from origin if the clone lacks it."""
+    workdir = Path(repo_dir)
+    if not _ensure_commit(workdir, sha):
+        return False
+    return _git(["git", "checkout", "--quiet", "--detach", sha], cwd=workdir).returncode == 0
+
+
+def changed_paths(repo_dir: str | Path, baseline_sha: str, head: str = "HEAD") -> Optional[list[str]]:
+    """Return paths whose contents differ between ``baseline_sha`` and ``head``.
+
+    The trees are compared directly, not from their merge base, so the result is
+    correct even when the two commits sit on different branches. ``None`` means
+    the diff could not be computed and callers should scan everything.
+    """
+    workdir = Path(repo_dir)
+    if not _ensure_commit(workdir, baseline_sha):
+        return None
+    result = _git(
+        ["git", "diff", "--name-only", "--no-renames", "-z", baseline_sha, head],
+        cwd=workdir,
+    )
+    if result.returncode != 0:
+        logger.warning("git diff against %s failed: %s", baseline_sha, result.stderr.strip())
+        return None
+    return sorted(path for path in result.stdout.split("\0") if path)
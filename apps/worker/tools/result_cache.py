@@ -0,0 +1,163 @@
+"""Scanner result cache keyed by commit, scanner version, and rule/config fingerprint.
+
+Findings are cached with repo-relative paths, since each job scans a fresh
+temporary checkout. Results from advisory-database scanners (OSV, Grype)
+depend on the vulnerability data as well as the commit, so they expire after
+``REMEDY_RESULT_CACHE_SCA_TTL`` seconds (6 hours by default) rather than the
+general ``REMEDY_RESULT_CACHE_TTL``. ``REMEDY_RESULT_CACHE_MAX_ENTRIES`` caps
+the cache with LRU eviction, and ``REMEDY_RESULT_CACHE=0`` disables it. Scans
+served from the cache are stored with ``findings_json.cached = true``.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import subprocess
+from collections.abc import Callable, Iterable
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Optional
+
+from .kv_cache import RedisLRUCache
+from .osv_runner import osv_config_path
+from .semgrep_runner import semgrep_config_path
+
+logger = logging.getLogger(__name__)
+
+_VERSION_COMMANDS = {
+    "semgrep": ["semgrep", "--version"],
+    "osv-scanner": ["osv-scanner", "--version"],
+    "syft": ["syft", "version"],
+    "grype": ["grype", "version"],
+}
+
+# Binaries whose output each cached scanner job depends on.
+SCANNER_BINARIES = {
+    "semgrep": ("semgrep",),
+    "osv": ("osv-scanner",),
+    "syft+grype": ("syft", "grype"),
+}
+
+# Scanners whose results change whenever their advisory database updates.
+ADVISORY_SCANNERS = frozenset({"osv", "syft+grype"})
+
+# Bumped when the cached payload format changes (v2: repo-relative paths).
+_KEY_SCHEMA = "v2"
+
+
+def result_cache_enabled() -> bool:
+    return os.getenv("REMEDY_RESULT_CACHE", "1").lower() not in {"0", "false", "no", "off"}
+
+
+@lru_cache(maxsize=1)
+def _cache() -> RedisLRUCache:
+    return RedisLRUCache(
+        "scan-results",
+        ttl_seconds=int(os.getenv("REMEDY_RESULT_CACHE_TTL", str(7 * 24 * 3600))),
+        max_entries=int(os.getenv("REMEDY_RESULT_CACHE_MAX_ENTRIES", "5000")),
+    )
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def result_ttl(scanner: str) -> Optional[int]:
+    """TTL for ``scanner``'s results; ``None`` means the cache default."""
+    if scanner in ADVISORY_SCANNERS:
+        return _env_int("REMEDY_RESULT_CACHE_SCA_TTL", 6 * 3600)
+    return None
+
+
+@lru_cache(maxsize=None)
+def scanner_version(binary: str) -> Optional[str]:
+    cmd = _VERSION_COMMANDS.get(binary, [binary, "--version"])
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=False, timeout=30)
+    except (FileNotFoundError, subprocess.TimeoutExpired):
+        return None
+    if result.returncode != 0:
+        return None
+    return result.stdout.strip() or None
+
+
+def fingerprint_paths(paths: Iterable[Optional[Path]]) -> str:
+    digest = hashlib.sha256()
+    for path in paths:
+        if path is None:
+            continue
+        files = sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path]
+        for file in files:
+            digest.update(str(file).encode("utf-8"))
+            try:
+                digest.update(file.read_bytes())
+            except OSError:
+                digest.update(b"<missing>")
+    return digest.hexdigest()
+
+
+def config_fingerprint(scanner: str) -> str:
+    """Hash of the rule/config files ``scanner`` reads; empty for scanners without one."""
+    if scanner == "semgrep":
+        config = semgrep_config_path()
+        # Rule files referenced by the profile live beside it, so hash the directory.
+        return fingerprint_paths([config.parent if config.is_file() else config])
+    if scanner == "osv":
+        return fingerprint_paths([osv_config_path()])
+    return ""
+
+
+def commit_sha(repo_dir: str) -> Optional[str]:
+    result = subprocess.run(
+        ["git", "rev-parse", "HEAD"],
+        cwd=repo_dir,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if result.returncode != 0:
+        return None
+    return result.stdout.strip() or None
+
+
+def result_cache_key(repo_url: str, sha: str, scanner: str, extra: str = "") -> Optional[str]:
+    versions = []
+    for binary in SCANNER_BINARIES.get(scanner, (scanner,)):
+        version = scanner_version(binary)
+        if version is None:
+            return None  # scanner missing: nothing worth caching
+        versions.append(version)
+    material = "\0".join([_KEY_SCHEMA, repo_url, sha, scanner, *versions, config_fingerprint(scanner), extra])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def run_cached(
+    key: Optional[str],
+    job: Callable[[], list[dict[str, Any]]],
+    ttl_seconds: Optional[int] = None,
+) -> tuple[list[dict[str, Any]], bool]:
+    """Return ``(findings, cache_hit)`` for ``job``, consulting the cache when ``key`` is set.
+
+    A job that raises is not cached. Other runners report scanner failures as an
+    empty list, so empty results are only kept for
+    ``REMEDY_RESULT_CACHE_EMPTY_TTL`` seconds to avoid pinning a failure.
+    """
+    if key is None or not result_cache_enabled():
+        return job(), False
+
+    cached = _cache().get(key)
+    if isinstance(cached, list):
+        return cached, True
+
+    findings = job()
+    if isinstance(findings, list):
+        empty_ttl = _env_int("REMEDY_RESULT_CACHE_EMPTY_TTL", 600)
+        if not findings:
+            ttl_seconds = min(empty_ttl, ttl_seconds) if ttl_seconds else empty_ttl
+        _cache().set(key, findings, ttl_seconds=ttl_seconds)
+    return findings, False
@@ -0,0 +1,147 @@
+"""Time-bounded regex matching for LLM-supplied patch patterns.
+
+Patterns are compiled once and cached. When the optional ``google-re2``
+package is installed and supports the pattern, matching runs on RE2, which is
+linear-time and needs no budget. RE2 is only used where it matches exactly what
+``re`` would: its ``\w``, ``\s``, ``\d`` and ``\b`` are ASCII-only while
+``re`` is Unicode-aware, so non-ASCII patterns or text and patterns using those
+escapes stay on ``re``. Everything else (including backreferences and
+lookarounds, which RE2 rejects) runs on Python's ``re`` under a hard time
+budget: a ``SIGALRM`` timer in the main thread, otherwise a forked child that
+is killed when the budget runs out.
+"""
+
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import re
+import signal
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Optional
+
+try:  # optional linear-time engine: pip install google-re2
+    import re2
+except ImportError:  # pragma: no cover - depends on the environment
+    re2 = None
+
+logger = logging.getLogger(__name__)
+
+Span = tuple[int, int]
+
+# An unescaped \w, \W, \s, \S, \d, \D, \b or \B: these differ between RE2 and re.
+_UNICODE_SENSITIVE = re.compile(r"(?<!\\)(?:\\\\)*\\[wWsSdDbB]")
+
+
+class RegexTimeout(Exception):
+    """Raised when matching a pattern exceeds its time budget."""
+
+
+def regex_budget_seconds() -> float:
+    return float(os.getenv("REMEDY_REGEX_BUDGET_SECONDS", "2"))
+
+
+@lru_cache(maxsize=256)
+def _compile_re2(pattern: str) -> Optional[Any]:
+    if re2 is None:
+        return None
+    options = re2.Options()
+    options.log_errors = False
+    try:
+        return re2.compile(f"(?m){pattern}", options=options)
+    except re2.error:
+        return None  # unsupported syntax; use the budgeted backtracking engine
+
+
+@lru_cache(maxsize=256)
+def _re2_equivalent(pattern: str, text: str) -> bool:
+    return pattern.isascii() and text.isascii() and not _UNICODE_SENSITIVE.search(pattern)
+
+
+@lru_cache(maxsize=256)
+def _compile_re(pattern: str) -> re.Pattern[str]:
+    return re.compile(pattern, flags=re.MULTILINE)
+
+
+def _collect(compiled: Any, text: str, replacement: str) -> list[tuple[Span, str]]:
+    return [(match.span(), match.expand(replacement)) for match in compiled.finditer(text)]
+
+
+def _raise_timeout(_signum: int, _frame: Any) -> None:
+    raise RegexTimeout()
+
+
+def _collect_with_alarm(compiled: re.Pattern[str], text: str, replacement: str, budget: float) -> list[tuple[Span, str]]:
+    previous_delay, previous_interval = signal.getitimer(signal.ITIMER_REAL)
+    if previous_delay and previous_delay <= budget:
+        # An outer timer (e.g. the RQ job timeout) fires first; leave it in charge.
+        return _collect(compiled, text, replacement)
+
+    previous_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+    started = time.monotonic()
+    signal.setitimer(signal.ITIMER_REAL, budget)
+    try:
+        return _collect(compiled, text, replacement)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+        if previous_delay:
+            remaining = max(previous_delay - (time.monotonic() - started), 0.001)
+            signal.setitimer(signal.ITIMER_REAL, remaining, previous_interval)
+
+
+def _child(conn: Any, pattern: str, text: str, replacement: str) -> None:
+    try:
+        conn.send(_collect(_compile_re(pattern), text, replacement))
+    finally:
+        conn.close()
+
+
+def _collect_in_child(pattern: str, text: str, replacement: str, budget: float) -> list[tuple[Span, str]]:
+    # fork shares ``text`` with the child without pickling it.
+    context = multiprocessing.get_context("fork")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_child, args=(sender, pattern, text, replacement), daemon=True)
+    process.start()
+    sender.close()
+    try:
+        if not receiver.poll(budget):
+            raise RegexTimeout()
+        return receiver.recv()
+    except EOFError as exc:  # child died without a result
+        raise RegexTimeout() from exc
+    finally:
+        receiver.close()
+        if process.is_alive():
+            process.kill()
+        process.join()
+
+
+def regex_spans(
+    pattern: str,
+    text: str,
+    replacement: str,
+    budget_seconds: Optional[float] = None,
+) -> list[tuple[Span, str]]:
+    """Return ``(span, expanded replacement)`` for every match of ``pattern`` in ``text``.
+
+    Raises ``re.error`` for invalid patterns and ``RegexTimeout`` when matching
+    exceeds ``budget_seconds`` (default ``REMEDY_REGEX_BUDGET_SECONDS``).
+    """
+    linear = _compile_re2(pattern) if _re2_equivalent(pattern, text) else None
+    if linear is not None:
+        return _collect(linear, text, replacement)
+
+    compiled = _compile_re(pattern)
+    budget = regex_budget_seconds() if budget_seconds is None else budget_seconds
+    if budget <= 0:
+        return _collect(compiled, text, replacement)
+    if threading.current_thread() is threading.main_thread() and hasattr(signal, "setitimer"):
+        return _collect_with_alarm(compiled, text, replacement, budget)
+    if "fork" in multiprocessing.get_all_start_methods():
+        return _collect_in_child(pattern, text, replacement, budget)
+    logger.warning("No way to bound regex time on this platform; matching without a budget")
+    return _collect(compiled, text, replacement)
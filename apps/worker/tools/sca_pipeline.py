@@ -0,0 +1,139 @@
+"""Syft → Grype dependency scan, streaming the SBOM between the two processes."""
+
+from __future__ import annotations
+
+import logging
+import os
+import subprocess
+import tempfile
+from collections.abc import Iterator
+from pathlib import Path
+from typing import IO, Any, Optional
+
+from .grype_runner import iter_grype_findings, iter_grype_report
+from .syft_runner import cached_sbom_path, generate_sbom, release_sbom, store_cached_sbom
+
+logger = logging.getLogger(__name__)
+
+_PIPE_CHUNK = 256 * 1024
+
+
+def sca_pipe_enabled() -> bool:
+    return os.getenv("REMEDY_SCA_PIPE", "1").lower() not in {"0", "false", "no", "off"}
+
+
+def _tail(handle: IO[bytes]) -> str:
+    handle.seek(0)
+    return handle.read()[-2000:].decode("utf-8", errors="replace").strip()
+
+
+def _pump(source: IO[bytes], sink: IO[bytes], copy: Optional[IO[bytes]]) -> None:
+    """Copy Syft's stdout into Grype's stdin, teeing it into the SBOM cache file if given."""
+    sink_open = True
+    for chunk in iter(lambda: source.read(_PIPE_CHUNK), b""):
+        if copy is not None:
+            copy.write(chunk)
+        if sink_open:
+            try:
+                sink.write(chunk)
+            except BrokenPipeError:
+                # Grype exited early; keep draining so Syft can finish the cached SBOM.
+                sink_open = False
+                if copy is None:
+                    break
+    try:
+        sink.close()
+    except BrokenPipeError:
+        pass
+
+
+def _iter_piped_findings(repo_dir: str, cache_path: Optional[Path]) -> Iterator[dict[str, Any]]:
+    env = {**os.environ, "SYFT_LOG": os.getenv("SYFT_LOG", "error")}
+    partial: Optional[IO[bytes]] = None
+    if cache_path is not None:
+        partial = tempfile.NamedTemporaryFile(delete=False, suffix=".json.partial", dir=cache_path.parent)
+
+    syft_err = tempfile.TemporaryFile()
+    grype_err = tempfile.TemporaryFile()
+    report = tempfile.TemporaryFile(mode="w+", encoding="utf-8")
+    with syft_err, grype_err, report:
+        try:
+            try:
+                # With no source argument Grype reads the SBOM from stdin.
+                grype = subprocess.Popen(
+                    ["grype", "-o", "json"],
+                    stdin=subprocess.PIPE,
+                    stdout=report,
+                    stderr=grype_err,
+                )
+            except FileNotFoundError:
+                logger.warning("Grype binary not found; skipping SBOM scan")
+                return
+            try:
+                syft = subprocess.Popen(
+                    ["syft", f"dir:{repo_dir}", "-o", "json"],
+                    stdout=subprocess.PIPE,
+                    stderr=syft_err,
+                    env=env,
+                )
+            except FileNotFoundError:
+                logger.warning("Syft binary not found; skipping SBOM generation")
+                grype.kill()
+                grype.wait()
+                return
+
+            assert syft.stdout is not None and grype.stdin is not None
+            with syft.stdout:
+                _pump(syft.stdout, grype.stdin, partial)
+            syft_code = syft.wait()
+            grype_code = grype.wait()
+
+            if syft_code != 0:
+                logger.warning("Syft failed (%s): %s", syft_code, _tail(syft_err))
+                return
+            if partial is not None and cache_path is not None:
+                partial.close()
+                store_cached_sbom(Path(partial.name), cache_path)
+                partial = None
+            if grype_code not in {0, 1}:
+                logger.warning("Grype failed (%s): %s", grype_code, _tail(grype_err))
+                return
+
+            report.seek(0)
+            yield from iter_grype_report(report)
+        finally:
+            if partial is not None:
+                partial.close()
+                Path(partial.name).unlink(missing_ok=True)
+
+
+def iter_sbom_findings(repo_dir: str, repo_url: Optional[str] = None) -> Iterator[dict[str, Any]]:
+    """Catalogue ``repo_dir`` with Syft and match the inventory with Grype.
+
+    A cached SBOM for the current lockfiles is scanned directly. Otherwise Syft's
+    output is piped straight into Grype's stdin and teed into the SBOM cache, so
+    the SBOM is never held in worker memory or re-read from disk. Set
+    ``REMEDY_SCA_PIPE=0`` to go through an intermediate SBOM file instead.
+    """
+    cache_path = cached_sbom_path(repo_dir, repo_url)
+    if cache_path is not None and cache_path.is_file():
+        cache_path.touch()
+        logger.info("Reusing cached SBOM %s", cache_path.name)
+        yield from iter_grype_findings(cache_path)
+        return
+
+    if sca_pipe_enabled():
+        yield from _iter_piped_findings(repo_dir, cache_path)
+        return
+
+    sbom_path = generate_sbom(repo_dir, repo_url)
+    if not sbom_path:
+        return
+    try:
+        yield from iter_grype_findings(sbom_path)
+    finally:
+        release_sbom(sbom_path)
+
+
+def run_sbom_pipeline(repo_dir: str, repo_url: Optional[str] = None) -> list[dict[str, Any]]:
+    return list(iter_sbom_findings(repo_dir, repo_url))
@@ -0,0 +1,118 @@
+"""Concurrent scanner execution bounded by a per-host CPU budget.
+
+Independent scanners (Semgrep, OSV, the Syft→Grype chain) run on threads. Each
+holds host-wide slots (``REMEDY_SCANNER_SLOTS``, default CPU count), so
+concurrent jobs on the same machine share a single CPU budget. A scanner that
+uses several cores asks for a larger share: it waits for one slot, takes any
+further free slots up to its share, and sizes its own parallelism from
+``held_slots()`` (Semgrep passes it as ``--jobs``).
+"""
+
+from __future__ import annotations
+
+import fcntl
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections.abc import Callable, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Any, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_SLOT_DIR = Path(tempfile.gettempdir()) / "remedy_scanner_slots"
+_POLL_INTERVAL = 0.2
+_held = threading.local()
+
+
+def _host_slots() -> int:
+    raw = os.getenv("REMEDY_SCANNER_SLOTS")
+    try:
+        return max(int(raw), 1) if raw else max(os.cpu_count() or 1, 1)
+    except ValueError:
+        return max(os.cpu_count() or 1, 1)
+
+
+def held_slots() -> int:
+    """Slots held by the scanner job on this thread; 1 outside ``run_scanners``."""
+    return getattr(_held, "count", 1)
+
+
+def _try_lock(path: Path) -> Optional[IO[str]]:
+    handle = open(path, "a+")
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        handle.close()
+        return None
+    return handle
+
+
+@contextmanager
+def host_slots(count: int = 1) -> Iterator[int]:
+    """Hold up to ``count`` host-wide scanner slots, shared by every worker process on the machine.
+
+    Waits until at least one slot is free and then takes any others that are free
+    at that moment, so a large share never blocks on a busy host. Yields the
+    number of slots held.
+    """
+    slot_dir = Path(os.getenv("REMEDY_SCANNER_SLOT_DIR", str(_DEFAULT_SLOT_DIR)))
+    slot_dir.mkdir(parents=True, exist_ok=True)
+    paths = [slot_dir / f"slot-{index}.lock" for index in range(_host_slots())]
+
+    handles: list[IO[str]] = []
+    try:
+        while True:
+            for path in paths:
+                if len(handles) >= count:
+                    break
+                handle = _try_lock(path)
+                if handle is not None:
+                    handles.append(handle)
+            if handles:
+                break
+            time.sleep(_POLL_INTERVAL)
+        yield len(handles)
+    finally:
+        for handle in handles:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+            handle.close()
+
+
+def _run_in_slot(name: str, job: Callable[[], list[dict[str, Any]]], share: int) -> list[dict[str, Any]]:
+    with host_slots(share) as held:
+        _held.count = held
+        started = time.monotonic()
+        try:
+            return job()
+        finally:
+            del _held.count
+            logger.info("Scanner %s finished in %.2fs on %d slot(s)", name, time.monotonic() - started, held)
+
+
+def run_scanners(
+    jobs: Mapping[str, Callable[[], list[dict[str, Any]]]],
+    shares: Optional[Mapping[str, int]] = None,
+) -> dict[str, list[dict[str, Any]]]:
+    """Run independent scanner jobs in parallel and return their findings keyed by job name.
+
+    ``shares`` maps job names to the slots a multi-core scanner may use (default
+    1). A share is capped so every other job in the call still gets a slot.
+    Dependent steps (e.g. Syft then Grype) belong inside a single job so they chain
+    without waiting on unrelated scanners.
+    """
+    if not jobs:
+        return {}
+    ceiling = max(_host_slots() - (len(jobs) - 1), 1)
+    shares = {name: min(max((shares or {}).get(name, 1), 1), ceiling) for name in jobs}
+    if len(jobs) == 1:
+        name, job = next(iter(jobs.items()))
+        return {name: _run_in_slot(name, job, shares[name])}
+
+    with ThreadPoolExecutor(max_workers=len(jobs), thread_name_prefix="scanner") as pool:
+        futures = {name: pool.submit(_run_in_slot, name, job, shares[name]) for name, job in jobs.items()}
+        return {name: future.result() for name, future in futures.items()}
@@ -1,63 +1,104 @@
 from __future__ import annotations
 
-import json
 import logging
 import os
 import subprocess
+import tempfile
+from collections.abc import Iterator, Sequence
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional
+
+from .json_stream import iter_array_items
+from .scanner_pool import held_slots
 
 
 logger = logging.getLogger(__name__)
-_DEFAULT_CONFIG = Path(__file__).resolve().parents[2] / "scanners" / "semgrep" / "profiles.yml"
+_DEFAULT_CONFIG = Path(__file__).resolve().parents[3] / "scanners" / "semgrep" / "profiles.yml"
+
 
+class SemgrepError(RuntimeError):
+    """Raised when Semgrep could not produce a report, as opposed to finding nothing."""
 
-def run_semgrep(repo_dir: str) -> list[dict[str, Any]]:
+
+def semgrep_config_path() -> Path:
     config_override = os.getenv("SEMGREP_CONFIG_PATH")
-    config_path = Path(config_override) if config_override else _DEFAULT_CONFIG
+    return Path(config_override) if config_override else _DEFAULT_CONFIG
+
+
+def semgrep_slot_share() -> int:
+    """Scanner slots Semgrep may hold (``REMEDY_SEMGREP_SLOTS``, default CPU count)."""
+    default = max(os.cpu_count() or 1, 1)
+    try:
+        return max(int(os.getenv("REMEDY_SEMGREP_SLOTS", str(default))), 1)
+    except ValueError:
+        return default
+
+
+def _to_finding(item: dict[str, Any]) -> dict[str, Any]:
+    extra = item.get("extra", {}) or {}
+    metadata = extra.get("metadata") or {}
+    return {
+        "severity": str(extra.get("severity", "MEDIUM")).upper(),
+        "path": item.get("path") or "",
+        "line": (item.get("start") or {}).get("line"),
+        "rule_id": item.get("check_id"),
+        "message": extra.get("message") or metadata.get("short_message", ""),
+        "scanner": "semgrep",
+        "confidence": metadata.get("confidence"),
+    }
+
+
+def iter_semgrep_findings(repo_dir: str, targets: Optional[Sequence[str]] = None) -> Iterator[dict[str, Any]]:
+    """Run Semgrep over ``repo_dir``, or only over ``targets`` (paths relative to it) when given.
+
+    Semgrep writes its report to a temporary file that is parsed one result at a
+    time, so memory does not grow with the size of the report. Raises
+    ``SemgrepError`` when the binary is missing, exits with an error or writes
+    an unreadable report, so a failed run is never mistaken for a clean one.
+    ``--jobs`` matches the scanner slots the calling thread holds, so Semgrep
+    stays within the host CPU budget.
+    """
+    if targets is not None and not targets:
+        return
 
     cmd = [
         "semgrep",
         "--config",
-        str(config_path),
+        str(semgrep_config_path()),
         "--json",
+        "--jobs",
+        str(held_slots()),
         "--timeout",
         os.getenv("SEMGREP_TIMEOUT", "180"),
         "--quiet",
     ]
+    if targets is not None:
+        cmd.extend(["--", *targets])
 
-    try:
-        result = subprocess.run(
-            cmd,
-            cwd=repo_dir,
-            capture_output=True,
-            text=True,
-            check=False,
-        )
-    except FileNotFoundError:
-        logger.warning("Semgrep binary not found; skipping SAST scan")
-        return []
-
-    if result.returncode not in {0, 1}:
-        logger.warning("Semgrep failed (%s): %s", result.returncode, result.stderr.strip())
-        return []
+    with tempfile.TemporaryFile(mode="w+", encoding="utf-8") as output:
+        try:
+            result = subprocess.run(
+                cmd,
+                cwd=repo_dir,
+                stdout=output,
+                stderr=subprocess.PIPE,
+                text=True,
+                check=False,
+            )
+        except FileNotFoundError as exc:
+            raise SemgrepError("Semgrep binary not found") from exc
 
-    try:
-        payload = json.loads(result.stdout or "{}")
-    except json.JSONDecodeError:
-        logger.warning("Semgrep returned invalid JSON output")
-        return []
-
-    findings: list[dict[str, Any]] = []
-    for item in payload.get("results", []) or []:
-        extra = item.get("extra", {})
-        finding = {
-            "severity": str(extra.get("severity", "MEDIUM")).upper(),
-            "path": item.get("path") or "",
-            "line": (item.get("start") or {}).get("line"),
-            "rule_id": item.get("check_id"),
-            "message": extra.get("message") or extra.get("metadata", {}).get("short_message", ""),
-        }
-        findings.append(finding)
-
-    return findings
+        if result.returncode not in {0, 1}:
+            raise SemgrepError(f"Semgrep failed ({result.returncode}): {result.stderr.strip()}")
+
+        output.seek(0)
+        try:
+            for item in iter_array_items(output, "results"):
+                if isinstance(item, dict):
+                    yield _to_finding(item)
+        except ValueError as exc:
+            raise SemgrepError("Semgrep returned invalid JSON output") from exc
+
+
+def run_semgrep(repo_dir: str, targets: Optional[Sequence[str]] = None) -> list[dict[str, Any]]:
+    return list(iter_semgrep_findings(repo_dir, targets))
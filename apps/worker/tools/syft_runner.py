@@ -1,17 +1,253 @@
+"""Syft SBOM generation with an on-disk SBOM cache.
+
+SBOMs are keyed on the repository, the Syft version and a fingerprint of every
+file Syft catalogues, so Syft is skipped when no dependency file changed and
+Grype scans the cached SBOM directly. Cached SBOMs live under
+``REMEDY_SBOM_CACHE_DIR``, capped at ``REMEDY_SBOM_CACHE_MAX_ENTRIES``. Callers
+hand SBOMs back via ``release_sbom``, which only deletes uncached ones.
+"""
+
 from __future__ import annotations
 
+import fnmatch
+import hashlib
 import logging
 import os
 import subprocess
 import tempfile
+from functools import lru_cache
 from pathlib import Path
+from typing import Optional
 
 logger = logging.getLogger(__name__)
 
+_DEFAULT_CACHE_DIR = Path(tempfile.gettempdir()) / "remedy_sboms"
+
+# Files Syft reads to build the dependency inventory. When none of them change,
+# the SBOM for a directory is the same and the previous one can be reused.
+# Executables are checked separately (Go/Rust binaries carry build info).
+_DEPENDENCY_FILE_PATTERNS = (
+    "package.json",
+    "package-lock.json",
+    "npm-shrinkwrap.json",
+    "yarn.lock",
+    "pnpm-lock.yaml",
+    "requirements*.txt",
+    "Pipfile",
+    "Pipfile.lock",
+    "poetry.lock",
+    "pdm.lock",
+    "uv.lock",
+    "pyproject.toml",
+    "setup.py",
+    "setup.cfg",
+    "go.mod",
+    "go.sum",
+    "Cargo.toml",
+    "Cargo.lock",
+    "Gemfile",
+    "Gemfile.lock",
+    "*.gemspec",
+    "composer.json",
+    "composer.lock",
+    "pom.xml",
+    "build.gradle",
+    "build.gradle.kts",
+    "gradle.lockfile",
+    "packages.config",
+    "packages.lock.json",
+    "*.csproj",
+    "*.deps.json",
+    "mix.lock",
+    "pubspec.lock",
+    "Podfile.lock",
+    "Package.resolved",
+    "conan.lock",
+    "conanfile.txt",
+    "conanfile.py",
+    "environment.yml",
+    "environment.yaml",
+    "*.podspec",
+    "Podfile",
+    "rebar.lock",
+    "stack.yaml.lock",
+    "cabal.project.freeze",
+    "*.rockspec",
+    "*.jar",
+    "*.war",
+    "*.ear",
+    "*.par",
+    "*.sar",
+    "*.nar",
+    "*.jpi",
+    "*.hpi",
+    "*.whl",
+    "*.egg",
+    "*.exe",
+    "*.dll",
+)
+
+# Installed-package metadata, matched against the repo-relative path.
+_DEPENDENCY_PATH_PATTERNS = (
+    "*.dist-info/METADATA",
+    "*.dist-info/RECORD",
+    "*.egg-info/PKG-INFO",
+    "*.egg-info",
+    "conda-meta/*.json",
+    "*lib/apk/db/installed",
+    "*var/lib/dpkg/status",
+    "*var/lib/dpkg/status.d/*",
+    "*var/lib/rpm/*",
+    "*usr/lib/sysimage/rpm/*",
+)
+
+_BINARY_MAGIC = (b"\x7fELF", b"MZ", b"\xcf\xfa\xed\xfe", b"\xce\xfa\xed\xfe", b"\xca\xfe\xba\xbe")
+
+
+def sbom_cache_enabled() -> bool:
+    return os.getenv("REMEDY_SBOM_CACHE", "1").lower() not in {"0", "false", "no", "off"}
+
+
+def _cache_dir() -> Path:
+    path = Path(os.getenv("REMEDY_SBOM_CACHE_DIR", str(_DEFAULT_CACHE_DIR)))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _is_executable_binary(path: Path) -> bool:
+    try:
+        if not os.access(path, os.X_OK):
+            return False
+        with path.open("rb") as handle:
+            return handle.read(4).startswith(_BINARY_MAGIC)
+    except OSError:
+        return False
+
+
+def _is_dependency_file(path: Path, rel_path: str) -> bool:
+    if any(fnmatch.fnmatchcase(path.name, pattern) for pattern in _DEPENDENCY_FILE_PATTERNS):
+        return True
+    if any(fnmatch.fnmatchcase(rel_path, pattern) for pattern in _DEPENDENCY_PATH_PATTERNS):
+        return True
+    return _is_executable_binary(path)
+
+
+def dependency_fingerprint(repo_dir: str) -> Optional[str]:
+    """Hash the relative path and contents of every file Syft catalogues under ``repo_dir``.
+
+    Returns ``None`` when no such file exists, since then nothing distinguishes
+    one repository's inventory from another's.
+    """
+    root = Path(repo_dir)
+    digest = hashlib.sha256()
+    matched = False
+    for current, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if d != ".git")
+        for name in sorted(files):
+            path = Path(current) / name
+            rel_path = path.relative_to(root).as_posix()
+            if not _is_dependency_file(path, rel_path):
+                continue
+            matched = True
+            digest.update(rel_path.encode("utf-8") + b"\0")
+            try:
+                with path.open("rb") as handle:
+                    for chunk in iter(lambda: handle.read(1024 * 1024), b""):
+                        digest.update(chunk)
+            except OSError:
+                digest.update(b"<unreadable>")
+            digest.update(b"\0")
+    return digest.hexdigest() if matched else None
+
+
+@lru_cache(maxsize=1)
+def _syft_version() -> str:
+    try:
+        result = subprocess.run(["syft", "version"], capture_output=True, text=True, check=False)
+    except FileNotFoundError:
+        return ""
+    return result.stdout.strip()
+
 
-def generate_sbom(repo_dir: str) -> Path | None:
-    """Generate a Syft SBOM for the given repository, returning the file path."""
-    handle = tempfile.NamedTemporaryFile(delete=False, suffix=".json")
+def _evict_sboms(cache_dir: Path) -> None:
+    try:
+        max_entries = int(os.getenv("REMEDY_SBOM_CACHE_MAX_ENTRIES", "200"))
+    except ValueError:
+        max_entries = 200
+    entries: list[tuple[float, Path]] = []
+    for path in cache_dir.glob("*.json"):
+        try:
+            entries.append((path.stat().st_mtime, path))
+        except OSError:
+            continue  # evicted concurrently by another worker
+    entries.sort(reverse=True)
+    for _mtime, stale in entries[max(max_entries, 1):]:
+        stale.unlink(missing_ok=True)
+
+
+def store_cached_sbom(staged: Path, cache_path: Path) -> None:
+    """Atomically publish a fully written SBOM into the cache and trim old entries."""
+    os.replace(staged, cache_path)
+    _evict_sboms(cache_path.parent)
+
+
+def _origin_url(repo_dir: str) -> Optional[str]:
+    result = subprocess.run(
+        ["git", "config", "--get", "remote.origin.url"],
+        cwd=repo_dir,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if result.returncode != 0:
+        return None
+    return result.stdout.strip() or None
+
+
+def cached_sbom_path(repo_dir: str, repo_url: Optional[str] = None) -> Path | None:
+    """Return the cache slot for ``repo_dir``'s current dependency inventory.
+
+    The slot is scoped to the repository (``repo_url``, else the checkout's
+    ``origin``). There is no slot when the repository cannot be identified or
+    has no file Syft catalogues.
+    """
+    if not sbom_cache_enabled():
+        return None
+    identity = repo_url or _origin_url(repo_dir)
+    fingerprint = dependency_fingerprint(repo_dir) if identity else None
+    if fingerprint is None:
+        return None
+    key = hashlib.sha256(f"{identity}\0{_syft_version()}\0{fingerprint}".encode("utf-8"))
+    return _cache_dir() / f"{key.hexdigest()}.json"
+
+
+def is_cached_sbom(path: Path) -> bool:
+    return sbom_cache_enabled() and path.parent == _cache_dir()
+
+
+def release_sbom(path: Path) -> None:
+    """Delete a one-off SBOM once it has been scanned; cached SBOMs are kept."""
+    if not is_cached_sbom(path):
+        path.unlink(missing_ok=True)
+
+
+def generate_sbom(repo_dir: str, repo_url: Optional[str] = None) -> Path | None:
+    """Generate a Syft SBOM for the given repository, returning the file path.
+
+    When no manifest or lockfile changed since a previous run, the cached SBOM is
+    returned without invoking Syft. Pass the result to ``release_sbom`` when done.
+    """
+    cache_path = cached_sbom_path(repo_dir, repo_url)
+    if cache_path is not None and cache_path.is_file():
+        cache_path.touch()
+        logger.info("Reusing cached SBOM %s", cache_path.name)
+        return cache_path
+
+    handle = tempfile.NamedTemporaryFile(
+        delete=False,
+        suffix=".json.partial" if cache_path else ".json",
+        dir=cache_path.parent if cache_path else None,
+    )
     sbom_path = Path(handle.name)
     handle.close()
 
@@ -37,4 +273,8 @@ def generate_sbom(repo_dir: str) -> Path | None:
         return None
 
     sbom_path.write_text(result.stdout, encoding="utf-8")
-    return sbom_path
+    if cache_path is None:
+        return sbom_path
+
+    store_cached_sbom(sbom_path, cache_path)
+    return cache_path
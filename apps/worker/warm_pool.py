@@ -0,0 +1,103 @@
+"""Preforked pool of warm, in-process RQ workers.
+
+The supervisor imports the worker stack once (SQLAlchemy models, the Gemini
+SDK, Jinja prompt templates, the JWT/crypto stack) and then forks
+``SimpleWorker`` processes that run jobs in-process. Module state such as the
+DB engine pool, the GitHub HTTP session and the Gemini provider therefore
+survives from one job to the next instead of being rebuilt in a fresh
+work-horse per job. Each worker retires itself after ``max_jobs`` jobs or once
+its RSS passes ``max_rss_mb``, and the pool forks a fresh one from the warm
+supervisor.
+"""
+
+from __future__ import annotations
+
+import importlib
+import logging
+import os
+import resource
+from typing import Any, Optional
+
+from rq import SimpleWorker
+
+from .lanes import LaneWorkerMixin
+
+logger = logging.getLogger(__name__)
+
+# Imported in the supervisor so forked workers inherit them already initialised.
+PRELOAD_MODULES = (
+    "apps.worker.tasks",
+    "apps.worker.agent.orchestrator",
+    "apps.worker.agent.providers.gemini_client",
+    "apps.worker.tools.github_app",
+    "jwt.algorithms",
+    "cryptography.hazmat.primitives.asymmetric.rsa",
+)
+
+
+def preload() -> list[str]:
+    """Import the worker stack; returns the modules that were loaded."""
+    loaded = []
+    for name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError as exc:
+            logger.warning("Could not preload %s: %s", name, exc)
+            continue
+        loaded.append(name)
+    return loaded
+
+
+def rss_bytes() -> int:
+    """Current resident set size; falls back to the peak where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm", encoding="ascii") as handle:
+            return int(handle.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RecyclePolicy:
+    """Decides when a warm worker has done enough work to be replaced."""
+
+    def __init__(self, max_jobs: int, max_rss_mb: int) -> None:
+        self.max_jobs = max(int(max_jobs), 1)
+        self.max_rss_bytes = max(int(max_rss_mb), 1) * 1024 * 1024
+        self.completed = 0
+
+    @classmethod
+    def from_env(cls) -> "RecyclePolicy":
+        return cls(
+            max_jobs=int(os.getenv("REMEDY_WORKER_MAX_JOBS", "100")),
+            max_rss_mb=int(os.getenv("REMEDY_WORKER_MAX_RSS_MB", "1024")),
+        )
+
+    def record_job(self) -> Optional[str]:
+        """Count a finished job; return why the worker should retire, if it should."""
+        self.completed += 1
+        if self.completed >= self.max_jobs:
+            return f"{self.completed} jobs"
+        rss = rss_bytes()
+        if rss >= self.max_rss_bytes:
+            return f"RSS {rss // (1024 * 1024)} MB"
+        return None
+
+
+class WarmWorker(LaneWorkerMixin, SimpleWorker):
+    """In-process, lane-weighted RQ worker that retires itself per ``RecyclePolicy``."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.recycle_policy = RecyclePolicy.from_env()
+        # Pooled DB connections must not be shared with the supervisor across fork().
+        from apps.api.models.db import engine
+
+        engine.dispose(close=False)
+
+    def execute_job(self, job: Any, queue: Any) -> None:
+        super().execute_job(job, queue)
+        reason = self.recycle_policy.record_job()
+        if reason:
+            self.log.info("Worker %s: recycling after %s", self.name, reason)
+            # Checked before the next dequeue; the pool then forks a replacement.
+            self._stop_requested = True
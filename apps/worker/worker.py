@@ -2,7 +2,7 @@ import os
 import sys
 from pathlib import Path
 
-from rq import Worker, Queue
+from rq import Queue
 from redis import Redis
 
 # Ensure worker can resolve project modules when launched as a script
@@ -10,11 +10,30 @@ PROJECT_ROOT = Path(__file__).resolve().parents[2]
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
-listen = ['remedy']
+from apps.worker.lanes import LaneWorker, listen_queues  # noqa: E402
+
+listen = listen_queues()
 redis_url = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
 conn = Redis.from_url(redis_url)
 
+
+def run_pool(size: int) -> None:
+    """Supervise ``size`` preforked warm workers, replacing each one it retires."""
+    from rq.worker_pool import WorkerPool
+
+    from apps.worker.warm_pool import WarmWorker, preload
+
+    preload()
+    pool = WorkerPool(listen, connection=conn, num_workers=size, worker_class=WarmWorker)
+    pool.start()
+
+
 if __name__ == '__main__':
-    queues = [Queue(name, connection=conn) for name in listen]
-    worker = Worker(queues)
-    worker.work()
+    # REMEDY_WORKER_POOL_SIZE > 0 runs warm in-process workers; 0 keeps fork-per-job.
+    pool_size = int(os.getenv('REMEDY_WORKER_POOL_SIZE', '0'))
+    if pool_size > 0:
+        run_pool(pool_size)
+    else:
+        queues = [Queue(name, connection=conn) for name in listen]
+        worker = LaneWorker(queues)
+        worker.work()
@@ -0,0 +1,19 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0002_repo_metadata'
+down_revision = '0001_init'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('repos', sa.Column('full_name', sa.String, nullable=True))
+    op.add_column('repos', sa.Column('installation_id', sa.String, nullable=True))
+    op.add_column('repos', sa.Column('metadata_etag', sa.String, nullable=True))
+    op.add_column('repos', sa.Column('metadata_synced_at', sa.DateTime, nullable=True))
+
+def downgrade():
+    op.drop_column('repos', 'metadata_synced_at')
+    op.drop_column('repos', 'metadata_etag')
+    op.drop_column('repos', 'installation_id')
+    op.drop_column('repos', 'full_name')
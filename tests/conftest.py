@@ -67,12 +67,14 @@ def client(test_sessionmaker):
 
 @pytest.fixture()
 def queue_stub(monkeypatch):
-    jobs: list[tuple[tuple, dict]] = []
+    jobs: list[SimpleNamespace] = []
 
-    def enqueue(*args, **kwargs):
-        job_id = f"job-{uuid.uuid4().hex[:8]}"
-        jobs.append((args, kwargs))
-        return SimpleNamespace(id=job_id)
+    def submit(lane, func, args=(), kwargs=None, *, tenant, repo):
+        job = SimpleNamespace(
+            id=f"job-{uuid.uuid4().hex[:8]}", lane=lane, func=func, args=args, kwargs=kwargs, tenant=tenant, repo=repo
+        )
+        jobs.append(job)
+        return job
 
-    monkeypatch.setattr(scan_service, "q", SimpleNamespace(enqueue=enqueue))
+    monkeypatch.setattr(scan_service, "get_scheduler", lambda: SimpleNamespace(submit=submit))
     return jobs
@@ -22,7 +22,7 @@ def test_register_and_fetch_repo(client: TestClient):
     assert detail_resp.json()["url"] == body["url"]
 
 
-def test_create_scan_enqueues_jobs(client: TestClient, queue_stub):
+def test_create_scan_enqueues_single_multi_kind_job(client: TestClient, queue_stub):
     repo = client.post("/repos", json={"url": "https://github.com/example/api.git"}).json()
 
     resp = client.post(
@@ -32,8 +32,15 @@ def test_create_scan_enqueues_jobs(client: TestClient, queue_stub):
     assert resp.status_code == 202
     payload = resp.json()
     assert payload["repo_id"] == repo["id"]
-    assert len(payload["queued_jobs"]) == 2
-    assert len(queue_stub) == 2
+    assert len(payload["queued_jobs"]) == 1
+    assert len(queue_stub) == 1
+    job = queue_stub[0]
+    assert job.args == (repo["id"], ["sast", "sca"])
+    assert (job.lane, job.tenant, job.repo) == ("interactive", f"repo:{repo['id']}", repo["id"])
+
+    client.post("/scans", json={"repo_id": repo["id"], "lane": "bulk"})
+    assert queue_stub[1].lane == "bulk"
+    assert client.post("/scans", json={"repo_id": repo["id"], "lane": "webhook"}).status_code == 422
 
 
 def test_create_scan_missing_repo(client: TestClient):
@@ -48,3 +55,72 @@ def test_findings_endpoint_returns_empty_list(client: TestClient):
     resp = client.get("/findings")
     assert resp.status_code == 200
     assert resp.json() == []
+
+
+def test_push_webhook_passes_commit_range(db_session, queue_stub):
+    from apps.api.services.webhook_service import handle_github_event
+
+    payload = {
+        "before": "a" * 40,
+        "after": "b" * 40,
+        "ref": "refs/heads/feature",
+        "repository": {"clone_url": "https://github.com/example/hooks.git"},
+    }
+    result = handle_github_event(db_session, "push", payload)
+    assert result["status"] == "queued"
+    job = queue_stub[0]
+    assert job.kwargs == {"baseline_sha": "a" * 40, "head_sha": "b" * 40, "head_ref": "feature"}
+    assert job.lane == "webhook"
+
+
+def test_webhooks_refresh_cached_repo_metadata(db_session, queue_stub):
+    from apps.api.models.repo import Repo
+    from apps.api.services.webhook_service import handle_github_event
+
+    repository = {
+        "clone_url": "https://github.com/example/meta.git",
+        "full_name": "example/meta",
+        "default_branch": "main",
+    }
+    handle_github_event(
+        db_session,
+        "push",
+        {"after": "b" * 40, "repository": repository, "installation": {"id": 42}},
+    )
+    repo = db_session.query(Repo).filter(Repo.url == repository["clone_url"]).one()
+    assert (repo.default_branch, repo.full_name, repo.installation_id) == ("main", "example/meta", "42")
+    assert repo.metadata_synced_at is not None
+
+    result = handle_github_event(
+        db_session,
+        "repository",
+        {"action": "edited", "repository": {**repository, "default_branch": "trunk"}},
+    )
+    assert result == {"status": "updated", "repo_id": repo.id}
+    db_session.refresh(repo)
+    assert repo.default_branch == "trunk"
+    assert len(queue_stub) == 1
+    assert queue_stub[0].tenant == "installation:42"
+
+
+def test_api_import_stays_lean_and_fast():
+    import json
+    import os
+    import subprocess
+    import sys
+
+    probe = (
+        "import json, sys, time\n"
+        "started = time.perf_counter()\n"
+        "import apps.api.main\n"
+        "elapsed = time.perf_counter() - started\n"
+        "heavy = ('apps.worker', 'google.generativeai', 'jwt', 'requests', 'rq', 'redis', 'psycopg')\n"
+        "loaded = sorted(m for m in sys.modules if m.split('.')[0] in heavy or m.startswith('apps.worker'))\n"
+        "print(json.dumps({'elapsed': elapsed, 'loaded': loaded}))\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-c", probe], cwd=root, capture_output=True, text=True, check=True)
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert report["loaded"] == []
+    assert report["elapsed"] < float(os.getenv("REMEDY_API_IMPORT_BUDGET_SECONDS", "3"))
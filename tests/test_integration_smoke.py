@@ -19,8 +19,7 @@ def test_end_to_end_scan_flow(client: TestClient, monkeypatch):
         }
     ])
     monkeypatch.setattr(tasks, "run_osv", lambda repo_dir: [])
-    monkeypatch.setattr(tasks, "generate_sbom", lambda repo_dir: None)
-    monkeypatch.setattr(tasks, "run_grype", lambda path: [])
+    monkeypatch.setattr(tasks, "run_sbom_pipeline", lambda repo_dir, repo_url=None: [])
 
     def fake_prioritize(findings):
         first = findings[0]
@@ -47,7 +46,7 @@ def test_end_to_end_scan_flow(client: TestClient, monkeypatch):
     monkeypatch.setattr(
         tasks,
         "create_branch_and_pr",
-        lambda repo_dir, origin_url, plan: {
+        lambda repo_dir, origin_url, plan, **kwargs: {
             "branch": "remedy/fix-5678",
             "commit": "1234567",
             "pr_url": "https://github.com/example/app/pull/1",
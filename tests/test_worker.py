@@ -1,8 +1,11 @@
 from __future__ import annotations
 
+import contextlib
 import uuid
 from pathlib import Path
 
+import pytest
+
 from apps.api.models.repo import Repo
 from apps.api.models.scan import Scan
 from apps.api.models.finding import Finding
@@ -35,8 +38,7 @@ def test_run_scan_persists_findings(monkeypatch, test_sessionmaker):
         }
     ])
     monkeypatch.setattr(tasks, "run_osv", lambda repo_dir: [])
-    monkeypatch.setattr(tasks, "generate_sbom", lambda repo_dir: None)
-    monkeypatch.setattr(tasks, "run_grype", lambda sbom: [])
+    monkeypatch.setattr(tasks, "run_sbom_pipeline", lambda repo_dir, repo_url=None: [])
 
     def fake_prioritize(findings):
         first = findings[0]
@@ -67,7 +69,7 @@ def test_run_scan_persists_findings(monkeypatch, test_sessionmaker):
         "skipped": [],
         "diff": "diff --git a/app.js b/app.js",
     })
-    monkeypatch.setattr(tasks, "create_branch_and_pr", lambda repo_dir, origin_url, plan: {
+    monkeypatch.setattr(tasks, "create_branch_and_pr", lambda repo_dir, origin_url, plan, **kwargs: {
         "branch": "remedy/fix-1234",
         "commit": "abcdef1",
         "pr_url": None,
@@ -91,3 +93,1157 @@ def test_run_scan_persists_findings(monkeypatch, test_sessionmaker):
     assert findings[0].plan_json is not None
     assert len(prs) == 1
     assert prs[0].branch == "remedy/fix-1234"
+
+
+def _git(cwd: Path, *args: str) -> str:
+    import subprocess
+
+    result = subprocess.run(["git", *args], cwd=cwd, capture_output=True, text=True, check=True)
+    return result.stdout.strip()
+
+
+def test_mirror_cache_fetches_incrementally(monkeypatch, tmp_path):
+    from apps.worker.tools import repo_cache
+
+    monkeypatch.setenv("REMEDY_MIRROR_DIR", str(tmp_path / "mirrors"))
+    origin = tmp_path / "origin"
+    origin.mkdir()
+    _git(origin, "init", "-q", "-b", "main")
+    _git(origin, "config", "user.email", "dev@example.com")
+    _git(origin, "config", "user.name", "Dev")
+    (origin / "app.js").write_text("one\n")
+    _git(origin, "add", "-A")
+    _git(origin, "commit", "-q", "-m", "first")
+
+    first = tmp_path / "ws1"
+    repo_cache.materialize_workspace(str(origin), first)
+    assert (first / "app.js").read_text() == "one\n"
+    assert _git(first, "remote", "get-url", "origin") == str(origin)
+
+    (origin / "app.js").write_text("two\n")
+    _git(origin, "commit", "-q", "-am", "second")
+
+    second = tmp_path / "ws2"
+    repo_cache.materialize_workspace(str(origin), second)
+    assert (second / "app.js").read_text() == "two\n"
+    assert repo_cache.mirror_path(str(origin)).is_dir()
+
+    monkeypatch.setenv("REMEDY_MIRROR_BUDGET_MB", "0")
+    other = repo_cache.mirror_path("https://example.com/stale.git")
+    other.mkdir()
+    (other / "HEAD").write_text("ref: refs/heads/main\n")
+    evicted = repo_cache.evict_mirrors(keep=repo_cache.mirror_path(str(origin)))
+    assert evicted == [other]
+    assert repo_cache.mirror_path(str(origin)).is_dir()
+
+
+def test_run_scanners_overlaps_independent_jobs(monkeypatch, tmp_path):
+    import threading
+    import time
+
+    from apps.worker.tools.scanner_pool import run_scanners
+
+    monkeypatch.setenv("REMEDY_SCANNER_SLOT_DIR", str(tmp_path / "slots"))
+    monkeypatch.setenv("REMEDY_SCANNER_SLOTS", "2")
+    barrier = threading.Barrier(2, timeout=5)
+
+    def job(name):
+        def _run():
+            barrier.wait()  # deadlocks unless both jobs run at the same time
+            time.sleep(0.01)
+            return [{"rule_id": name}]
+
+        return _run
+
+    results = run_scanners({"osv": job("osv"), "syft+grype": job("grype")})
+    assert results == {"osv": [{"rule_id": "osv"}], "syft+grype": [{"rule_id": "grype"}]}
+
+    # Semgrep takes the rest of the budget and runs with a matching --jobs.
+    import subprocess
+
+    from apps.worker.tools import semgrep_runner
+
+    monkeypatch.setenv("REMEDY_SCANNER_SLOTS", "4")
+    commands: list[list[str]] = []
+
+    def fake_run(cmd, stdout=None, **kwargs):
+        commands.append(cmd)
+        stdout.write('{"results": []}')
+        return subprocess.CompletedProcess(cmd, 0, stderr="")
+
+    monkeypatch.setattr(semgrep_runner.subprocess, "run", fake_run)
+    barrier = threading.Barrier(2, timeout=5)
+
+    def semgrep_job():
+        barrier.wait()
+        return semgrep_runner.run_semgrep(str(tmp_path))
+
+    run_scanners({"sast/semgrep": semgrep_job, "sca/osv": job("osv")}, shares={"sast/semgrep": 16})
+    assert commands[0][commands[0].index("--jobs") + 1] == "3"
+
+
+def test_run_multi_scan_clones_once_and_records_each_kind(monkeypatch, test_sessionmaker):
+    session = test_sessionmaker()
+    try:
+        repo = Repo(id=str(uuid.uuid4()), name="demo", url="https://example.com/demo.git")
+        session.add(repo)
+        session.commit()
+        repo_id = repo.id
+    finally:
+        session.close()
+
+    clones: list[str] = []
+    monkeypatch.setattr(tasks, "_clone_repo", lambda url, dest: clones.append(url))
+    monkeypatch.setattr(tasks, "run_semgrep", lambda repo_dir: [
+        {"severity": "HIGH", "path": "app.js", "line": 3, "rule_id": "sast.rule", "message": "x"}
+    ])
+    monkeypatch.setattr(tasks, "run_osv", lambda repo_dir: [
+        {"severity": "HIGH", "path": "package-lock.json", "line": None, "rule_id": "GHSA-1", "message": "y"}
+    ])
+    monkeypatch.setattr(tasks, "run_sbom_pipeline", lambda repo_dir, repo_url=None: [])
+    monkeypatch.setattr(tasks, "prioritize_and_plan", lambda findings: [])
+
+    result = tasks.run_multi_scan(repo_id, ["sast", "sca"])
+
+    assert clones == ["https://example.com/demo.git"]
+    assert result["finding_count"] == 2
+    assert [s["kind"] for s in result["scans"]] == ["sast", "sca"]
+
+    verify = test_sessionmaker()
+    try:
+        scans = {scan.kind: scan for scan in verify.query(Scan).all()}
+    finally:
+        verify.close()
+    assert set(scans) == {"sast", "sca"}
+    assert scans["sast"].findings_json["items"][0]["rule_id"] == "sast.rule"
+    assert scans["sca"].findings_json["items"][0]["rule_id"] == "GHSA-1"
+
+
+def test_incremental_sast_chains_from_last_scanned_commit(monkeypatch, test_sessionmaker, tmp_path):
+    import shutil
+
+    origin = tmp_path / "origin"
+    origin.mkdir()
+    _git(origin, "init", "-q", "-b", "main")
+    _git(origin, "config", "user.email", "dev@example.com")
+    _git(origin, "config", "user.name", "Dev")
+    (origin / "a.js").write_text("a\n")
+    (origin / "b.js").write_text("b\n")
+    (origin / "c.js").write_text("c\n")
+    _git(origin, "add", "-A")
+    _git(origin, "commit", "-q", "-m", "base")
+    scanned = _git(origin, "rev-parse", "HEAD")
+    (origin / "a.js").write_text("a changed\n")
+    _git(origin, "commit", "-q", "-am", "change a")
+    baseline = _git(origin, "rev-parse", "HEAD")
+    (origin / "b.js").write_text("b changed\n")
+    _git(origin, "commit", "-q", "-am", "change b")
+    head = _git(origin, "rev-parse", "HEAD")
+
+    session = test_sessionmaker()
+    try:
+        repo = Repo(id=str(uuid.uuid4()), name="demo", url=str(origin))
+        session.add(repo)
+        # The last SAST scan predates the event's baseline, so a.js must be rescanned too.
+        base_scan = Scan(
+            id=str(uuid.uuid4()),
+            repo_id=repo.id,
+            kind="sast",
+            status="completed",
+            findings_json={
+                "mode": "full",
+                "commit_sha": scanned,
+                **tasks._sast_ruleset(),
+                "items": [
+                    {"finding_id": "old-a", "path": "a.js", "rule_id": "r1", "severity": "HIGH"},
+                    {"finding_id": "old-b", "path": "b.js", "rule_id": "r1", "severity": "HIGH"},
+                    {"finding_id": "old-c", "path": "c.js", "rule_id": "r1", "severity": "HIGH"},
+                ],
+            },
+        )
+        session.add(base_scan)
+        session.commit()
+        repo_id, base_scan_id = repo.id, base_scan.id
+    finally:
+        session.close()
+
+    def fake_clone(url: str, destination: Path):
+        shutil.rmtree(destination, ignore_errors=True)
+        shutil.copytree(url, destination)
+
+    seen_targets: list = []
+
+    def fake_semgrep(repo_dir, targets=None):
+        seen_targets.append(targets)
+        return [{"severity": "LOW", "path": "b.js", "line": 1, "rule_id": "r2", "message": "new"}]
+
+    pr_calls: list[dict] = []
+    monkeypatch.setattr(tasks, "_clone_repo", fake_clone)
+    monkeypatch.setattr(tasks, "run_semgrep", fake_semgrep)
+    monkeypatch.setattr(tasks, "prioritize_and_plan", lambda findings: [{"plan": {"edits": []}, "finding": {}}])
+    monkeypatch.setattr(tasks, "apply_patch_plan", lambda repo_dir, plans: {"touched": ["b.js"]})
+    monkeypatch.setattr(tasks, "_refresh_repo_metadata", lambda session, repo: None)
+    monkeypatch.setattr(tasks, "create_branch_and_pr", lambda *args, **kwargs: pr_calls.append(kwargs))
+
+    # A fork PR head has no branch here: scan it, but do not open a fix PR.
+    result = tasks.run_multi_scan(repo_id, ["sast"], baseline_sha=baseline, head_sha=head)
+
+    assert seen_targets == [["a.js", "b.js"]]
+    assert pr_calls == []
+    verify = test_sessionmaker()
+    try:
+        scan = verify.get(Scan, result["scans"][0]["scan_id"])
+        payload = scan.findings_json
+    finally:
+        verify.close()
+    assert payload["mode"] == "incremental"
+    assert payload["base_scan_id"] == base_scan_id
+    assert (payload["baseline_sha"], payload["commit_sha"]) == (scanned, head)
+    assert payload["changed_paths"] == ["a.js", "b.js"]
+    assert sorted((item["path"], item["rule_id"]) for item in payload["items"]) == [("b.js", "r2"), ("c.js", "r1")]
+
+    # The next scan chains from the incremental one; the fix PR targets the head's branch.
+    chained = tasks.run_multi_scan(repo_id, ["sast"], baseline_sha=baseline, head_sha=head, head_ref="feature")
+    assert seen_targets[-1] == []
+    assert pr_calls[0]["base_branch"] == "feature"
+
+    # A failed Semgrep run is stored as failed, so it never becomes the base.
+    def broken_semgrep(repo_dir, targets=None):
+        raise tasks.SemgrepError("Semgrep failed (2): bad rule")
+
+    monkeypatch.setattr(tasks, "run_semgrep", broken_semgrep)
+    failed = tasks.run_multi_scan(repo_id, ["sast"], baseline_sha=baseline, head_sha=head, head_ref="feature")
+    monkeypatch.setattr(tasks, "run_semgrep", fake_semgrep)
+    after_failure = tasks.run_multi_scan(repo_id, ["sast"], baseline_sha=baseline, head_sha=head, head_ref="feature")
+
+    # Findings carried under other rules are stale: a ruleset change forces a full scan.
+    monkeypatch.setattr(tasks, "_sast_ruleset", lambda: {"semgrep_version": "9.9.9", "rules_fingerprint": "new"})
+    tasks.run_multi_scan(repo_id, ["sast"], baseline_sha=baseline, head_sha=head, head_ref="feature")
+    assert seen_targets[-1] is None
+
+    verify = test_sessionmaker()
+    try:
+        failed_scan = verify.get(Scan, failed["scans"][0]["scan_id"])
+        assert failed_scan.status == "failed"
+        assert "bad rule" in failed_scan.findings_json["error"]
+        rescan = verify.get(Scan, after_failure["scans"][0]["scan_id"]).findings_json
+        assert rescan["base_scan_id"] == chained["scans"][0]["scan_id"]
+    finally:
+        verify.close()
+
+
+def test_result_cache_hit_skips_scanner_and_marks_scan(monkeypatch, test_sessionmaker):
+    from apps.worker.tools import result_cache
+
+    class MemoryCache:
+        def __init__(self):
+            self.store = {}
+
+        def get(self, key):
+            return self.store.get(key)
+
+        def set(self, key, value, ttl_seconds=None):
+            self.store[key] = value
+
+    monkeypatch.setattr(result_cache, "_cache", lambda cache=MemoryCache(): cache)
+    monkeypatch.setattr(tasks, "commit_sha", lambda repo_dir: "c0ffee")
+    monkeypatch.setattr(tasks, "result_cache_key", lambda url, sha, scanner, extra="": f"{url}:{sha}:{scanner}")
+
+    session = test_sessionmaker()
+    try:
+        repo = Repo(id=str(uuid.uuid4()), name="demo", url="https://example.com/demo.git")
+        session.add(repo)
+        session.commit()
+        repo_id = repo.id
+    finally:
+        session.close()
+
+    calls: list[str] = []
+
+    def fake_semgrep(repo_dir):
+        calls.append(repo_dir)
+        return [{"severity": "HIGH", "path": "app.js", "line": 1, "rule_id": "r", "message": "m"}]
+
+    monkeypatch.setattr(tasks, "_clone_repo", lambda url, dest: None)
+    monkeypatch.setattr(tasks, "run_semgrep", fake_semgrep)
+    monkeypatch.setattr(tasks, "prioritize_and_plan", lambda findings: [])
+
+    first = tasks.run_scan(repo_id, "sast")
+    second = tasks.run_scan(repo_id, "sast")
+
+    assert len(calls) == 1
+    assert second["finding_count"] == 1
+    verify = test_sessionmaker()
+    try:
+        first_scan = verify.get(Scan, first["scan_id"])
+        second_scan = verify.get(Scan, second["scan_id"])
+    finally:
+        verify.close()
+    assert first_scan.findings_json["cached"] is False
+    assert second_scan.findings_json["cached"] is True
+    assert second_scan.status == "completed"
+
+
+def test_result_cache_stores_repo_relative_paths_with_short_sca_ttl(monkeypatch):
+    from apps.worker.tools import result_cache
+
+    stored: dict[str, tuple] = {}
+
+    class MemoryCache:
+        def get(self, key):
+            return stored.get(key, (None,))[0]
+
+        def set(self, key, value, ttl_seconds=None):
+            stored[key] = (value, ttl_seconds)
+
+    monkeypatch.setattr(result_cache, "_cache", lambda cache=MemoryCache(): cache)
+    monkeypatch.setattr(tasks, "result_cache_key", lambda url, sha, scanner, extra="": f"{sha}:{scanner}")
+
+    def osv_job(repo_dir):
+        return lambda: [{"package": "lodash", "path": f"{repo_dir}/package-lock.json", "rule_id": "GHSA-1"}]
+
+    hits: dict[str, bool] = {}
+    first = tasks._with_result_cache(osv_job("/tmp/remedy_a"), "/tmp/remedy_a", "url", "sha", "osv", "", hits)()
+    second = tasks._with_result_cache(osv_job("/tmp/remedy_b"), "/tmp/remedy_b", "url", "sha", "osv", "", hits)()
+
+    assert hits == {"osv": True}
+    assert first == second
+    assert second[0]["path"] == "package-lock.json"
+    assert stored["sha:osv"][1] == 6 * 3600
+    assert result_cache.result_ttl("semgrep") is None
+
+
+def test_generate_sbom_reuses_cache_until_lockfile_changes(monkeypatch, tmp_path):
+    import subprocess
+
+    from apps.worker.tools import syft_runner
+
+    monkeypatch.setenv("REMEDY_SBOM_CACHE_DIR", str(tmp_path / "sboms"))
+    repo_dir = tmp_path / "repo"
+    repo_dir.mkdir()
+    (repo_dir / "package-lock.json").write_text('{"lockfileVersion": 3}')
+    (repo_dir / "app.js").write_text("console.log(1)\n")
+
+    runs: list[list[str]] = []
+
+    def fake_run(cmd, **kwargs):
+        runs.append(cmd)
+        if cmd[:2] == ["syft", "version"]:
+            return subprocess.CompletedProcess(cmd, 0, stdout="syft 1.0.0\n", stderr="")
+        return subprocess.CompletedProcess(cmd, 0, stdout='{"artifacts": []}', stderr="")
+
+    monkeypatch.setattr(syft_runner.subprocess, "run", fake_run)
+    syft_runner._syft_version.cache_clear()
+
+    url = "https://github.com/example/sbom.git"
+    first = syft_runner.generate_sbom(str(repo_dir), url)
+    (repo_dir / "app.js").write_text("console.log(2)\n")
+    second = syft_runner.generate_sbom(str(repo_dir), url)
+    assert first == second
+    assert syft_runner.is_cached_sbom(second)
+    syft_runner.release_sbom(second)
+    assert second.is_file()
+
+    (repo_dir / "package-lock.json").write_text('{"lockfileVersion": 3, "packages": {}}')
+    third = syft_runner.generate_sbom(str(repo_dir), url)
+    assert third != first
+    assert sum(1 for cmd in runs if cmd[0] == "syft" and cmd[1].startswith("dir:")) == 2
+
+    # Identical inventories in different repos never share a slot.
+    assert syft_runner.cached_sbom_path(str(repo_dir), "https://github.com/example/other.git") != third
+
+    # Without a catalogued file there is nothing to key on, so nothing is cached.
+    bare = tmp_path / "bare"
+    bare.mkdir()
+    (bare / "main.c").write_text("int main(void) { return 0; }\n")
+    assert syft_runner.cached_sbom_path(str(bare), url) is None
+    (bare / "tool").write_bytes(b"\x7fELF\x02\x01\x01" + b"\0" * 32)
+    (bare / "tool").chmod(0o755)
+    (bare / "site" / "requests-2.0.dist-info").mkdir(parents=True)
+    (bare / "site" / "requests-2.0.dist-info" / "METADATA").write_text("Name: requests\n")
+    assert syft_runner.cached_sbom_path(str(bare), url) is not None
+    syft_runner._syft_version.cache_clear()
+
+
+def test_iter_array_items_streams_across_chunk_boundaries():
+    import io
+    import json
+
+    from apps.worker.tools import json_stream
+
+    report = {
+        "errors": [{"results": "not this one"}],
+        "version": 1.25,
+        "results": [{"check_id": f"rule-{i}", "extra": {"message": "x" * (i * 7)}} for i in range(50)] + [12345],
+        "paths": {"scanned": ["a.js"]},
+    }
+    items = list(json_stream.iter_array_items(io.StringIO(json.dumps(report)), "results"))
+    assert items == report["results"]
+    assert list(json_stream.iter_array_items(io.StringIO('{"results": []}'), "results")) == []
+    assert list(json_stream.iter_array_items(io.StringIO('{"matches": null}'), "matches")) == []
+
+    small_chunks = json_stream.iter_array_items(io.StringIO(json.dumps(report)), "results", chunk_size=16)
+    assert list(small_chunks) == report["results"]
+
+
+def test_sbom_pipeline_pipes_syft_into_grype_and_caches_sbom(monkeypatch, tmp_path):
+    import json
+
+    from apps.worker.tools import sca_pipeline, syft_runner
+
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    received = tmp_path / "grype-stdin.json"
+    report = {
+        "matches": [
+            {
+                "vulnerability": {"id": "CVE-2024-0001", "severity": "High", "description": "bad"},
+                "artifact": {"name": "lodash", "version": "4.17.0", "locations": [{"path": "/package-lock.json"}]},
+            }
+        ]
+    }
+    (bin_dir / "syft").write_text(
+        "#!/bin/sh\n"
+        "if [ \"$1\" = version ]; then echo 'syft 1.0.0'; exit 0; fi\n"
+        "echo '{\"artifacts\": [{\"name\": \"lodash\"}]}'\n"
+    )
+    (bin_dir / "grype").write_text(f"#!/bin/sh\ncat > {received}\necho '{json.dumps(report)}'\n")
+    for tool in ("syft", "grype"):
+        (bin_dir / tool).chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}:{__import__('os').environ['PATH']}")
+    monkeypatch.setenv("REMEDY_SBOM_CACHE_DIR", str(tmp_path / "sboms"))
+    syft_runner._syft_version.cache_clear()
+
+    repo_dir = tmp_path / "repo"
+    repo_dir.mkdir()
+    (repo_dir / "package-lock.json").write_text("{}")
+
+    url = "https://github.com/example/pipe.git"
+    findings = sca_pipeline.run_sbom_pipeline(str(repo_dir), url)
+
+    assert [f["rule_id"] for f in findings] == ["CVE-2024-0001"]
+    assert json.loads(received.read_text()) == {"artifacts": [{"name": "lodash"}]}
+    cached = syft_runner.cached_sbom_path(str(repo_dir), url)
+    assert cached.read_text() == received.read_text()
+    syft_runner._syft_version.cache_clear()
+
+
+def test_merge_findings_collapses_osv_and_grype_duplicates():
+    from apps.worker.tools.dedupe import merge_findings
+
+    osv = {
+        "severity": "CVSS:3.1/AV:N/AC:L",
+        "path": "/tmp/remedy_x/web/package-lock.json",
+        "rule_id": "GHSA-jf85-cpcp-j695",
+        "message": "Prototype pollution",
+        "scanner": "osv",
+        "aliases": ["CVE-2019-10744"],
+        "package": "lodash",
+        "version": "4.17.11",
+    }
+    grype = {
+        "severity": "CRITICAL",
+        "path": "/web/package-lock.json",
+        "rule_id": "CVE-2019-10744",
+        "message": "",
+        "scanner": "grype",
+        "aliases": [],
+        "package": "lodash",
+        "version": "4.17.11",
+    }
+    other_version = dict(grype, version="4.17.21", rule_id="CVE-2021-23337")
+
+    merged = merge_findings([osv, grype, other_version], repo_dir="/tmp/remedy_x")
+
+    assert len(merged) == 2
+    lodash = next(item for item in merged if item["version"] == "4.17.11")
+    assert lodash["severity"] == "CRITICAL"
+    assert lodash["path"] == "web/package-lock.json"
+    assert lodash["message"] == "Prototype pollution"
+    assert lodash["aliases"] == ["GHSA-JF85-CPCP-J695"]
+    assert [source["scanner"] for source in lodash["sources"]] == ["osv", "grype"]
+    assert merge_findings([osv, grype], "/tmp/remedy_x")[0]["fingerprint"] == lodash["fingerprint"]
+
+
+def test_prioritize_and_plan_runs_plans_concurrently_and_drops_late_ones(monkeypatch):
+    import json
+    import time
+
+    from apps.worker.agent import orchestrator
+
+    findings = [{"finding_id": f"f{i}", "severity": "HIGH", "path": f"app{i}.js"} for i in range(3)]
+    delays = {"f0": 0.2, "f1": 0.2, "f2": 2.0}
+
+    def fake_complete(prompt: str, **_kwargs) -> str:
+        if "ordered_findings" in prompt:
+            return json.dumps({"ordered_findings": [{"finding_id": f["finding_id"]} for f in findings]})
+        finding_id = next(fid for fid in delays if f'"finding_id": "{fid}"' in prompt)
+        time.sleep(delays[finding_id])
+        return json.dumps({"finding_id": finding_id, "edits": []})
+
+    monkeypatch.setattr(orchestrator, "gemini_complete", fake_complete)
+    monkeypatch.setenv("REMEDY_PLAN_DEADLINE_SECONDS", "1")
+
+    started = time.monotonic()
+    plans = orchestrator.prioritize_and_plan(findings)
+    elapsed = time.monotonic() - started
+
+    assert [bundle["plan"]["finding_id"] for bundle in plans] == ["f0", "f1"]
+    assert elapsed < 1.5
+
+
+def test_related_findings_are_planned_in_one_batched_call(monkeypatch):
+    import json
+
+    from apps.worker.agent import orchestrator
+
+    findings = [
+        {"finding_id": "s1", "severity": "CRITICAL", "path": "config.py", "rule_id": "secret", "line": 3},
+        {"finding_id": "x1", "severity": "HIGH", "path": "a.js", "rule_id": "xss"},
+        {"finding_id": "s2", "severity": "CRITICAL", "path": "config.py", "rule_id": "secret", "line": 9},
+        {"finding_id": "x2", "severity": "HIGH", "path": "b.js", "rule_id": "xss"},
+        {"finding_id": "y1", "severity": "MEDIUM", "path": "c.js", "rule_id": "sqli"},
+    ]
+    plan_calls: list[list[str]] = []
+
+    def fake_complete(prompt: str, **kwargs) -> str:
+        if "ordered_findings" in prompt:
+            return json.dumps({"ordered_findings": [{"finding_id": f["finding_id"]} for f in findings]})
+        ids = [fid for fid in ("s1", "s2", "x1", "x2", "y1") if f'"finding_id": "{fid}"' in prompt]
+        plan_calls.append(ids)
+        edit = {"path": "x", "replace": "y"}
+        if kwargs["template_version"].startswith("plan_batch.j2"):
+            plans = [{"finding_id": fid, "edits": [edit]} for fid in ids]
+            if "s2" in ids:
+                plans[ids.index("s2")]["edits"] = "not a list"
+            return json.dumps({"plans": plans})
+        return json.dumps({"finding_id": ids[0], "edits": [edit, "junk"]})
+
+    monkeypatch.setattr(orchestrator, "gemini_complete", fake_complete)
+    monkeypatch.setenv("REMEDY_MAX_PLANS", "5")
+
+    plans = orchestrator.prioritize_and_plan(findings)
+
+    assert sorted(plan_calls) == [["s1", "s2"], ["x1", "x2"], ["y1"]]
+    assert [bundle["plan"]["finding_id"] for bundle in plans] == ["s1", "x1", "x2", "y1"]
+    assert all(bundle["plan"]["edits"] == [{"path": "x", "replace": "y"}] for bundle in plans)
+
+
+def test_apply_patch_plan_batches_edits_per_file_and_detects_conflicts(monkeypatch, tmp_path):
+    from apps.worker.tools import patch_apply
+
+    _git(tmp_path, "init", "-q")
+    _git(tmp_path, "config", "user.email", "dev@example.com")
+    _git(tmp_path, "config", "user.name", "Dev")
+    (tmp_path / "config.py").write_text('KEY = "abc"\nTOKEN = "xyz"\nDEBUG = True\n')
+    (tmp_path / "other.py").write_text("x = 1\n")
+    _git(tmp_path, "add", "-A")
+    _git(tmp_path, "commit", "-q", "-m", "base")
+    (tmp_path / "other.py").write_text("x = 2\n")  # unrelated local change
+
+    writes: list[str] = []
+    original_write = Path.write_text
+
+    def recording_write(self, *args, **kwargs):
+        writes.append(self.name)
+        return original_write(self, *args, **kwargs)
+
+    monkeypatch.setattr(Path, "write_text", recording_write)
+
+    plan = [
+        {"edits": [{"path": "config.py", "match": '"abc"', "replace": 'os.environ["KEY"]'}]},
+        {"edits": [
+            {"path": "config.py", "regex": r'^TOKEN = "(\w+)"$', "replace": r'TOKEN = os.environ["TOKEN"]  # was \1'},
+            {"path": "config.py", "match": 'environ["KEY"]', "replace": 'getenv("KEY")'},
+            {"path": "config.py", "match": "DEBUG = True", "replace": "DEBUG = False"},
+        ]},
+    ]
+    result = patch_apply.apply_patch_plan(str(tmp_path), plan)
+
+    assert writes == ["config.py"]
+    assert result["touched"] == ["config.py"]
+    assert result["skipped"] == [{"path": "config.py", "reason": "conflict"}]
+    assert (tmp_path / "config.py").read_text() == (
+        'KEY = os.environ["KEY"]\nTOKEN = os.environ["TOKEN"]  # was xyz\nDEBUG = False\n'
+    )
+    assert "config.py" in result["diff"] and "other.py" not in result["diff"]
+
+
+def test_catastrophic_patch_regex_is_skipped_within_budget(monkeypatch, tmp_path):
+    import threading
+    import time
+
+    from apps.worker.tools import patch_apply, safe_regex
+
+    # Force the backtracking engine even when google-re2 is installed.
+    monkeypatch.setattr(safe_regex, "_compile_re2", lambda pattern: None)
+    monkeypatch.setenv("REMEDY_REGEX_BUDGET_SECONDS", "0.2")
+    (tmp_path / "big.txt").write_text("a" * 40 + "b\nDEBUG = True\n")
+    plan = [{"edits": [
+        {"path": "big.txt", "regex": r"(a+)+$", "replace": "x"},
+        {"path": "big.txt", "match": "DEBUG = True", "replace": "DEBUG = False"},
+    ]}]
+
+    started = time.monotonic()
+    result = patch_apply.apply_patch_plan(str(tmp_path), plan)
+    assert time.monotonic() - started < 2
+    assert result["skipped"] == [{"path": "big.txt", "reason": "regex_timeout"}]
+    assert result["touched"] == ["big.txt"]
+
+    # Off the main thread SIGALRM is unavailable; the forked matcher is killed instead.
+    outcome: list = []
+    worker = threading.Thread(
+        target=lambda: outcome.append(
+            patch_apply._apply_edit("a" * 40 + "b", {"regex": r"(a+)+$", "replace": "x"}, [])[2]
+        )
+    )
+    worker.start()
+    worker.join(timeout=5)
+    assert outcome == ["regex_timeout"]
+
+
+def test_patch_regex_keeps_unicode_semantics_on_non_ascii_text():
+    from apps.worker.tools import patch_apply
+
+    # RE2's \w is ASCII-only; these must match the way Python's re does.
+    edit = {"regex": r"\w+=1", "replace": "safe=2"}
+    assert patch_apply._apply_edit("naïve_key=1\n", edit, [])[0] == "safe=2\n"
+    edit = {"regex": r"^(\w+)=1$", "replace": r"\1=2"}
+    assert patch_apply._apply_edit("clé=1\n", edit, [])[0] == "clé=2\n"
+
+
+def test_gemini_complete_caches_valid_json_but_not_fallbacks(monkeypatch):
+    from types import SimpleNamespace
+
+    from apps.worker.agent.providers import gemini_client
+
+    store: dict = {}
+    monkeypatch.setattr(
+        gemini_client,
+        "_response_cache",
+        lambda: SimpleNamespace(get=store.get, set=lambda key, value: store.__setitem__(key, value)),
+    )
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+
+    calls: list[str] = []
+    replies = iter([RuntimeError("quota"), '{"ordered_findings": [', '{"ordered_findings": []}'])
+
+    def generate_content(prompt, **_kwargs):
+        calls.append(prompt)
+        reply = next(replies)
+        if isinstance(reply, Exception):
+            raise reply
+        return SimpleNamespace(text=reply)
+
+    fake_genai = SimpleNamespace(
+        configure=lambda api_key: None,
+        GenerativeModel=lambda name: SimpleNamespace(generate_content=generate_content),
+    )
+    monkeypatch.setattr(gemini_client, "genai", fake_genai)
+    gemini_client.get_provider.cache_clear()
+
+    assert gemini_client.gemini_complete("prompt", template_version="v1") == "[]"
+    assert store == {}
+    # A truncated reply is passed on for the caller to reject, but not cached.
+    assert gemini_client.gemini_complete("prompt", template_version="v1") == '{"ordered_findings": ['
+    assert store == {}
+    assert gemini_client.gemini_complete("prompt", template_version="v1") == '{"ordered_findings": []}'
+    assert gemini_client.gemini_complete("prompt", template_version="v1") == '{"ordered_findings": []}'
+    assert len(calls) == 3
+    assert len(store) == 1
+
+
+def test_gemini_provider_is_reused_and_requests_json_with_retries(monkeypatch):
+    from types import SimpleNamespace
+
+    from google.api_core import exceptions as google_exceptions
+
+    from apps.worker.agent.providers import gemini_client
+
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    monkeypatch.setenv("GEMINI_MODEL", "gemini-test")
+    monkeypatch.setenv("GEMINI_TIMEOUT", "7")
+    monkeypatch.setenv("GEMINI_MAX_RETRIES", "1")
+    monkeypatch.setenv("REMEDY_LLM_CACHE", "0")
+    monkeypatch.setattr(gemini_client.time, "sleep", lambda _seconds: None)
+
+    configured: list[str] = []
+    models: list[str] = []
+    requests: list[dict] = []
+    replies = iter([google_exceptions.ServiceUnavailable("busy"), '{"a": 1}', '{"b": 2}'])
+
+    def generate_content(prompt, **kwargs):
+        requests.append(kwargs)
+        reply = next(replies)
+        if isinstance(reply, Exception):
+            raise reply
+        return SimpleNamespace(text=reply)
+
+    def make_model(name):
+        models.append(name)
+        return SimpleNamespace(generate_content=generate_content)
+
+    fake_genai = SimpleNamespace(configure=lambda api_key: configured.append(api_key), GenerativeModel=make_model)
+    monkeypatch.setattr(gemini_client, "genai", fake_genai)
+    gemini_client.get_provider.cache_clear()
+
+    schema = {"type": "object", "properties": {"a": {"type": "integer"}}}
+    assert gemini_client.gemini_complete("one", response_schema=schema) == '{"a": 1}'
+    assert gemini_client.gemini_complete("two") == '{"b": 2}'
+
+    assert configured == ["test-key"]
+    assert models == ["gemini-test"]
+    assert len(requests) == 3
+    assert requests[0]["generation_config"] == {"response_mime_type": "application/json", "response_schema": schema}
+    assert requests[2]["generation_config"] == {"response_mime_type": "application/json"}
+    assert all(request["request_options"] == {"timeout": 7.0} for request in requests)
+    gemini_client.get_provider.cache_clear()
+
+
+def test_llm_rate_limiter_waits_for_capacity_and_surfaces_exhaustion(monkeypatch):
+    from types import SimpleNamespace
+
+    from apps.worker.agent.providers import gemini_client
+    from apps.worker.tools import rate_limit
+
+    sleeps: list[float] = []
+    monkeypatch.setattr(rate_limit.time, "sleep", sleeps.append)
+    monkeypatch.setattr(rate_limit.random, "uniform", lambda _a, _b: 0.0)
+
+    limiter = rate_limit.TokenBucketLimiter("test", requests_per_minute=10, tokens_per_minute=1000)
+    replies = iter([-1, 250, 0])
+    calls: list[tuple] = []
+
+    def evaluate(waiter, score, tokens):
+        calls.append((waiter, score, tokens))
+        return next(replies)
+
+    monkeypatch.setattr(limiter, "_evaluate", evaluate)
+    limiter.acquire(120, priority=rate_limit.PRIORITY_HIGH)
+
+    assert sleeps == [rate_limit._POLL_SECONDS, 0.25]
+    assert len({waiter for waiter, _score, _tokens in calls}) == 1  # one queue position throughout
+    assert calls[0][1] < rate_limit.PRIORITY_NORMAL * rate_limit._PRIORITY_STRIDE
+
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    monkeypatch.setenv("REMEDY_LLM_CACHE", "0")
+    monkeypatch.setenv("REMEDY_LLM_MAX_WAIT_SECONDS", "0")
+    starved = rate_limit.TokenBucketLimiter("starved", requests_per_minute=1, tokens_per_minute=1)
+    monkeypatch.setattr(starved, "_evaluate", lambda *_args: 60000)
+    monkeypatch.setattr(starved, "_withdraw", lambda _waiter: None)
+    monkeypatch.setattr(gemini_client, "_limiter", lambda _model: starved)
+    monkeypatch.setattr(gemini_client, "get_provider", lambda _settings: SimpleNamespace(
+        generate_json=lambda *_args: pytest.fail("provider called without capacity")
+    ))
+
+    with pytest.raises(gemini_client.LLMUnavailableError):
+        gemini_client.gemini_complete("prompt")
+
+
+def test_open_gemini_breaker_fails_before_waiting_for_rate_limit(monkeypatch):
+    from apps.worker.agent.providers import gemini_client
+    from apps.worker.tools import circuit_breaker
+
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    monkeypatch.setenv("REMEDY_LLM_CACHE", "0")
+    breaker = circuit_breaker.CircuitBreaker("gemini", connection=object())
+    breaker._open_until = float("inf")
+    monkeypatch.setattr(gemini_client, "get_breaker", lambda name, slow: breaker)
+    monkeypatch.setattr(gemini_client, "_limiter", lambda _model: pytest.fail("limiter used while circuit open"))
+
+    with pytest.raises(gemini_client.LLMUnavailableError) as excinfo:
+        gemini_client.gemini_complete("prompt")
+    assert excinfo.value.reason == "circuit_open"
+
+
+def test_run_multi_scan_keeps_findings_when_llm_is_rate_limited(monkeypatch, test_sessionmaker):
+    from apps.worker.agent.providers.gemini_client import LLMUnavailableError
+
+    session = test_sessionmaker()
+    try:
+        repo = Repo(id=str(uuid.uuid4()), name="demo", url="https://example.com/demo.git")
+        session.add(repo)
+        session.commit()
+        repo_id = repo.id
+    finally:
+        session.close()
+
+    def throttled(_findings):
+        raise LLMUnavailableError("quota")
+
+    monkeypatch.setattr(tasks, "_clone_repo", lambda url, dest: None)
+    monkeypatch.setattr(tasks, "run_semgrep", lambda repo_dir: [
+        {"severity": "HIGH", "path": "app.js", "line": 3, "rule_id": "sast.rule", "message": "x"}
+    ])
+    monkeypatch.setattr(tasks, "prioritize_and_plan", throttled)
+
+    result = tasks.run_multi_scan(repo_id, ["sast"])
+
+    assert result["remediation"] == "rate_limited"
+    verify = test_sessionmaker()
+    try:
+        scan = verify.query(Scan).one()
+    finally:
+        verify.close()
+    assert scan.status == "completed"
+    assert scan.findings_json["items"][0]["rule_id"] == "sast.rule"
+    assert scan.findings_json["remediation"]["status"] == "rate_limited"
+
+
+def test_circuit_breaker_trips_fails_fast_and_recovers_via_probe(monkeypatch):
+    from types import SimpleNamespace
+
+    from apps.worker.tools import circuit_breaker, github_app
+
+    class FakeRedis:
+        def __init__(self):
+            self.values: dict = {}
+
+        def mget(self, *names):
+            return [self.values.get(name) for name in names]
+
+        def set(self, name, value, nx=False, px=None, ex=None):
+            if nx and name in self.values:
+                return None
+            self.values[name] = value
+            return True
+
+        def delete(self, *names):
+            for name in names:
+                self.values.pop(name, None)
+
+        def incr(self, name):
+            self.values[name] = int(self.values.get(name, 0)) + 1
+            return self.values[name]
+
+        def expire(self, name, seconds):
+            return True
+
+    redis = FakeRedis()
+    breaker = circuit_breaker.CircuitBreaker("github", failure_threshold=2, reset_seconds=30, connection=redis)
+    monkeypatch.setattr(github_app, "get_breaker", lambda name, slow: breaker)
+
+    calls: list[str] = []
+
+    def fake_request(method, url, **kwargs):
+        calls.append(url)
+        return SimpleNamespace(status_code=503)
+
+    monkeypatch.setattr(github_app, "_session", lambda: SimpleNamespace(request=fake_request))
+
+    assert github_app.fetch_default_branch("token", "org/repo") is None
+    assert github_app.fetch_default_branch("token", "org/repo") is None
+    assert github_app.fetch_default_branch("token", "org/repo") is None
+    assert len(calls) == 2  # third call failed fast without touching the network
+
+    # The open period lapses (key expiry) and another worker's cached view is stale.
+    redis.delete(breaker._open_key)
+    breaker._open_until = 0.0
+    monkeypatch.setattr(github_app, "_session", lambda: SimpleNamespace(
+        request=lambda method, url, **kwargs: SimpleNamespace(
+            status_code=200, headers={}, json=lambda: {"default_branch": "main"}
+        ),
+    ))
+    redis.set(breaker._probe_key, "1")  # another worker is probing
+    with pytest.raises(circuit_breaker.CircuitOpenError):
+        with breaker.guard():
+            pass
+    redis.delete(breaker._probe_key)
+
+    assert github_app.fetch_default_branch("token", "org/repo") == "main"
+    assert redis.values == {}
+
+
+def test_installation_token_is_cached_until_shortly_before_expiry(monkeypatch):
+    from datetime import datetime, timedelta, timezone
+    from types import SimpleNamespace
+
+    from apps.worker.tools import github_app
+
+    session = github_app._session()
+    assert session is github_app._session()
+    assert session.get_adapter("https://api.github.com").max_retries.total >= 1
+
+    monkeypatch.setattr(github_app, "_TOKEN_CACHE", {})
+    monkeypatch.setattr(github_app, "_build_jwt", lambda config: "jwt")
+    monkeypatch.setattr(github_app, "get_breaker", lambda name, slow: SimpleNamespace(guard=contextlib.nullcontext))
+    lifetimes = iter([timedelta(hours=1), timedelta(minutes=2), timedelta(hours=1)])
+    posts: list[str] = []
+
+    def fake_request(method, url, **kwargs):
+        posts.append(kwargs["headers"]["Authorization"])
+        expires = datetime.now(timezone.utc) + next(lifetimes)
+        return SimpleNamespace(
+            status_code=201,
+            json=lambda: {"token": f"tok{len(posts)}", "expires_at": expires.strftime("%Y-%m-%dT%H:%M:%SZ")},
+        )
+
+    monkeypatch.setattr(github_app, "_session", lambda: SimpleNamespace(request=fake_request))
+    config = github_app.GitHubAuthConfig(app_id="1", installation_id="2", private_key_b64="")
+
+    assert github_app.get_installation_token(config) == "tok1"
+    assert github_app.get_installation_token(config) == "tok1"
+    github_app._TOKEN_CACHE.clear()
+    assert github_app.get_installation_token(config) == "tok2"  # expires inside the refresh margin
+    assert github_app.get_installation_token(config) == "tok3"
+    assert posts == ["Bearer jwt"] * 3
+
+
+def test_create_branch_and_pr_commits_through_git_data_api(monkeypatch, tmp_path):
+    from apps.worker.tools import git_tool
+
+    _git(tmp_path, "init", "-q")
+    _git(tmp_path, "config", "user.email", "dev@example.com")
+    _git(tmp_path, "config", "user.name", "Dev")
+    (tmp_path / "app.py").write_text("DEBUG = True\n")
+    (tmp_path / "run.sh").write_text("echo hi\n")
+    (tmp_path / "run.sh").chmod(0o755)
+    (tmp_path / "untouched.txt").write_text("same\n")
+    _git(tmp_path, "add", "-A")
+    _git(tmp_path, "commit", "-q", "-m", "base")
+    head = _git(tmp_path, "rev-parse", "HEAD")
+    base_tree = _git(tmp_path, "rev-parse", "HEAD^{tree}")
+    (tmp_path / "app.py").write_text("DEBUG = False\n")
+    (tmp_path / "run.sh").write_text("echo bye\n")
+
+    calls: list[tuple] = []
+    monkeypatch.setenv("GITHUB_APP_ID", "1")
+    monkeypatch.setenv("GITHUB_INSTALLATION_ID", "2")
+    monkeypatch.setenv("GITHUB_PRIVATE_KEY", "key")
+    monkeypatch.setattr(git_tool, "get_installation_token", lambda config: "tok")
+    monkeypatch.setattr(git_tool, "create_tree", lambda token, repo, base, entries: calls.append(("tree", base, entries)) or "tree1")
+    monkeypatch.setattr(
+        git_tool,
+        "create_commit",
+        lambda token, repo, message, tree, parents, author=None: calls.append(("commit", tree, parents)) or "c0ffee",
+    )
+    monkeypatch.setattr(git_tool, "create_ref", lambda token, repo, branch, sha: calls.append(("ref", branch, sha)) or True)
+    monkeypatch.setattr(git_tool, "fetch_default_branch", lambda token, repo: "main")
+    monkeypatch.setattr(git_tool, "open_pull_request", lambda **kwargs: calls.append(("pr", kwargs["head"])) or "https://pr")
+    monkeypatch.setattr(git_tool, "_push_branch", lambda *args: pytest.fail("should not push"))
+
+    metadata = git_tool.create_branch_and_pr(str(tmp_path), "https://github.com/org/demo.git", [{"summary": "Fix"}])
+
+    assert metadata["commit"] == "c0ffee" and metadata["pr_url"] == "https://pr"
+    tree_call, commit_call, ref_call, pr_call = calls
+    assert tree_call[1] == base_tree
+    assert sorted((e["path"], e["mode"], e["content"]) for e in tree_call[2]) == [
+        ("app.py", "100644", "DEBUG = False\n"),
+        ("run.sh", "100755", "echo bye\n"),
+    ]
+    assert commit_call == ("commit", "tree1", [head])
+    assert ref_call == ("ref", metadata["branch"], "c0ffee")
+    assert pr_call == ("pr", metadata["branch"])
+    assert _git(tmp_path, "rev-parse", "HEAD") == head  # no local commit needed
+
+
+def test_repo_metadata_is_revalidated_with_etag_only_when_stale(monkeypatch, test_sessionmaker):
+    from datetime import datetime, timedelta
+
+    from apps.worker.tools.github_app import RepositoryInfo
+
+    session = test_sessionmaker()
+    repo = Repo(id=str(uuid.uuid4()), name="demo", url="https://github.com/org/demo.git")
+    session.add(repo)
+    session.commit()
+
+    monkeypatch.setenv("GITHUB_APP_ID", "1")
+    monkeypatch.setenv("GITHUB_INSTALLATION_ID", "2")
+    monkeypatch.setenv("GITHUB_PRIVATE_KEY", "key")
+    monkeypatch.setattr(tasks, "get_installation_token", lambda config: "tok")
+    requests_seen: list[tuple] = []
+    replies = iter([
+        RepositoryInfo(default_branch="main", full_name="org/demo", etag='"v1"'),
+        RepositoryInfo(default_branch=None, full_name="org/demo", etag='"v1"', not_modified=True),
+    ])
+
+    def fake_fetch(token, full_name, etag=None):
+        requests_seen.append((full_name, etag))
+        return next(replies)
+
+    monkeypatch.setattr(tasks, "fetch_repository", fake_fetch)
+    try:
+        tasks._refresh_repo_metadata(session, repo)
+        tasks._refresh_repo_metadata(session, repo)  # fresh: served from the row
+        repo.metadata_synced_at = datetime.utcnow() - timedelta(days=1)
+        tasks._refresh_repo_metadata(session, repo)
+
+        assert requests_seen == [("org/demo", None), ("org/demo", '"v1"')]
+        assert (repo.default_branch, repo.full_name, repo.metadata_etag) == ("main", "org/demo", '"v1"')
+        assert datetime.utcnow() - repo.metadata_synced_at < timedelta(minutes=1)
+    finally:
+        session.close()
+
+
+def test_warm_worker_recycle_policy_retires_by_job_count_or_memory(monkeypatch):
+    import sys
+
+    from apps.worker import warm_pool
+
+    assert "apps.worker.tasks" in warm_pool.preload()
+    assert "google.generativeai" in sys.modules
+    assert warm_pool.rss_bytes() > 0
+
+    monkeypatch.setattr(warm_pool, "rss_bytes", lambda: 100 * 1024 * 1024)
+    by_jobs = warm_pool.RecyclePolicy(max_jobs=3, max_rss_mb=512)
+    assert [by_jobs.record_job() for _ in range(3)] == [None, None, "3 jobs"]
+
+    by_memory = warm_pool.RecyclePolicy(max_jobs=100, max_rss_mb=64)
+    assert by_memory.record_job() == "RSS 100 MB"
+
+
+def test_prioritization_shards_large_inputs_and_reduces_shortlist(monkeypatch):
+    import json
+    import re
+
+    from apps.worker.agent import orchestrator
+
+    findings = [
+        {"finding_id": f"f{i:03d}", "severity": "LOW", "path": f"src/{i}.js", "message": "m" * 400, "sources": [{}]}
+        for i in range(40)
+    ]
+    prompts: list[str] = []
+
+    def fake_complete(prompt: str, **_kwargs) -> str:
+        if "ordered_findings" not in prompt:
+            return json.dumps({"finding_id": "x", "edits": []})
+        prompts.append(prompt)
+        limit = int(re.search(r"top (\d+) issues", prompt).group(1))
+        ids = re.findall(r'"finding_id":"(f\d+)"', prompt)
+        return json.dumps({"ordered_findings": [{"finding_id": fid} for fid in sorted(ids, reverse=True)[:limit]]})
+
+    monkeypatch.setattr(orchestrator, "gemini_complete", fake_complete)
+    monkeypatch.setenv("REMEDY_PRIORITIZE_BATCH_TOKENS", "500")
+    monkeypatch.setenv("REMEDY_PRIORITIZE_SHORTLIST", "3")
+
+    ordered = orchestrator._rank_map_reduce([orchestrator._compact_finding(f) for f in findings], limit=3)
+
+    assert [item["finding_id"] for item in ordered] == ["f039", "f038", "f037"]
+    assert len(prompts) > 2
+    assert all(orchestrator._estimate_tokens(p) < 1500 for p in prompts)
+    assert '"sources"' not in prompts[0] and "m" * 300 not in prompts[0]
+
+
+def test_rank_findings_prefers_first_party_high_severity_code():
+    from apps.worker.agent.ranking import rank_findings
+
+    findings = [
+        {"finding_id": "vendor", "severity": "CRITICAL", "path": "node_modules/lib/index.js"},
+        {"finding_id": "test", "severity": "HIGH", "path": "src/__tests__/auth.test.ts"},
+        {"finding_id": "app", "severity": "HIGH", "path": "src/auth.ts", "confidence": "HIGH"},
+        {"finding_id": "low", "severity": "LOW", "path": "src/util.ts"},
+        {"finding_id": "kev", "severity": "MEDIUM", "path": "package-lock.json", "known_exploited": True},
+    ]
+
+    ranked = rank_findings(findings)
+
+    assert [item["finding_id"] for item in ranked] == ["app", "kev", "test", "vendor", "low"]
+    assert all("priority_score" in item for item in ranked)
+    assert "priority_score" not in findings[0]
+
+
+def test_lane_subscription_weights_queue_order(monkeypatch):
+    import random
+
+    from apps.worker import lanes
+
+    assert lanes.parse_subscription("interactive:6, webhook:3,bulk:0") == {"interactive": 6, "webhook": 3}
+    assert lanes.parse_subscription("interactive") == {"interactive": 1}
+    with pytest.raises(ValueError):
+        lanes.parse_subscription("urgent:5")
+
+    rng = random.Random(7)
+    weights = lanes.parse_subscription(lanes.DEFAULT_SUBSCRIPTION)
+    first = [lanes.weighted_order(weights, rng)[0] for _ in range(5000)]
+    share = {lane: first.count(lane) / len(first) for lane in weights}
+    assert share["interactive"] == pytest.approx(0.6, abs=0.03)
+    assert share["bulk"] == pytest.approx(0.1, abs=0.03)
+
+    monkeypatch.setenv("REMEDY_WORKER_LANES", "bulk:2")
+    assert lanes.listen_queues() == ["remedy-bulk", "remedy"]
+
+
+def test_lane_dispatch_tops_queue_up_to_depth(monkeypatch):
+    from types import SimpleNamespace
+
+    from rq.exceptions import NoSuchJobError
+    from rq.job import Job
+
+    from apps.api.services.scan_lanes import LaneScheduler
+
+    parked = ["gone", "a1", "b1", "a2"]
+    ready: list[str] = []
+
+    class FakeQueue:
+        @property
+        def count(self) -> int:
+            return len(ready)
+
+        def enqueue_job(self, job) -> None:
+            ready.append(job.id)
+
+    def fetch(job_id, connection=None):
+        if job_id == "gone":
+            raise NoSuchJobError(job_id)
+        return SimpleNamespace(id=job_id)
+
+    scheduler = LaneScheduler(connection=None)
+    monkeypatch.setattr(scheduler, "queue", lambda _lane: FakeQueue())
+    monkeypatch.setattr(scheduler, "_next", lambda _lane: parked.pop(0) if parked else None)
+    monkeypatch.setattr(Job, "fetch", staticmethod(fetch))
+    monkeypatch.setenv("REMEDY_LANE_DISPATCH_DEPTH", "2")
+
+    assert scheduler.dispatch("bulk") == 2
+    assert ready == ["a1", "b1"] and parked == ["a2"]
+    assert scheduler.dispatch("bulk") == 0
+
+    ready.pop(0)
+    assert scheduler.dispatch("bulk") == 1
+    assert ready == ["b1", "a2"]
+
+
+def test_lane_scripts_round_robin_tenants_then_repos(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+
+    from apps.api.services.scan_lanes import LaneScheduler
+
+    redis = fakeredis.FakeRedis()
+    scheduler = LaneScheduler(redis)
+    parked = [
+        ("org-a", "a1", "j1"),
+        ("org-a", "a1", "j2"),
+        ("org-a", "a1", "j3"),
+        ("org-a", "a2", "k1"),
+        ("org-b", "b1", "m1"),
+        ("org-b", "b1", "m2"),
+    ]
+    for tenant, repo, job_id in parked:
+        scheduler._park("bulk", tenant, repo, job_id)
+
+    order = []
+    while (job_id := scheduler._next("bulk")) is not None:
+        order.append(job_id)
+
+    # Tenants alternate while both have work; repos rotate within a tenant.
+    assert order == ["j1", "m1", "k1", "m2", "j2", "j3"]
+    assert redis.keys("remedy:lanes:*") == []
+
+    # End to end: only the dispatch depth reaches the RQ queue; the rest stay parked fairly.
+    monkeypatch.setenv("REMEDY_LANE_DISPATCH_DEPTH", "not-a-number")  # falls back to 2
+
+    def submit(tenant, repo):
+        return scheduler.submit("bulk", "apps.worker.tasks.run_multi_scan", args=(repo, ["sast"]), tenant=tenant, repo=repo)
+
+    ready = [submit("org-c", "c1"), submit("org-c", "c1")]
+    org_a = [submit("org-a", "a1") for _ in range(3)]
+    org_b = submit("org-b", "b1")
+    queue = scheduler.queue("bulk")
+    assert queue.job_ids == [job.id for job in ready]
+
+    served = []
+    for _ in range(3):
+        served.append(queue.pop_job_id())
+        assert scheduler.dispatch("bulk") == 1
+    assert served == [ready[0].id, ready[1].id, org_a[0].id]
+    assert queue.job_ids == [org_b.id, org_a[1].id]